@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     generate_data.py
+# Purpose:  generate synthetic MetaGaia inputs at any scale, with the same schemas
+#           as the files in data/example_input_files, for benchmarking.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+"""Generate synthetic MetaGaia inputs at a configurable scale.
+
+The directory written contains, with the schemas of data/example_input_files:
+reads_file.tsv, mapping_file.tsv, binsize_file.tsv and depth_file.tsv (bin_abundance),
+imganno.tsv (metabolic_profile), complete_metabolic_profile.tsv (amg_hostvi,
+pathway_extraction), gff/*.gff, gff_paths.txt and img_bin_map.tsv (gff3_img5),
+crt.txt (spacer_extract_crt), vibrant/VIBRANT_AMG_individuals_*.tsv (amg_hostvi)
+and taxonomy_info.tsv and sample2site.tsv (bin_abundance_viz).
+"""
+
+import argparse
+import numpy as np
+import os
+import pandas as pd
+
+
+#Fraction of contigs in a bin and of genes annotated by each database, as in the example files
+BINNED_FRACTION = 0.6
+ANNOTATED_FRACTION = {'COG_ID': 0.65, 'PFAM_ID': 0.65, 'KO_Term': 0.43, 'EC_Number': 0.22}
+#Size of the pool of values of each database
+POOL_SIZE = {'COG_ID': 5000, 'PFAM_ID': 18000, 'KO_Term': 25000, 'EC_Number': 8000}
+TAXA = ['Pacearchaeota', 'Thaumarchaeota_Nitrosopumilus', 'Woesearchaeota', 'Bathyarchaeota',
+        'Proteobacteria', 'Chloroflexi', 'Planctomycetes', 'Bacteroidetes', 'Nitrospirae',
+        'Actinobacteria', 'Acidobacteria', 'Verrucomicrobia', 'Lokiarchaeota', 'Unknown_bacterium']
+IMGANNO_COLUMNS = ['Original_Contig_Name', 'IMG_Contig_Name', 'Locus_Tag', 'IMG_Gene_ID', 'Gene_Type',
+                   'Gene_Start', 'Gene_Stop', 'Gene_Length', 'Homolog_Gene_ID', 'Homolog_Taxon_ID',
+                   'Lineage_%ID', 'Lineage', 'Product', 'Source', 'COG_ID', 'Cog_%ID', 'PFAM_ID',
+                   'KO_Term', 'KO_Term.1', 'KO_%ID', 'EC_Number', 'Bin', 'GC', 'Length', 'Depth',
+                   'Bin_scaffold_name', 'Abun_bin']
+
+
+def format_ids(prefix, values, width=0):
+    """
+    Formats integer IDs as strings.
+    Input(s):
+    prefix is a string added before each ID.
+    values is a numpy array of integers.
+    width is the number of digits the IDs are padded to with zeros.
+    Output(s):
+    A pandas series of strings.
+    """
+
+    return prefix + pd.Series(values).astype(str).str.zfill(width)
+
+
+def popular_values(rng, pool_size, size):
+    """
+    Draws values from a pool where a few values are much more common than the rest, as database annotations are.
+    Input(s):
+    rng is a numpy random generator.
+    pool_size is the number of different values.
+    size is the number of values drawn.
+    Output(s):
+    A numpy array of integers between 0 and pool_size - 1.
+    """
+
+    return (pool_size * rng.random(size) ** 2).astype(np.int64)
+
+
+def random_sequences(rng, lengths):
+    """
+    Creates random DNA sequences.
+    Input(s):
+    rng is a numpy random generator.
+    lengths is a numpy array with the length of each sequence.
+    Output(s):
+    A list of strings.
+    """
+
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)[rng.integers(0, 4, int(lengths.sum()))].tobytes().decode()
+    ends = np.cumsum(lengths)
+
+    return [bases[end - length:end] for end, length in zip(ends, lengths)]
+
+
+class Community():
+    """
+    This class holds the synthetic bins, contigs and samples shared by all the generated files.
+    Input(s):
+    bins is the number of bins.
+    samples is the number of samples.
+    contigs is the number of contigs, binned or not.
+    seed is the seed of the random generator.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, bins, samples, contigs, seed=0):
+
+        self.rng = np.random.default_rng(seed)
+        rng = self.rng
+
+        #Sampling sites, each with its own IMG analysis ID
+        n_sites = max(1, bins // 10)
+        self.sites = np.array(['S{}{}'.format(i // 3 + 1, 'ABC'[i % 3]) for i in range(n_sites)], dtype=object)
+        self.gold_oids = np.array(['Ga{}'.format(224500 + i) for i in range(n_sites)], dtype=object)
+
+        #Bins, named after their site so the host sample can be parsed from them
+        self.bin_site = np.arange(bins) % n_sites
+        self.bins = (self.sites[self.bin_site] + '_Bin' + np.arange(bins).astype(str)).astype(object)
+
+        #Contigs, of which BINNED_FRACTION are in a bin
+        self.contig_bin = np.where(rng.random(contigs) < BINNED_FRACTION, rng.integers(0, bins, contigs), -1)
+        self.contig_site = np.where(self.contig_bin >= 0, self.bin_site[np.maximum(self.contig_bin, 0)], rng.integers(0, n_sites, contigs))
+        self.contig_length = np.maximum(1000, rng.lognormal(np.log(4000), 0.6, contigs)).astype(np.int64)
+        numbers = np.arange(contigs)
+        self.contig_names = (self.sites[self.contig_site] + format_ids('_scaffold_', numbers).to_numpy() + '_c1').astype(object)
+        self.img_contigs = (self.gold_oids[self.contig_site] + format_ids('_', numbers + 10000001).to_numpy()).astype(object)
+
+        #Samples and the abundance of each bin in them
+        self.samples = format_ids('SF_', np.arange(samples)).to_numpy().astype(object)
+        self.bin_depth = rng.lognormal(0, 1.5, (bins, samples))
+
+    def write_abundance_inputs(self, out_dir):
+        """
+        Writes the inputs of bin_abundance.py.
+        Input(s):
+        out_dir is a string containing the path to the output directory.
+        Output(s):
+        None.
+        """
+
+        rng = self.rng
+        binned = self.contig_bin >= 0
+
+        reads_df = pd.DataFrame({'Sample': self.samples, 'Reads': rng.integers(50000000, 200000000, len(self.samples))})
+        reads_df.to_csv(os.path.join(out_dir, 'reads_file.tsv'), sep='\t', index=False)
+
+        mapping_df = pd.DataFrame({'Original_Contig_Name': self.contig_names[binned],
+                                   'Bin': self.bins[self.contig_bin[binned]],
+                                   'Sampling_Site': self.sites[self.contig_site[binned]]})
+        mapping_df.to_csv(os.path.join(out_dir, 'mapping_file.tsv'), sep='\t', index=False)
+
+        size = np.bincount(self.contig_bin[binned], weights=self.contig_length[binned], minlength=len(self.bins))
+        binsize_df = pd.DataFrame({'Bin': self.bins, 'Size': size.astype(np.int64)})
+        binsize_df.to_csv(os.path.join(out_dir, 'binsize_file.tsv'), sep='\t', index=False)
+
+        #One row per contig and sample, written one sample at a time
+        depth_path = os.path.join(out_dir, 'depth_file.tsv')
+        for m, sample in enumerate(self.samples):
+            depth = np.where(binned, self.bin_depth[np.maximum(self.contig_bin, 0), m], rng.lognormal(0, 1.5, len(binned)))
+            depth = np.round(depth * rng.lognormal(0, 0.3, len(binned)), 5)
+            depth_df = pd.DataFrame({'Original_Contig_Name': self.contig_names,
+                                     'contigLen': self.contig_length.astype(float),
+                                     'Sample': sample,
+                                     'Depth': depth})
+            depth_df.to_csv(depth_path, sep='\t', index=False, mode='w' if m == 0 else 'a', header=m == 0)
+
+    def annotate_genes(self, genes):
+        """
+        Places genes on the contigs and annotates them with each database.
+        Input(s):
+        genes is the number of genes.
+        Output(s):
+        A pandas dataframe with the columns of an IMG annotation file.
+        """
+
+        rng = self.rng
+        gene_contig = np.sort(rng.integers(0, len(self.contig_names), genes))
+        #Number of each gene within its contig
+        first = np.searchsorted(gene_contig, gene_contig, side='left')
+        gene_number = np.arange(genes) - first + 1
+        gene_length = rng.integers(100, 1000, genes)
+        gene_start = gene_number * 1000 - 997
+        img_contig = pd.Series(self.img_contigs[gene_contig])
+
+        img_df = pd.DataFrame({'Original_Contig_Name': self.contig_names[gene_contig],
+                               'IMG_Contig_Name': img_contig,
+                               'Locus_Tag': img_contig + pd.Series(gene_number).astype(str),
+                               'IMG_Gene_ID': img_contig + '.' + pd.Series(gene_number).astype(str),
+                               'Gene_Type': 'CDS',
+                               'Gene_Start': gene_start,
+                               'Gene_Stop': gene_start + gene_length,
+                               'Gene_Length': gene_length})
+
+        formats = {'COG_ID': ('COG', 4), 'PFAM_ID': ('pfam', 5), 'KO_Term': ('KO:K', 5)}
+        for column, (prefix, width) in formats.items():
+            values = format_ids(prefix, popular_values(rng, POOL_SIZE[column], genes), width)
+            img_df[column] = values.where(rng.random(genes) < ANNOTATED_FRACTION[column])
+        ec = popular_values(rng, POOL_SIZE['EC_Number'], genes)
+        ec_values = 'EC:' + pd.Series(ec % 7 + 1).astype(str) + '.' + pd.Series(ec // 7 % 20 + 1).astype(str) + '.' + pd.Series(ec // 140 % 10 + 1).astype(str) + '.' + pd.Series(ec // 1400 + 1).astype(str)
+        img_df['EC_Number'] = ec_values.where(rng.random(genes) < ANNOTATED_FRACTION['EC_Number'])
+
+        annotated = img_df['COG_ID'].notna() | img_df['PFAM_ID'].notna()
+        img_df['Homolog_Gene_ID'] = np.where(annotated, rng.integers(2500000000, 2800000000, genes).astype(float), np.nan)
+        img_df['Homolog_Taxon_ID'] = np.where(annotated, rng.integers(2500000000, 2800000000, genes).astype(float), np.nan)
+        img_df['Lineage_%ID'] = np.where(annotated, np.round(rng.uniform(25, 100, genes), 2), np.nan)
+        img_df['Lineage'] = pd.Series(np.where(annotated, 'Bacteria;Proteobacteria', None))
+        img_df['Product'] = np.where(annotated, 'protein', 'hypothetical_protein')
+        img_df['Source'] = np.where(annotated, img_df['PFAM_ID'].fillna(img_df['COG_ID']), 'Hypo-rule_applied')
+        img_df['Cog_%ID'] = np.where(img_df['COG_ID'].notna(), np.round(rng.uniform(25, 100, genes), 2), np.nan)
+        img_df['KO_Term.1'] = img_df['KO_Term']
+        img_df['KO_%ID'] = np.where(img_df['KO_Term'].notna(), np.round(rng.uniform(25, 100, genes), 2), np.nan)
+
+        contig_bin = self.contig_bin[gene_contig]
+        img_df['Bin'] = pd.Series(self.bins[np.maximum(contig_bin, 0)]).where(contig_bin >= 0)
+        img_df['GC'] = np.round(rng.uniform(0.3, 0.7, genes), 3)
+        img_df['Length'] = self.contig_length[gene_contig]
+        img_df['Depth'] = np.round(rng.lognormal(2, 1, genes), 4)
+        img_df['Bin_scaffold_name'] = img_df['Bin'] + '_' + img_df['Original_Contig_Name']
+        img_df['Abun_bin'] = rng.lognormal(-12, 1, genes)
+
+        return img_df[IMGANNO_COLUMNS]
+
+    def write_annotation_inputs(self, out_dir, genes):
+        """
+        Writes the inputs of metabolic_profile.py and gff3_img5.py.
+        Input(s):
+        out_dir is a string containing the path to the output directory.
+        genes is the number of genes.
+        Output(s):
+        None.
+        """
+
+        img_df = self.annotate_genes(genes)
+        img_df.to_csv(os.path.join(out_dir, 'imganno.tsv'), sep='\t', index=True)
+
+        #One GFF3 file per IMG analysis
+        gff_dir = os.path.join(out_dir, 'gff')
+        if not os.path.exists(gff_dir):
+            os.makedirs(gff_dir)
+        attributes = 'ID=' + img_df['IMG_Gene_ID'] + ';locus_tag=' + img_df['Locus_Tag'] + ';product=' + img_df['Product']
+        for column, key in [('KO_Term', 'ko'), ('COG_ID', 'cog'), ('PFAM_ID', 'pfam'), ('EC_Number', 'ec_number')]:
+            attributes = attributes + (';' + key + '=' + img_df[column]).fillna('')
+        gff_df = pd.DataFrame({'seqid': img_df['IMG_Contig_Name'], 'source': 'img_core_v400', 'type': img_df['Gene_Type'],
+                               'start': img_df['Gene_Start'], 'end': img_df['Gene_Stop'], 'score': '.',
+                               'strand': np.where(self.rng.random(len(img_df)) < 0.5, '+', '-'), 'phase': 0,
+                               'attributes': attributes})
+        gold_oid = img_df['IMG_Contig_Name'].str.split('_').str[0]
+        gff_paths = []
+        for oid in self.gold_oids:
+            gff_path = os.path.abspath(os.path.join(gff_dir, oid + '.gff'))
+            with open(gff_path, 'w') as handle:
+                handle.write('##gff-version 3\n')
+                gff_df[gold_oid == oid].to_csv(handle, sep='\t', index=False, header=False)
+            gff_paths.append(gff_path)
+        with open(os.path.join(out_dir, 'gff_paths.txt'), 'w') as handle:
+            handle.write('\n'.join(gff_paths) + '\n')
+
+        #Map generated by img_bin_map.py
+        binned = self.contig_bin >= 0
+        img_map_df = pd.DataFrame({'Original_Contig_Name': self.contig_names[binned],
+                                   'IMG_Contig_Name': self.img_contigs[binned],
+                                   'GOLD_OID': self.gold_oids[self.contig_site[binned]],
+                                   'Sampling_Site': self.sites[self.contig_site[binned]],
+                                   'Bin': self.bins[self.contig_bin[binned]]})
+        img_map_df.sort_values('Bin').to_csv(os.path.join(out_dir, 'img_bin_map.tsv'), sep='\t', index=False)
+
+    def write_profile(self, out_dir):
+        """
+        Writes a metabolic profile with the layout of the complete_metabolic_profile.tsv file of metabolic_profile.py.
+        Input(s):
+        out_dir is a string containing the path to the output directory.
+        Output(s):
+        None.
+        """
+
+        rng = self.rng
+        databases = [('KEGG', 'KO:K', 5, 'KO_Term'), ('COG', 'COG', 4, 'COG_ID'), ('PFAM', 'pfam', 5, 'PFAM_ID')]
+        dfs_list = []
+        for database, prefix, width, column in databases:
+            pathways = np.unique(popular_values(rng, POOL_SIZE[column], POOL_SIZE[column] // 2))
+            counts = rng.poisson(0.3, (len(pathways), len(self.bins) + 1)).astype(float)
+            count_df = pd.DataFrame(counts, columns=list(self.bins) + ['NoBin'])
+            count_df['Total'] = counts.sum(axis=1)
+            count_df.insert(0, database, format_ids(prefix, pathways, width))
+            dfs_list.append(count_df)
+        profile_df = pd.concat(dfs_list)
+        profile_df.insert(3, 'EC_NUMBER', np.nan)
+        columns = ['KEGG', 'COG', 'PFAM', 'EC_NUMBER']
+        profile_df = profile_df[columns + [c for c in profile_df.columns if c not in columns]]
+        profile_df.to_csv(os.path.join(out_dir, 'complete_metabolic_profile.tsv'), sep='\t', index=False)
+
+    def write_crt(self, out_dir, crisprs):
+        """
+        Writes CRISPR Recognition Tool output from IMG, one line per repeat.
+        Input(s):
+        out_dir is a string containing the path to the output directory.
+        crisprs is the number of CRISPR arrays.
+        Output(s):
+        None.
+        """
+
+        rng = self.rng
+        array_contig = np.sort(rng.integers(0, len(self.img_contigs), crisprs))
+        #Some arrays are too short or have too few repeats to pass the quality filter
+        n_repeats = rng.integers(2, 16, crisprs)
+        repeat_length = np.where(rng.random(crisprs) < 0.1, rng.integers(5, 11, crisprs), rng.integers(23, 48, crisprs))
+        repeats = random_sequences(rng, repeat_length)
+        spacer_length = np.where(rng.random(int(n_repeats.sum())) < 0.05, rng.integers(10, 23, int(n_repeats.sum())), rng.integers(26, 41, int(n_repeats.sum())))
+        spacers = random_sequences(rng, spacer_length)
+
+        lines = []
+        s = 0
+        crispr_no = 0
+        for a in range(crisprs):
+            crispr_no = crispr_no + 1 if a > 0 and array_contig[a] == array_contig[a - 1] else 1
+            contig = self.img_contigs[array_contig[a]]
+            for r in range(n_repeats[a]):
+                #The last repeat of an array has no spacer
+                spacer = spacers[s] if r < n_repeats[a] - 1 else 'c'
+                lines.append('{}\t{}\t{}\t{}\t{}\n'.format(contig, crispr_no, 100 + r * 70, repeats[a], spacer))
+                s += 1
+        with open(os.path.join(out_dir, 'crt.txt'), 'w') as handle:
+            handle.writelines(lines)
+
+    def write_vibrant(self, out_dir, amgs):
+        """
+        Writes VIBRANT AMG tables, one per sampling site.
+        Input(s):
+        out_dir is a string containing the path to the output directory.
+        amgs is the number of AMG rows across all the tables.
+        Output(s):
+        None.
+        """
+
+        rng = self.rng
+        vibrant_dir = os.path.join(out_dir, 'vibrant')
+        if not os.path.exists(vibrant_dir):
+            os.makedirs(vibrant_dir)
+        amg_site = rng.integers(0, len(self.sites), amgs)
+        ko = popular_values(rng, POOL_SIZE['KO_Term'], amgs)
+        pfam = popular_values(rng, POOL_SIZE['PFAM_ID'], amgs)
+        vibrant_df = pd.DataFrame({'protein': format_ids('phage_protein_', np.arange(amgs)),
+                                   'scaffold': format_ids('scaffold_', rng.integers(0, max(1, amgs // 4), amgs)) + '_c1',
+                                   'AMG KO': format_ids('K', ko, 5),
+                                   'AMG KO name': 'AMG',
+                                   'Pfam': format_ids('PF', pfam, 5),
+                                   'Pfam name': 'domain'})
+        for i, site in enumerate(self.sites):
+            vibrant_df[amg_site == i].to_csv(os.path.join(vibrant_dir, 'VIBRANT_AMG_individuals_{}_scaffolds.tsv'.format(site)), sep='\t', index=False)
+
+    def write_viz_inputs(self, out_dir):
+        """
+        Writes the taxonomy and sample to site files of bin_abundance_viz.py.
+        Input(s):
+        out_dir is a string containing the path to the output directory.
+        Output(s):
+        None.
+        """
+
+        #Sites are named since bin_abundance_viz.py sorts them together with the Taxa column
+        taxa = np.array(TAXA, dtype=object)[self.rng.integers(0, len(TAXA), len(self.bins))]
+        pd.DataFrame({'Bin': self.bins, 'Taxa': taxa}).to_csv(os.path.join(out_dir, 'taxonomy_info.tsv'), sep='\t', index=False)
+        pd.DataFrame({'Sample': self.samples, 'Site': format_ids('Site', np.arange(len(self.samples)), 2)}).to_csv(os.path.join(out_dir, 'sample2site.tsv'), sep='\t', index=False)
+
+
+def generate(out_dir, bins=50, samples=10, contigs=10000, genes=50000, crisprs=500, amgs=1000, seed=0):
+    """
+    Generates every synthetic input file.
+    Input(s):
+    out_dir is a string containing the path to the output directory.
+    bins, samples, contigs, genes, crisprs and amgs are the number of each item to generate.
+    seed is the seed of the random generator.
+    Output(s):
+    None.
+    """
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    community = Community(bins, samples, contigs, seed)
+    community.write_abundance_inputs(out_dir)
+    community.write_annotation_inputs(out_dir, genes)
+    community.write_profile(out_dir)
+    community.write_crt(out_dir, crisprs)
+    community.write_vibrant(out_dir, amgs)
+    community.write_viz_inputs(out_dir)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--out_dir', required=True, type=str, help='Directory the synthetic files are written to.')
+    parser.add_argument('-b', '--bins', required=False, type=int, default=50, help='Number of bins [50].')
+    parser.add_argument('-s', '--samples', required=False, type=int, default=10, help='Number of samples [10].')
+    parser.add_argument('-c', '--contigs', required=False, type=int, default=10000, help='Number of contigs, of which 60%% are binned [10000].')
+    parser.add_argument('-g', '--genes', required=False, type=int, default=50000, help='Number of annotated genes [50000].')
+    parser.add_argument('-r', '--crisprs', required=False, type=int, default=500, help='Number of CRISPR arrays in the CRT file [500].')
+    parser.add_argument('-v', '--amgs', required=False, type=int, default=1000, help='Number of rows in the VIBRANT AMG tables [1000].')
+    parser.add_argument('--seed', required=False, type=int, default=0, help='Seed of the random generator [0].')
+    args = parser.parse_args()
+
+    generate(args.out_dir, args.bins, args.samples, args.contigs, args.genes, args.crisprs, args.amgs, args.seed)
+    print("Synthetic inputs have been saved in " + args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
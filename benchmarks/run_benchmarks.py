@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     run_benchmarks.py
+# Purpose:  time and memory-profile every MetaGaia stage on synthetic inputs of
+#           increasing size and save the results as json and csv.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+"""Benchmark every MetaGaia stage on synthetic inputs at several scales.
+
+Each benchmark runs in its own process so its memory use is not inflated by the
+previous ones. The inputs are read before the clock starts, so only the stage
+itself is timed, except for the reading functions and the chunked bin abundance,
+whose point is to read. The results are saved in a json file and in a csv file
+named after the current commit, so runs of different versions can be compared,
+e.g. with --baseline.
+
+Memory is reported as the peak of the allocations traced by tracemalloc during
+the stage (memory allocated outside Python's allocators, e.g. by pyarrow, is not
+traced) and as the maximum resident set size of the process after reading the
+inputs (setup_rss_mb) and at the end (max_rss_mb).
+"""
+
+import argparse
+import contextlib
+import copy
+import csv
+import datetime
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import generate_data
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARK_DIR, '..', 'src')
+for directory in ['abundance', 'metabolism', 'host-virus', '']:
+    sys.path.insert(0, os.path.join(SRC_DIR, directory))
+
+#Number of items generated at each scale
+SCALES = {'small': {'bins': 20, 'samples': 5, 'contigs': 2000, 'genes': 10000, 'crisprs': 200, 'amgs': 500},
+          'medium': {'bins': 100, 'samples': 20, 'contigs': 20000, 'genes': 100000, 'crisprs': 2000, 'amgs': 5000},
+          'large': {'bins': 500, 'samples': 50, 'contigs': 100000, 'genes': 1000000, 'crisprs': 20000, 'amgs': 50000}}
+DATABASES = ['KEGG', 'COG', 'PFAM', 'EC_NUMBER']
+GFF_FIELDS = ['ID', 'ko', 'pfam', 'ec_number', 'cog', 'locus_tag']
+RESULT_FIELDS = ['scale', 'benchmark', 'status', 'rows_in', 'rows_out', 'repeat', 'wall_min_s', 'wall_mean_s',
+                 'cpu_min_s', 'peak_traced_mb', 'setup_rss_mb', 'max_rss_mb']
+
+
+#------------------------------------------------------------------------------
+#Each setup function reads the inputs of one benchmark and returns the timed function, its arguments and the number of input rows
+
+def setup_bin_abundance(data_dir):
+    import bin_abundance
+    from utils import table_io
+    tables = [table_io.read_table(os.path.join(data_dir, f + '.tsv')) for f in ['reads_file', 'mapping_file', 'depth_file', 'binsize_file']]
+    return bin_abundance.calculate_abundance, tables + [100000000], len(tables[2])
+
+
+def setup_bin_abundance_chunked(data_dir):
+    import bin_abundance
+    from utils import table_io
+    tables = [table_io.read_table(os.path.join(data_dir, f + '.tsv')) for f in ['reads_file', 'mapping_file', 'binsize_file']]
+    depth = os.path.join(data_dir, 'depth_file.tsv')
+    return bin_abundance.calculate_abundance_chunked, tables[:2] + [depth, tables[2], 100000000, 1000000], None
+
+
+def setup_scaffold_databases(data_dir):
+    import metabolic_profile
+    from utils import table_io
+    img_df = table_io.read_table(os.path.join(data_dir, 'imganno.tsv'))
+    mapping_df = table_io.read_table(os.path.join(data_dir, 'mapping_file.tsv'))
+    return metabolic_profile.scaffold_databases, [img_df, mapping_df], len(img_df)
+
+
+def setup_database_counts(data_dir):
+    import metabolic_profile
+    function, args, rows_in = setup_scaffold_databases(data_dir)
+    databases_df = function(*args)
+    #get_database_counts is count_databases followed by writing the profile
+    return metabolic_profile.count_databases, [DATABASES, databases_df], len(databases_df)
+
+
+def setup_gff(data_dir):
+    import gff3_img5
+    path_file = os.path.join(data_dir, 'gff_paths.txt')
+    return gff3_img5.gff_pd_multiread, [path_file, GFF_FIELDS], None
+
+
+def setup_read_vibrant(data_dir):
+    import amg_hostvi
+    return amg_hostvi.read_vibrant, [None, os.path.join(data_dir, 'vibrant')], None
+
+
+def setup_compare_metabolism(data_dir):
+    import amg_hostvi
+    from utils import table_io
+    host_df = table_io.read_table(os.path.join(data_dir, 'complete_metabolic_profile.tsv'))
+    phage_df = amg_hostvi.read_vibrant(vibrant_path=os.path.join(data_dir, 'vibrant'))
+    return amg_hostvi.compare_metabolism, [host_df, phage_df, 'KEGG'], len(host_df) + len(phage_df)
+
+
+def setup_read_crt(data_dir):
+    import spacer_extract_crt
+    return spacer_extract_crt.read_crt, [os.path.join(data_dir, 'crt.txt')], None
+
+
+def viz_inputs(data_dir):
+    import bin_abundance_viz
+    from utils import table_io
+    function, args, rows_in = setup_bin_abundance(data_dir)
+    arguments = bin_abundance_viz.Command_line_args(['-b', 'bin_abundance.tsv', '-t', 'taxonomy_info.tsv', '-s', os.path.join(data_dir, 'sample2site.tsv'), '-p', '10'])
+    taxonomy_df = table_io.read_table(os.path.join(data_dir, 'taxonomy_info.tsv'))
+    return arguments, function(*args), taxonomy_df
+
+
+def setup_format_dataframe(data_dir):
+    import bin_abundance_viz
+    arguments, abundance_df, taxonomy_df = viz_inputs(data_dir)
+    return bin_abundance_viz.format_dataframe, [arguments, abundance_df, taxonomy_df], len(abundance_df)
+
+
+def setup_filter_top_sites(data_dir):
+    import bin_abundance_viz
+    arguments, abundance_df, taxonomy_df = viz_inputs(data_dir)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        formatted_df = bin_abundance_viz.format_dataframe(arguments, abundance_df, taxonomy_df)
+    return bin_abundance_viz.filter_top_sites, [arguments, formatted_df], len(formatted_df)
+
+
+BENCHMARKS = {'bin_abundance.calculate_abundance': setup_bin_abundance,
+              'bin_abundance.calculate_abundance_chunked': setup_bin_abundance_chunked,
+              'metabolic_profile.scaffold_databases': setup_scaffold_databases,
+              'metabolic_profile.count_databases': setup_database_counts,
+              'gff3_img5.gff_pd_multiread': setup_gff,
+              'amg_hostvi.read_vibrant': setup_read_vibrant,
+              'amg_hostvi.compare_metabolism': setup_compare_metabolism,
+              'spacer_extract_crt.read_crt': setup_read_crt,
+              'bin_abundance_viz.format_dataframe': setup_format_dataframe,
+              'bin_abundance_viz.filter_top_sites': setup_filter_top_sites}
+
+
+#------------------------------------------------------------------------------
+def count_rows(result):
+    """
+    Counts the rows returned by a benchmarked function.
+    Input(s):
+    result is what the function returned: a dataframe, a dictionary or a list of them.
+    Output(s):
+    An integer, or None if the result has no length.
+    """
+
+    if isinstance(result, (list, tuple)):
+        return sum([count_rows(r) or 0 for r in result])
+    if hasattr(result, '__len__'):
+        return len(result)
+    return None
+
+
+def measure(name, data_dir, repeat, queue):
+    """
+    Runs one benchmark in the current process and puts its measurements in a queue.
+    Input(s):
+    name is a key of BENCHMARKS.
+    data_dir is a string containing the path to the synthetic inputs.
+    repeat is the number of timed runs.
+    queue is a multiprocessing queue.
+    Output(s):
+    None.
+    """
+
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            function, args, rows_in = BENCHMARKS[name](data_dir)
+            setup_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            walls = []
+            cpus = []
+            for r in range(repeat):
+                #The functions may modify the dataframes they are given
+                run_args = copy.deepcopy(args)
+                gc.collect()
+                wall = time.perf_counter()
+                cpu = time.process_time()
+                result = function(*run_args)
+                cpus.append(time.process_time() - cpu)
+                walls.append(time.perf_counter() - wall)
+                rows_out = count_rows(result)
+                del result
+
+            #Allocations are traced in a separate run since tracing slows the function down
+            run_args = copy.deepcopy(args)
+            gc.collect()
+            tracemalloc.start()
+            function(*run_args)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        queue.put({'status': 'ok', 'rows_in': rows_in, 'rows_out': rows_out, 'repeat': repeat,
+                   'wall_min_s': min(walls), 'wall_mean_s': sum(walls) / len(walls), 'cpu_min_s': min(cpus),
+                   'peak_traced_mb': peak / 1e6, 'setup_rss_mb': setup_rss / 1e3,
+                   'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3})
+    except Exception as e:
+        queue.put({'status': 'error: {}: {}'.format(type(e).__name__, e)})
+
+
+def run_benchmark(name, data_dir, repeat=3, timeout=None):
+    """
+    Runs one benchmark in a new process.
+    Input(s):
+    name is a key of BENCHMARKS.
+    data_dir is a string containing the path to the synthetic inputs.
+    repeat is the number of timed runs.
+    timeout is the number of seconds after which the benchmark is stopped, or None.
+    Output(s):
+    A dictionary of measurements.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(name, data_dir, repeat, queue))
+    process.start()
+    try:
+        result = queue.get(timeout=timeout)
+    except Exception:
+        result = {'status': 'timeout after {} s'.format(timeout)}
+        process.terminate()
+    process.join()
+
+    return result
+
+
+def version_info():
+    """
+    Describes the code and the environment being benchmarked.
+    Input(s):
+    No other inputs needed.
+    Output(s):
+    A dictionary.
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    def git(*args):
+        try:
+            return subprocess.check_output(['git'] + list(args), cwd=BENCHMARK_DIR, stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return 'unknown'
+
+    return {'commit': git('rev-parse', 'HEAD'),
+            'describe': git('describe', '--always', '--dirty'),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def compare_results(results, baseline_file):
+    """
+    Prints how much slower or faster each benchmark is than in a previous run.
+    Input(s):
+    results is a list of dictionaries of measurements.
+    baseline_file is a string containing the path to a json file saved by a previous run.
+    Output(s):
+    None.
+    """
+
+    with open(baseline_file) as handle:
+        baseline = json.load(handle)
+    previous = dict([((r['scale'], r['benchmark']), r) for r in baseline['results'] if r['status'] == 'ok'])
+
+    print('\nCompared to {} ({}):'.format(baseline_file, baseline['version']['describe']))
+    for r in results:
+        old = previous.get((r['scale'], r['benchmark']))
+        if old is None or r['status'] != 'ok':
+            continue
+        ratio = r['wall_min_s'] / old['wall_min_s'] if old['wall_min_s'] > 0 else float('nan')
+        print('{:<8} {:<45} {:>8.3f} s -> {:>8.3f} s  ({:.2f}x)'.format(r['scale'], r['benchmark'], old['wall_min_s'], r['wall_min_s'], ratio))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scales', required=False, type=str, default='small,medium', help='Comma-separated scales to run, from {} [small,medium].'.format(', '.join(SCALES)))
+    parser.add_argument('-b', '--benchmarks', required=False, type=str, default='', help='Comma-separated benchmarks to run. All are run if empty [""].')
+    parser.add_argument('-r', '--repeat', required=False, type=int, default=3, help='Number of timed runs of each benchmark [3].')
+    parser.add_argument('-t', '--timeout', required=False, type=float, default=None, help='Seconds after which a benchmark is stopped [None].')
+    parser.add_argument('-d', '--data_dir', required=False, type=str, default=os.path.join(BENCHMARK_DIR, 'data'), help='Directory the synthetic inputs are generated in, one subdirectory per scale [benchmarks/data].')
+    parser.add_argument('-o', '--out_dir', required=False, type=str, default=os.path.join(BENCHMARK_DIR, 'results'), help='Directory the results are saved in [benchmarks/results].')
+    parser.add_argument('--baseline', required=False, type=str, default='', help='json results of a previous run to compare with [""].')
+    parser.add_argument('--list', action='store_true', help='List the benchmarks and quit.')
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return
+
+    scales = args.scales.split(',')
+    names = args.benchmarks.split(',') if args.benchmarks else list(BENCHMARKS)
+    for check in scales:
+        if check not in SCALES:
+            parser.error('unknown scale {}'.format(check))
+    for check in names:
+        if check not in BENCHMARKS:
+            parser.error('unknown benchmark {}, see --list'.format(check))
+
+    version = version_info()
+    results = []
+    for scale in scales:
+        data_dir = os.path.join(args.data_dir, scale)
+        #Inputs are only generated once per scale, since they are the same for every version
+        if not os.path.exists(os.path.join(data_dir, 'crt.txt')):
+            print('Generating the {} inputs in {}.'.format(scale, data_dir))
+            generate_data.generate(data_dir, **SCALES[scale])
+        for name in names:
+            result = {'scale': scale, 'benchmark': name}
+            result.update(run_benchmark(name, data_dir, args.repeat, args.timeout))
+            results.append(result)
+            if result['status'] == 'ok':
+                print('{:<8} {:<45} {:>8.3f} s  {:>9.1f} MB'.format(scale, name, result['wall_min_s'], result['peak_traced_mb']))
+            else:
+                print('{:<8} {:<45} {}'.format(scale, name, result['status']))
+
+    if not os.path.exists(args.out_dir):
+        os.makedirs(args.out_dir)
+    out_name = os.path.join(args.out_dir, 'benchmark_{}_{}'.format(version['describe'], version['date'].replace(':', '')))
+    with open(out_name + '.json', 'w') as handle:
+        json.dump({'version': version, 'scales': dict([(s, SCALES[s]) for s in scales]), 'results': results}, handle, indent=2)
+    with open(out_name + '.csv', 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, fieldnames=RESULT_FIELDS + list(version.keys()), extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            row = dict(version)
+            row.update(result)
+            writer.writerow(row)
+    print('\nResults have been saved in {}.json and {}.csv'.format(out_name, out_name))
+
+    if args.baseline:
+        compare_results(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,8 +16,219 @@
 
 
 import argparse
+import numpy as np
 import os
 import pandas as pd
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from utils import metrics
+from utils import stage_cache
+from utils import table_io
+
+
+DEPTH_COLUMNS = ['Original_Contig_Name', 'contigLen', 'Sample', 'Depth']
+
+
+def group_sum(codes, values, sums, compensation):
+    """
+    Adds values to running sums by group with Kahan compensation. The values of each group are
+    added in the order they are given, which gives the same result as pandas groupby sums.
+    Input(s):
+    codes is a numpy array with the integer group of each value.
+    values is a numpy array of floats. NaN values are skipped.
+    sums is a numpy array with the running sum of each group, updated in place.
+    compensation is a numpy array with the running compensation of each group, updated in place.
+    Output(s):
+    None.
+    """
+
+    keep = ~np.isnan(values)
+    order = np.argsort(codes[keep], kind='stable')
+    codes = codes[keep][order]
+    values = values[keep][order]
+    groups, starts, sizes = np.unique(codes, return_index=True, return_counts=True)
+    #Groups sorted by decreasing size, so the groups with more than r values are a prefix
+    by_size = np.argsort(-sizes, kind='stable')
+    sorted_sizes = sizes[by_size]
+
+    #Add the r-th value of every group at once
+    for r in range(sorted_sizes[0] if len(groups) else 0):
+        active = by_size[:np.searchsorted(-sorted_sizes, -r, side='left')]
+        group = groups[active]
+        y = values[starts[active] + r] - compensation[group]
+        t = sums[group] + y
+        compensation[group] = (t - sums[group]) - y
+        sums[group] = t
+
+
+class AbundanceAccumulator():
+    """
+    This class sums the coverage of each bin in each sample from depth tables given whole or in chunks.
+    Contigs, bins, sites and samples are factorized into integer codes once, so the coverage is summed
+    with numpy instead of merging the string columns, and only the running sums by bin and sample and
+    the bin, site and sample combinations seen are kept in memory.
+    Input(s):
+    df_reads is a pandas dataframe with the columns Sample and Reads.
+    df_mapping is a pandas dataframe with the columns Original_Contig_Name, Bin and Sampling_Site.
+    df_size is a pandas dataframe with the columns Bin and Size.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, df_reads, df_mapping, df_size):
+
+        #Bins and samples keep the first size and number of reads given for them
+        df_size = df_size.drop_duplicates(subset='Bin')
+        df_reads = df_reads.drop_duplicates(subset='Sample')
+        self.bins = pd.Index(df_size['Bin'])
+        self.samples = pd.Index(df_reads['Sample'])
+        self.size = df_size['Size'].to_numpy(dtype=float)
+        self.reads = df_reads['Reads'].to_numpy(dtype=float)
+
+        #Only contigs of bins with a size are used
+        map_bin = self.bins.get_indexer(df_mapping['Bin'])
+        df_mapping = df_mapping[map_bin >= 0]
+        self.map_bin = map_bin[map_bin >= 0]
+        map_contig, contigs = pd.factorize(df_mapping['Original_Contig_Name'])
+        self.contigs = pd.Index(contigs)
+        self.map_site, self.sites = pd.factorize(df_mapping['Sampling_Site'])
+        #Unknown sites get their own code
+        self.map_site[self.map_site < 0] = len(self.sites)
+        self.map_order = np.argsort(map_contig, kind='stable')
+        self.sorted_contig = map_contig[self.map_order]
+
+        #Running coverage sums by bin and sample
+        self.sums = np.zeros(len(self.bins) * len(self.samples))
+        self.compensation = np.zeros(len(self.bins) * len(self.samples))
+        #Bin, site and sample combinations seen, with the first mapping and depth rows they were seen in
+        self.triples = np.zeros(0, dtype=np.int64)
+        self.first_map = np.zeros(0, dtype=np.int64)
+        self.first_depth = np.zeros(0, dtype=np.int64)
+        self.depth_offset = 0
+
+    def add(self, df_depth):
+        """
+        Adds the coverage of a depth table, or of the next chunk of it.
+        Input(s):
+        df_depth is a pandas dataframe with the columns Original_Contig_Name, contigLen, Sample and Depth.
+        Output(s):
+        None.
+        """
+
+        #Only depths of mapped contigs in samples with reads are used
+        depth_contig = self.contigs.get_indexer(df_depth['Original_Contig_Name'])
+        depth_sample = self.samples.get_indexer(df_depth['Sample'])
+        depth_rows = np.flatnonzero((depth_contig >= 0) & (depth_sample >= 0))
+        depth_contig = depth_contig[depth_rows]
+        depth_sample = depth_sample[depth_rows]
+        coverage = df_depth['contigLen'].to_numpy(dtype=float)[depth_rows] * df_depth['Depth'].to_numpy(dtype=float)[depth_rows]
+        depth_rows = depth_rows + self.depth_offset
+        self.depth_offset += len(df_depth)
+
+        #Pair each depth row with the mapping rows of its contig (usually one)
+        starts = np.searchsorted(self.sorted_contig, depth_contig, side='left')
+        counts = np.searchsorted(self.sorted_contig, depth_contig, side='right') - starts
+        pair_depth = np.repeat(np.arange(len(depth_rows)), counts)
+        offsets = np.arange(len(pair_depth)) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_map = self.map_order[np.repeat(starts, counts) + offsets]
+
+        #Pairs in the order of the mapping rows, then of the depth rows
+        pair_order = np.lexsort((pair_depth, pair_map))
+        pair_map = pair_map[pair_order]
+        pair_depth = pair_depth[pair_order]
+
+        #Sum the coverage by bin and sample
+        pair_bin_sample = self.map_bin[pair_map].astype(np.int64) * len(self.samples) + depth_sample[pair_depth]
+        group_sum(pair_bin_sample, coverage[pair_depth], self.sums, self.compensation)
+
+        #Keep the first mapping and depth rows of each bin, site and sample combination
+        triple = pair_bin_sample * (len(self.sites) + 1) + self.map_site[pair_map]
+        triples, first = np.unique(triple, return_index=True)
+        triples = np.concatenate([self.triples, triples])
+        first_map = np.concatenate([self.first_map, pair_map[first]])
+        first_depth = np.concatenate([self.first_depth, depth_rows[pair_depth[first]]])
+        order = np.lexsort((first_depth, first_map, triples))
+        self.triples, first = np.unique(triples[order], return_index=True)
+        self.first_map = first_map[order][first]
+        self.first_depth = first_depth[order][first]
+
+    def result(self, readablenum):
+        """
+        Normalizes the coverage sums by bin size and sample reads.
+        Input(s):
+        readablenum is the number the relative abundance is multiplied by to make it readable.
+        Output(s):
+        A pandas dataframe with one row per bin, sampling site and sample and the columns Bin, Sample,
+        Sampling_Site, NormalizedCoverage, RelativeAbundance and RelativeAbundanceReadable, in the order
+        they first appear in the mapping and depth tables.
+        """
+
+        triples = self.triples[np.lexsort((self.first_depth, self.first_map))]
+        out_bin_sample = triples // (len(self.sites) + 1)
+        out_site = triples % (len(self.sites) + 1)
+        out_bin = out_bin_sample // len(self.samples)
+        out_sample = out_bin_sample % len(self.samples)
+
+        # Normalize coverage values by Bin size
+        normalized = self.sums[out_bin_sample] / self.size[out_bin]
+        #Normalize by total number of reads of the mapped sample
+        relative = normalized / self.reads[out_sample]
+
+        site_names = np.append(np.asarray(self.sites, dtype=object), np.nan)
+        finaldf = pd.DataFrame({'Bin': self.bins.to_numpy()[out_bin],
+                                'Sample': self.samples.to_numpy()[out_sample],
+                                'Sampling_Site': site_names[out_site],
+                                'NormalizedCoverage': normalized,
+                                'RelativeAbundance': relative,
+                                #Multiply by a big number to make the abundance readable
+                                'RelativeAbundanceReadable': relative * readablenum})
+
+        return finaldf
+
+
+def calculate_abundance(df_reads, df_mapping, df_depth, df_size, readablenum):
+    """
+    Calculates the coverage of each bin in each sample normalized by bin size and sample reads.
+    Input(s):
+    df_reads is a pandas dataframe with the columns Sample and Reads.
+    df_mapping is a pandas dataframe with the columns Original_Contig_Name, Bin and Sampling_Site.
+    df_depth is a pandas dataframe with the columns Original_Contig_Name, contigLen, Sample and Depth.
+    df_size is a pandas dataframe with the columns Bin and Size.
+    readablenum is the number the relative abundance is multiplied by to make it readable.
+    Output(s):
+    A pandas dataframe with one row per bin, sampling site and sample and the columns Bin, Sample,
+    Sampling_Site, NormalizedCoverage, RelativeAbundance and RelativeAbundanceReadable.
+    """
+
+    accumulator = AbundanceAccumulator(df_reads, df_mapping, df_size)
+    accumulator.add(df_depth)
+
+    return accumulator.result(readablenum)
+
+
+def calculate_abundance_chunked(df_reads, df_mapping, depth, df_size, readablenum, chunksize):
+    """
+    Calculates the coverage of each bin in each sample normalized by bin size and sample reads,
+    streaming the depth table in chunks so it never has to fit in memory. Rows of contigs that
+    are not in a bin are dropped as each chunk is read.
+    Input(s):
+    df_reads is a pandas dataframe with the columns Sample and Reads.
+    df_mapping is a pandas dataframe with the columns Original_Contig_Name, Bin and Sampling_Site.
+    depth is a string containing the path to the depth table.
+    df_size is a pandas dataframe with the columns Bin and Size.
+    readablenum is the number the relative abundance is multiplied by to make it readable.
+    chunksize is the number of depth rows read at a time.
+    Output(s):
+    A pandas dataframe with the same rows and columns as calculate_abundance. The sums may differ
+    from it in the last digits because the coverage is added chunk by chunk.
+    """
+
+    accumulator = AbundanceAccumulator(df_reads, df_mapping, df_size)
+    for chunk in table_io.iter_table(depth, chunksize, columns=DEPTH_COLUMNS, default_format='tsv'):
+        accumulator.add(chunk)
+
+    return accumulator.result(readablenum)
 
 
 def main():
@@ -46,7 +257,16 @@ def main():
     parser.add_argument('-n', '--readablenum', required=False, default=100000000,
                         help=("A large number to multiply the relative abundances so that it is human readable."))
 
+    parser.add_argument('-c', '--chunksize', required=False, type=int, default=None,
+                        help=("Stream the depth file in chunks of this many rows, so memory depends on the number "
+                              "of bins and samples instead of the size of the depth file."))
+
+    table_io.add_format_argument(parser)
+    stage_cache.add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+
     args = parser.parse_args()
+    stage_metrics = metrics.StageMetrics.from_args('bin_abundance', args)
 
     #Create output directory if not already present
     if not os.path.exists(os.path.dirname(os.path.abspath(__file__)) + "/../../output"):
@@ -59,59 +279,44 @@ def main():
     size         = args.binsize
     readablenum  = float(args.readablenum)
 
-    df_reads    = pd.read_csv(reads,sep="\t")
-    df_mapping  = pd.read_csv(mapping, sep="\t",index_col=False)
-    df_size     = pd.read_csv(size, sep ="\t")
-    df_depth    = pd.read_csv(depth, sep ="\t")
-
-
-    # Map the total reads of each sample  in the mapping file
-
-    # Map the Bin size to the mapping file
-    mapping_size=pd.merge(df_mapping,df_size[['Bin','Size']],on ='Bin')
-    # Map the coverage of each scaffold in different samples to the mapping file
-    mapping_size_depth_new=pd.merge(mapping_size,df_depth[['Original_Contig_Name', 'contigLen', 'Sample', 'Depth']],on='Original_Contig_Name')
-
-    #Final dataframe to compute relative abundance
-
-    mapping_size_depth_new_reads=pd.merge(mapping_size_depth_new,df_reads[['Sample', 'Reads']], on='Sample')
-    #Columns of the final data frame
-
-    #Original_Contig_Name	Bin	Sampling_Site	Total_Reads	Size	contigLen	Sample	Depth	Reads
-
-    # Calculate coverage
-
-
-    mapping_size_depth_new_reads['Coverage']=mapping_size_depth_new_reads['contigLen'].astype(float) * mapping_size_depth_new_reads['Depth'].astype(float)
-
-    # Sum the coverage values by Bin
-
-    mapping_size_depth_new_reads['Sum_cov'] = mapping_size_depth_new_reads.groupby(by=['Bin',"Sample"])['Coverage'].transform('sum')
-
-    # Normalize coverage values by Bin size
-    mapping_size_depth_new_reads['NormalizedCoverage'] = mapping_size_depth_new_reads['Sum_cov'].astype(float) / mapping_size_depth_new_reads['Size'].astype(float)
-
-    #Normalize by total number of reads of the mapped sample
-    mapping_size_depth_new_reads['RelativeAbundance'] = mapping_size_depth_new_reads['NormalizedCoverage'].astype(float) / mapping_size_depth_new_reads['Reads'].astype(float)
-
-    #Multiply by a big number to make the abundance readable
-    mapping_size_depth_new_reads['RelativeAbundanceReadable'] = mapping_size_depth_new_reads['RelativeAbundance'].astype(float) * readablenum
-
-    #Drop duplicates
-    finaldf=mapping_size_depth_new_reads[['Bin', 'Sample', 'Sampling_Site', 'NormalizedCoverage', 'RelativeAbundance', 'RelativeAbundanceReadable']]
-    finaldf=finaldf.drop_duplicates()
-
     #Output files
-    abundance = "MetaGaia_OUT_abundanceby_bin.tsv"
-
-    finaldf.to_csv(os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + abundance, sep = '\t', index = False)
+    abundance = table_io.output_name("MetaGaia_OUT_abundanceby_bin", args.out_format)
+    abundance_path = os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + abundance
+
+    #Reuse the previous output if the inputs and parameters did not change
+    cache = stage_cache.StageCache.from_args(args)
+    cache_key = cache.key('bin_abundance', [reads, mapping, depth, size], {'readablenum': readablenum, 'chunksize': args.chunksize, 'out_format': args.out_format}, code=[__file__])
+    if cache.fetch(cache_key, [abundance_path]):
+        stage_metrics.finish('cached')
+        return
+
+    with stage_metrics.phase('read') as phase:
+        df_reads    = table_io.read_table(reads, default_format='tsv')
+        df_mapping  = table_io.read_table(mapping, default_format='tsv', index_col=False)
+        df_size     = table_io.read_table(size, default_format='tsv')
+        if not args.chunksize:
+            df_depth = table_io.read_table(depth, default_format='tsv')
+            phase['rows_out'] = df_depth
+
+    #The depth file is read within the groupby phase when it is streamed
+    with stage_metrics.phase('groupby', None if args.chunksize else df_depth) as phase:
+        if args.chunksize:
+            finaldf = calculate_abundance_chunked(df_reads, df_mapping, depth, df_size, readablenum, args.chunksize)
+        else:
+            finaldf = calculate_abundance(df_reads, df_mapping, df_depth, df_size, readablenum)
+        phase['rows_out'] = finaldf
+
+    with stage_metrics.phase('write', finaldf):
+        table_io.write_table(finaldf, abundance_path, index = False)
+    cache.store(cache_key, [abundance_path])
+    stage_metrics.finish()
 
 
     print("\n"
           "[END] Done computing abundance..........................................................................:\n"
           "Please check the output file:..........................................................................:\n\n"
 
-          "1. File containing relative abundance normalized by bin: MetaGaia_OUT_abundanceby_bin.tsv\n\n"
+          "1. File containing relative abundance normalized by bin: " + abundance + "\n\n"
 
           "Have a nice day :D\n")
 
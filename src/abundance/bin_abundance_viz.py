@@ -11,15 +11,30 @@
 # ------------------------------
 import argparse
 import functools
+import hashlib
 import math
-from matplotlib.patches import Patch
-import matplotlib.pyplot as plt
+import multiprocessing
 import numpy as np
 import os
 import pandas as pd
 import random
 import re
-import seaborn as sns
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from utils import metrics
+from utils import stage_cache
+from utils import table_io
+
+#fastcluster clusters large matrices without the full distance matrix, in memory linear in the number of bins.
+#It is in the conda environments; without it scipy builds the n*(n-1)/2 distance matrix
+try:
+    import fastcluster
+except ImportError:
+    fastcluster = None
+
+
+DEFAULT_LINKAGE_DIR = os.path.join(stage_cache.DEFAULT_CACHE_DIR, 'linkage')
 
 
 class Command_line_args():
@@ -31,7 +46,7 @@ class Command_line_args():
     None.
     """
 
-    def __init__(self):
+    def __init__(self, args=None):
 
         #Command line arguments
         self.parser = argparse.ArgumentParser()
@@ -44,7 +59,18 @@ class Command_line_args():
         self.parser.add_argument('-d', '--dpi', required=False, type=int, default=300, help='Resolution for output figure file [300].')
         self.parser.add_argument('-o', '--out_fig', required=False, type=str, default="test.png", help='Stores the figure in the specified file path and format [test.png].')
         self.parser.add_argument('-c', '--taxa_color', required=False, type=str, default="", help='Input tsv or csv file containing the RGB color code for each taxa with file extension [""].')
-        self.args = self.parser.parse_args()
+        self.parser.add_argument('--batch', required=False, action='store_true', help='Render the figures without a display, at the same time in --threads processes.')
+        self.parser.add_argument('--threads', required=False, type=int, default=4, help='Number of figures rendered at the same time with --batch [4].')
+        self.parser.add_argument('--split_by', required=False, type=str, default='', choices=['', 'taxa', 'site'], help='Also save one clustermap per taxa, or one heatmap of the top bins per site [""].')
+        self.parser.add_argument('--linkage_dir', required=False, type=str, default=DEFAULT_LINKAGE_DIR, help='Directory where the clustering of each abundance matrix is saved, so the figure can be redrawn (e.g. with another --width or --dpi) without clustering again. Leave empty to not save it [output/.metagaia_cache/linkage].')
+        table_io.add_format_argument(self.parser)
+        metrics.add_metrics_arguments(self.parser)
+        self.args = self.parser.parse_args(args)
+
+    def __getstate__(self):
+
+        #Only the parsed arguments are sent to the processes drawing the figures, as the parser cannot be pickled
+        return {'args': self.args}
 
 
 def format_dataframe(arguments, bin_abundances, taxonomy_info):
@@ -58,13 +84,10 @@ def format_dataframe(arguments, bin_abundances, taxonomy_info):
     A formatted bin abundances dataframe.
     """
 
-    if 'tsv' in arguments.args.sample2site:
-        sample2site_df = pd.read_csv(arguments.args.sample2site, sep='\t')
-    elif "csv" in arguments.args.sample2site:
-        sample2site_df = pd.read_csv(arguments.args.sample2site)
-    else:
+    if table_io.table_format(arguments.args.sample2site) is None:
         print("Please make sure all of your input files are in a tsv or csv format!")
         quit()
+    sample2site_df = table_io.read_table(arguments.args.sample2site, default_format='tsv')
     bin_abundances = bin_abundances.merge(sample2site_df, on='Sample', how='left')
     bin_abundances = bin_abundances.drop(columns=['Sample']).rename(columns={'Site': 'Sample'})
 
@@ -121,6 +144,35 @@ def get_color_palette(bin_abundances):
     return final_colors_list
 
 
+def top_rows_mask(values, num_filter):
+    """
+    Finds the rows with the highest values in each column at once, as DataFrame.nlargest(keep='first') does for one column.
+    Input(s):
+    values is a 2D numpy array with one row per bin and one column per sample.
+    num_filter is the number of rows to keep for each column.
+    Output(s):
+    A boolean numpy array with the shape of values that is True for the rows kept in each column.
+    """
+
+    valid = ~np.isnan(values)
+    num_rows = min(num_filter, values.shape[0])
+    if num_rows <= 0 or values.size == 0:
+        return np.zeros(values.shape, dtype=bool)
+
+    #Number of rows kept in each column, as nlargest skips NaN
+    keep = np.minimum(num_rows, valid.sum(axis=0))
+    #Value of the last row kept in each column, selected in linear time
+    filled = np.where(valid, values, -np.inf)
+    threshold = -np.partition(-filled, num_rows - 1, axis=0)[num_rows - 1]
+
+    greater = valid & (values > threshold)
+    equal = valid & (values == threshold)
+    #Rows tied with the last value are kept in row order
+    needed = keep - greater.sum(axis=0)
+
+    return greater | (equal & (np.cumsum(equal, axis=0) <= needed))
+
+
 def filter_top_sites(arguments, bin_abundances):
     """
     Creates a dataframe with the top taxa in each bin.
@@ -131,26 +183,26 @@ def filter_top_sites(arguments, bin_abundances):
     merged_dfs is a new pandas dataframe containing the top samples in each column.
     """
 
-    #List to keep dataframes together
-    df_list = []
     #Get list of columns
     col_list = bin_abundances.drop(columns=['Taxa']).columns.tolist()
     #Number of rows to keep for each bin
     num_filter = math.floor((arguments.args.percent / 100) * len(bin_abundances))
 
-    #Create new dataframe with top values for each column
-    for col in col_list:
-        #List of columns to drop after getting rows to keep
-        drop_list = [bins for bins in col_list if bins != col]
-        #Get needed rows
-        bin_abundances_cp = bin_abundances.nlargest(n = num_filter, columns = col)
-        #Drop all columns not of interest
-        bin_abundances_cp = bin_abundances_cp.drop(columns = drop_list)
-        df_list.append(bin_abundances_cp)
-
-    #Combine dataframes into one
-    merged_dfs = pd.concat(df_list)
-    merged_dfs = merged_dfs.replace(np.nan, 0)
+    #Select the top rows of every column at once
+    values = bin_abundances[col_list].to_numpy(dtype=float)
+    mask = top_rows_mask(values, num_filter)
+
+    #One row per column and top bin, ordered by column and then by decreasing value as nlargest orders them
+    cols, rows = np.nonzero(mask.T)
+    order = np.lexsort((rows, -values[rows, cols], cols))
+    rows = rows[order]
+    cols = cols[order]
+    #Each row only keeps the value of the column it is a top bin of
+    top_values = np.zeros((len(rows), len(col_list)))
+    top_values[np.arange(len(rows)), cols] = values[rows, cols]
+
+    merged_dfs = pd.DataFrame(top_values, index=bin_abundances.index[rows], columns=col_list)
+    merged_dfs['Taxa'] = bin_abundances['Taxa'].take(rows).array
     merged_dfs = merged_dfs.sort_values('Taxa')
     merged_dfs = merged_dfs.drop_duplicates()
     merged_dfs = merged_dfs.reindex(sorted(merged_dfs.columns), axis=1)
@@ -158,17 +210,118 @@ def filter_top_sites(arguments, bin_abundances):
     return merged_dfs
 
 
-def create_clustermap(arguments, bin_abundances, palette, row_colors, heatmp = False):
+def compute_linkage(matrix, method='ward'):
+    """
+    Clusters the rows of a matrix with euclidean distances.
+    Input(s):
+    matrix is a 2D numpy array.
+    method is the linkage method.
+    Output(s):
+    A numpy array containing the linkage matrix, as returned by scipy.cluster.hierarchy.linkage.
+    """
+
+    from scipy.cluster import hierarchy
+
+    if fastcluster is not None:
+        #Works on the rows directly instead of building the n*(n-1)/2 distance matrix
+        return fastcluster.linkage_vector(matrix, method=method, metric='euclidean')
+
+    return hierarchy.linkage(matrix, method=method, metric='euclidean')
+
+
+def cached_linkages(bin_abundances, linkage_dir=DEFAULT_LINKAGE_DIR, method='ward'):
+    """
+    Clusters the bins and the samples of an abundance matrix, reusing the clustering saved for the same matrix if there is one.
+    Input(s):
+    bin_abundances is a pandas dataframe with one row per bin and one numeric column per sample.
+    linkage_dir is a string containing the directory the clusterings are saved in. Nothing is saved if empty.
+    method is the linkage method.
+    Output(s):
+    row_linkage is a numpy array containing the linkage matrix of the bins.
+    col_linkage is a numpy array containing the linkage matrix of the samples.
+    """
+
+    #Clustered in double precision, as seaborn does, so near-tied merges and the dendrograms do not change
+    matrix = np.ascontiguousarray(bin_abundances.to_numpy(dtype=np.float64))
+
+    linkage_path = ''
+    if linkage_dir:
+        digest = hashlib.sha256()
+        digest.update('{} {} {}'.format(matrix.shape, method, 'fastcluster' if fastcluster is not None else 'scipy').encode())
+        digest.update(matrix.tobytes())
+        linkage_path = os.path.join(linkage_dir, digest.hexdigest() + '.npz')
+        if os.path.isfile(linkage_path):
+            with np.load(linkage_path) as linkages:
+                return [linkages['row'], linkages['col']]
+
+    row_linkage = compute_linkage(matrix, method)
+    col_linkage = compute_linkage(np.ascontiguousarray(matrix.T), method)
+
+    if linkage_path:
+        if not os.path.exists(linkage_dir):
+            os.makedirs(linkage_dir)
+        np.savez(linkage_path, row=row_linkage, col=col_linkage)
+
+    return [row_linkage, col_linkage]
+
+
+def import_plotting(headless=False):
+    """
+    Imports the plotting libraries, which are only needed once a figure is drawn.
+    Input(s):
+    headless is a boolean, True to draw the figures without a display.
+    Output(s):
+    plt is the matplotlib.pyplot module.
+    sns is the seaborn module.
+    Patch is the matplotlib.patches.Patch class.
+    """
+
+    import matplotlib
+    if headless:
+        matplotlib.use('Agg')
+    from matplotlib.patches import Patch
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    return plt, sns, Patch
+
+
+def figure_name(arguments, heatmp=False, name=''):
+    """
+    Gets the file name of a figure.
+    Input(s):
+    arguments is a class containing all the command line arguments.
+    heatmp is a boolean, True for the heatmap of the top bins and False for the clustermap.
+    name is a string added to the file name of the figures of one taxa or site.
+    Output(s):
+    A string containing the file name of the figure.
+    """
+
+    if heatmp:
+        prefix = "heatmap_top_" + str(arguments.args.percent) + "%_"
+    else:
+        prefix = "clustermap_"
+    if name:
+        #Taxa names may contain spaces, semicolons or slashes
+        prefix = prefix + re.sub(r'[^\w.-]+', '_', name) + "_"
+
+    return prefix + arguments.args.out_fig
+
+
+def create_clustermap(arguments, bin_abundances, palette, row_colors, heatmp = False, name = ''):
     """
     Creates clustermap with taxonomic information.
     Input(s):
     bin_abundances is a pandas dataframe with all the information joined together.
     palette is a dictionary containing the taxa-to-color information.
     row_colors is a pandas object that maps the taxa to the color.
+    name is a string added to the file name of the figures of one taxa or site.
     Output(s):
     A clustermap of all the bins and taxa.
     """
 
+    plt, sns, Patch = import_plotting(arguments.args.batch)
+
     #Get the greatest dimension value
     max_size = max(arguments.args.width, arguments.args.height)
 
@@ -189,45 +342,101 @@ def create_clustermap(arguments, bin_abundances, palette, row_colors, heatmp = F
         #Create taxa-color legend
         plt.legend(handles, palette, bbox_to_anchor=(1.2, 0.82), bbox_transform=plt.gcf().transFigure, loc='upper right', prop={'size': max_size/2}, facecolor="white", edgecolor="white")
     else:
-        cluster = sns.clustermap(bin_abundances.drop(columns="Taxa"), col_cluster=True, row_cluster=True, yticklabels=y_tick_label, cmap="Reds", row_colors=row_colors, method='ward', figsize=(arguments.args.width, arguments.args.height))
+        #Cluster before plotting so seaborn does not recompute the linkages
+        row_linkage, col_linkage = cached_linkages(bin_abundances.drop(columns="Taxa"), arguments.args.linkage_dir)
+        cluster = sns.clustermap(bin_abundances.drop(columns="Taxa"), col_cluster=True, row_cluster=True, row_linkage=row_linkage, col_linkage=col_linkage, yticklabels=y_tick_label, cmap="Reds", row_colors=row_colors, method='ward', figsize=(arguments.args.width, arguments.args.height))
         #Create taxa-color legend
         plt.legend(handles, palette, bbox_to_anchor=(1.2, 1), bbox_transform=plt.gcf().transFigure, loc='upper right', prop={'size': max_size/2}, facecolor="white", edgecolor="white")
 
     #Save or show plot
     if arguments.args.out_fig:
-        if heatmp:
-            plt.savefig(os.path.dirname(os.path.abspath(__file__)) + "/../../output/heatmap_top_" + str(arguments.args.percent) + "%_" + arguments.args.out_fig, dpi=arguments.args.dpi, bbox_inches="tight")
-        else:
-            plt.savefig(os.path.dirname(os.path.abspath(__file__)) + "/../../output/clustermap_" + arguments.args.out_fig, dpi=arguments.args.dpi, bbox_inches="tight")
+        plt.savefig(os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + figure_name(arguments, heatmp, name), dpi=arguments.args.dpi, bbox_inches="tight")
+        #Free the figure, as many may be drawn by the same process
+        plt.close(cluster.fig)
     else:
         plt.show()
 
 
-def main():
+def draw_figure(job):
+    """
+    Draws one figure, in the main process or in a process of the pool.
+    Input(s):
+    job is a tuple containing the arguments, the dataframe, the taxa-to-color dictionary, whether the figure is a heatmap and the name of the figure.
+    Output(s):
+    A string containing the file name of the figure.
+    """
 
-    arguments = Command_line_args()
+    arguments, bin_abundances, palette, heatmp, name = job
+    row_colors = bin_abundances.Taxa.map(palette)
+    create_clustermap(arguments, bin_abundances, palette, row_colors, heatmp, name)
 
-    #Create output directory if not already present
-    if not os.path.exists(os.path.dirname(os.path.abspath(__file__)) + "/../../output"):
-        os.makedirs(os.path.dirname(os.path.abspath(__file__)) + "/../../output")
+    return figure_name(arguments, heatmp, name)
 
-    #Read in bin abundance file
-    if "tsv" in arguments.args.bin_abundance:
-        bin_abundance_df = pd.read_csv(arguments.args.bin_abundance, sep = "\t")
-    elif "csv" in arguments.args.bin_abundance:
-        bin_abundance_df = pd.read_csv(arguments.args.bin_abundance)
-    else:
-        print("Please make sure all of your input files are in a tsv or csv format!")
-        quit()
 
-    #Read in taxanomy file
-    if "tsv" in arguments.args.taxonomy_info:
-        taxonomy_df = pd.read_csv(arguments.args.taxonomy_info, sep = "\t", header = 0)
-    elif "csv" in arguments.args.taxonomy_info:
-        taxonomy_df = pd.read_csv(arguments.args.taxonomy_info, header = 0)
-    else:
-        print("Please make sure all of your input files are in a tsv or csv format!")
-        quit()
+def split_figures(arguments, bin_abundance_df, palette, top_palette):
+    """
+    Lists the figures of each taxa or site asked for with --split_by.
+    Input(s):
+    arguments is a class containing all the command line arguments.
+    bin_abundance_df is a pandas dataframe with all the information joined together.
+    palette is a dictionary containing the taxa-to-color information of the clustermap.
+    top_palette is a dictionary containing the taxa-to-color information of the heatmap.
+    Output(s):
+    A list of tuples, as taken by draw_figure.
+    """
+
+    jobs = []
+    if arguments.args.split_by == 'taxa':
+        for taxa, taxa_df in bin_abundance_df.groupby('Taxa', sort=False):
+            #At least two bins are needed to cluster them
+            if len(taxa_df) < 2:
+                print("WARNING: " + taxa + " has a single bin and was not given its own clustermap.")
+                continue
+            jobs.append((arguments, taxa_df, {taxa: palette[taxa]}, False, taxa))
+    elif arguments.args.split_by == 'site':
+        col_list = bin_abundance_df.drop(columns=['Taxa']).columns.tolist()
+        num_filter = math.floor((arguments.args.percent / 100) * len(bin_abundance_df))
+        mask = top_rows_mask(bin_abundance_df[col_list].to_numpy(dtype=float), num_filter)
+        for col_index, col in enumerate(col_list):
+            #Top bins of the site, from the most to the least abundant
+            site_df = bin_abundance_df.loc[mask[:, col_index], [col, 'Taxa']]
+            site_df = site_df.sort_values(col, ascending=False, kind='mergesort')
+            site_palette = {taxa: top_palette[taxa] for taxa in site_df.Taxa.unique()}
+            jobs.append((arguments, site_df, site_palette, True, str(col)))
+
+    return jobs
+
+
+def render_figures(arguments, jobs):
+    """
+    Draws figures one after the other, or at the same time in a pool of processes with --batch.
+    Input(s):
+    arguments is a class containing all the command line arguments.
+    jobs is a list of tuples, as taken by draw_figure.
+    Output(s):
+    A list of strings containing the file names of the figures.
+    """
+
+    threads = min(arguments.args.threads, len(jobs), os.cpu_count() or 1)
+    if not arguments.args.batch or threads <= 1:
+        return [draw_figure(job) for job in jobs]
+
+    #Imported once before the processes are forked instead of once in each of them
+    import_plotting(True)
+    with multiprocessing.Pool(processes=threads) as pool:
+        return pool.map(draw_figure, jobs)
+
+
+def visualize(arguments, bin_abundance_df, taxonomy_df):
+    """
+    Saves the clustermap of all the bins and the heatmap of the top bins in each sample.
+    Input(s):
+    arguments is a class containing all the command line arguments.
+    bin_abundance_df is a pandas dataframe outputted from the bin_abundance.py script.
+    taxonomy_df is a pandas dataframe mapping taxonomy to each bin.
+    Output(s):
+    merged_df is a pandas dataframe containing the top samples in each column.
+    """
 
     #Format dataframe to desired layout
     bin_abundance_df = format_dataframe(arguments, bin_abundance_df, taxonomy_df)
@@ -245,25 +454,63 @@ def main():
             quit()
         final_colors = colors_df[0].tolist()
 
-       #Set color palette
+    #Set color palette
     my_palette = dict(zip(bin_abundance_df.Taxa.unique(), final_colors))
-    row_colors = bin_abundance_df.Taxa.map(my_palette)
-
-    #Outputs final clustermap
-    create_clustermap(arguments, bin_abundance_df, my_palette, row_colors, False)
 
     #Get dataframe with highest abundances in each column
     merged_df = filter_top_sites(arguments, bin_abundance_df)
-    merged_df.to_csv(os.path.dirname(os.path.abspath(__file__)) + '/../../output/top_' + str(arguments.args.percent) + '%_' + 'sample_abundances.tsv', sep='\t')
 
     #Set color palette
-    my_palette = dict(zip(merged_df.Taxa.unique(), final_colors))
-    row_colors = merged_df.Taxa.map(my_palette)
+    top_palette = dict(zip(merged_df.Taxa.unique(), final_colors))
+
+    #Outputs final clustermap and heatmap, and the figures of each taxa or site
+    jobs = [(arguments, bin_abundance_df, my_palette, False, ''), (arguments, merged_df, top_palette, True, '')]
+    jobs = jobs + split_figures(arguments, bin_abundance_df, my_palette, top_palette)
+    render_figures(arguments, jobs)
+
+    return merged_df
+
 
-    #Outputs final heatmap
-    create_clustermap(arguments, merged_df, my_palette, row_colors, True)
+def main():
+
+    arguments = Command_line_args()
+    stage_metrics = metrics.StageMetrics.from_args('bin_abundance_viz', arguments.args)
+
+    if arguments.args.batch and not arguments.args.out_fig:
+        print("Please give the figure file name (-o) to render the figures with --batch!")
+        quit()
+
+    #Create output directory if not already present
+    if not os.path.exists(os.path.dirname(os.path.abspath(__file__)) + "/../../output"):
+        os.makedirs(os.path.dirname(os.path.abspath(__file__)) + "/../../output")
 
-    print("Success!\nThe following files have been saved in the \"output\" directory:\n\ntop_" + str(arguments.args.percent) + "%_" + "sample_abundances.tsv\n" + "heatmap_top_" + str(arguments.args.percent) + "%_" + arguments.args.out_fig + "\nclustermap_" + arguments.args.out_fig)
+    with stage_metrics.phase('read') as phase:
+        #Read in bin abundance file
+        if table_io.table_format(arguments.args.bin_abundance) is None:
+            print("Please make sure all of your input files are in a tsv or csv format!")
+            quit()
+        bin_abundance_df = table_io.read_table(arguments.args.bin_abundance, default_format='tsv')
+
+        #Read in taxanomy file
+        if table_io.table_format(arguments.args.taxonomy_info) is None:
+            print("Please make sure all of your input files are in a tsv or csv format!")
+            quit()
+        taxonomy_df = table_io.read_table(arguments.args.taxonomy_info, default_format='tsv')
+        phase['rows_out'] = bin_abundance_df
+
+    #Pivots the abundances, clusters them and draws the figures
+    with stage_metrics.phase('plot', bin_abundance_df) as phase:
+        merged_df = visualize(arguments, bin_abundance_df, taxonomy_df)
+        phase['rows_out'] = merged_df
+
+    with stage_metrics.phase('write', merged_df):
+        top_file = table_io.output_name('top_' + str(arguments.args.percent) + '%_' + 'sample_abundances', arguments.args.out_format)
+        table_io.write_table(merged_df, os.path.dirname(os.path.abspath(__file__)) + '/../../output/' + top_file, index=True)
+    stage_metrics.finish()
+
+    print("Success!\nThe following files have been saved in the \"output\" directory:\n\n" + top_file + "\n" + "heatmap_top_" + str(arguments.args.percent) + "%_" + arguments.args.out_fig + "\nclustermap_" + arguments.args.out_fig)
+    if arguments.args.split_by:
+        print("and one figure per " + arguments.args.split_by + ".")
 
 if __name__ == "__main__":
     main()
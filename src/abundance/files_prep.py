@@ -10,12 +10,26 @@
 # Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
 # ------------------------------
 import argparse
-import copy
+import functools
 import glob
+import multiprocessing
 import numpy as np
 import os
 import pandas as pd
 import re
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from utils import metrics
+from utils import stage_cache
+from utils import table_io
+
+
+#Regex splitting a paired-end fastq file name into its sample name and mate number
+PAIRED_FASTQ_REGEX = re.compile(r'^(.+?)[._]R?([12])(?:_001)?\.fastq\.gz$')
+#Number of rows formatted at a time when writing the combined depth file
+DEPTH_CHUNK_SIZE = 1000000
 
 
 class Command_line_args():
@@ -31,14 +45,117 @@ class Command_line_args():
 
 		#Command line arguments
 		self.parser = argparse.ArgumentParser()
-		self.parser.add_argument('-b', '--bin_samples', required=True, type=str, help='Input file containing 2 columns: 1st column contains bin names and 2nd column contains sample names. Requires header for each column, \"Bin\" and \"Sampling_Site\" respectively. File must have tsv, csv, or txt file extension.')
-		self.parser.add_argument('-d', '--depth', required=False, default="", type=str, help='Input file containing 5 columns: contigName, contigLen, totalAvgDepth, Sample, and Depth. This file can be created with jgi_summarize_bam_contig_depths. File must have tsv, csv, or txt file extension.')
+		self.parser.add_argument('-b', '--bin_samples', required=True, type=str, help='Input file containing 2 columns: 1st column contains bin names and 2nd column contains sample names. Requires header for each column, \"Bin\" and \"Sampling_Site\" respectively. File must have tsv, csv, txt, parquet or feather file extension.')
+		self.parser.add_argument('-d', '--depth', required=False, default="", type=str, help='Input file containing 5 columns: contigName, contigLen, totalAvgDepth, Sample, and Depth. This file can be created with jgi_summarize_bam_contig_depths. File must have tsv, csv, txt, parquet or feather file extension.')
 		self.parser.add_argument('-f', '--depth_dir', required=False, default="", type=str, help='Input directory path containing all the depth txt files that must be concatenated. No other txt files should be present within the directory!')
 		self.parser.add_argument('-q', '--fastq_dir', required=True, type=str, help='Input directory path containing all the fastq files.')
 		self.parser.add_argument('-a', '--fna_dir', required=True, type=str, help='Input directory path containing all the fna files.')
+		self.parser.add_argument('-t', '--threads', required=False, default=8, type=int, help='Number of processes used to count the reads in the fastq files and scan the fna files [8].')
+		self.parser.add_argument('-c', '--chunk_size', required=False, default=4194304, type=int, help='Number of compressed bytes read at a time from each fastq file [4194304].')
+		self.parser.add_argument('-p', '--paired', required=False, action='store_true', help='Combine the counts of paired-end fastq files (e.g. sample_R1.fastq.gz and sample_R2.fastq.gz) into one sample.')
+		table_io.add_format_argument(self.parser)
+		stage_cache.add_cache_arguments(self.parser)
+		metrics.add_metrics_arguments(self.parser)
 		self.args = self.parser.parse_args()
 
 
+def count_fastq(fastq_file, chunk_size=4194304, count_bases=True):
+	"""
+	This function counts the reads and bases of a gzipped fastq file without calling zcat.
+	Input(s):
+	fastq_file is a string containing the path to a gzipped fastq file.
+	chunk_size is the number of compressed bytes read from the file at a time.
+	count_bases is a boolean value that determines if the bases in the sequence lines are counted.
+	Output(s):
+	A list containing the fastq file path, the number of reads and the number of bases.
+	"""
+
+	lines = 0
+	bases = 0
+	#Incomplete last line of the previous buffer
+	partial = b''
+	#Accept both gzip and zlib headers
+	decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+
+	with open(fastq_file, 'rb') as handle:
+		while True:
+			chunk = handle.read(chunk_size)
+			if not chunk:
+				break
+			#Inflate the chunk, starting a new decompressor for every concatenated gzip member (e.g. bgzip)
+			buffers = []
+			while chunk:
+				buffers.append(decompressor.decompress(chunk))
+				if decompressor.eof:
+					chunk = decompressor.unused_data
+					decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+				else:
+					chunk = b''
+			data = b''.join(buffers)
+			if not count_bases:
+				lines += data.count(b'\n')
+				if data:
+					partial = b'' if data.endswith(b'\n') else data[-1:]
+				continue
+			#Sequence lines are the second line of every 4 line record
+			fastq_lines = (partial + data).split(b'\n')
+			partial = fastq_lines.pop()
+			bases += sum(map(len, fastq_lines[(1 - lines) % 4::4]))
+			lines += len(fastq_lines)
+
+	#Count a last line that is not terminated by a newline
+	if partial:
+		if count_bases and lines % 4 == 1:
+			bases += len(partial)
+		lines += 1
+
+	return [fastq_file, lines // 4, bases]
+
+
+def fastq_sample_name(fastq_file, paired):
+	"""
+	This function gets the sample name of a fastq file from its file name.
+	Input(s):
+	fastq_file is a string containing the path to a gzipped fastq file.
+	paired is a boolean value that determines if the mate number is removed from the file name.
+	Output(s):
+	A string containing the sample name.
+	"""
+
+	file_name = os.path.basename(fastq_file)
+	if paired:
+		match = PAIRED_FASTQ_REGEX.match(file_name)
+		if match != None:
+			return match.group(1)
+	return re.sub(r'\.fastq\.gz$', '', file_name)
+
+
+def count_reads(fastq_dir, threads=8, chunk_size=4194304, paired=False):
+	"""
+	This function counts the reads and bases of each sample.
+	Input(s):
+	fastq_dir is a string containing the path to the directory of fastq files, ending with a backslash.
+	threads is the number of fastq files counted at the same time.
+	chunk_size is the number of compressed bytes read at a time from each fastq file.
+	paired is a boolean value that determines if the counts of paired-end fastq files are added together.
+	Output(s):
+	reads_df is a pandas dataframe with the number of reads and bases of each sample.
+	"""
+
+	fastq_files = sorted([f for f in glob.glob(fastq_dir + '*.fastq.gz') if os.path.isfile(f)])
+	#Count the reads of each fastq file in a separate process
+	counter = functools.partial(count_fastq, chunk_size=chunk_size)
+	with multiprocessing.Pool(processes=max(1, min(threads, len(fastq_files)))) as pool:
+		counts = pool.map(counter, fastq_files, chunksize=1)
+
+	reads_df = pd.DataFrame(counts, columns=["File", "Reads", "Bases"])
+	reads_df['Sample'] = [fastq_sample_name(f, paired) for f in reads_df['File']]
+	#Add the mates of paired-end samples together
+	reads_df = reads_df.groupby('Sample', sort=False)[["Reads", "Bases"]].sum().reset_index()
+
+	return reads_df
+
+
 def create_reads_file(arguments):
 	"""
 	This function creates the reads file needed.
@@ -48,108 +165,254 @@ def create_reads_file(arguments):
 	A file containing the reads information is saved in the "output" folder.
 	"""
 
-	if os.path.exists(os.path.dirname(os.path.abspath(__file__)) + "/../../output/fastq_read_counts.txt"):
-		os.remove(os.path.dirname(os.path.abspath(__file__)) + "/../../output/fastq_read_counts.txt")
-	#Run bash script to create a text file containing the reads information
-	bash_command = "find " + arguments.args.fastq_dir + " -type f -maxdepth 1 -name \'*.fastq.gz\' | parallel --jobs 8 bash " + os.path.dirname(os.path.abspath(__file__)) + "/../bash/count_fastq_reads.sh {} \'>>\' " + os.path.dirname(os.path.abspath(__file__)) + "/../../output/fastq_read_counts.txt"
-	os.system(bash_command)
-	#Read in outputted reads text file add column names to dataframe
-	reads_df = pd.read_csv(os.path.dirname(os.path.abspath(__file__)) + "/../../output/fastq_read_counts.txt", sep="\s+", names=["Sample", "Reads"])
+	reads_df = count_reads(arguments.args.fastq_dir, arguments.args.threads, arguments.args.chunk_size, arguments.args.paired)
 	#Save dataframe to file
-	reads_df.to_csv(os.path.dirname(os.path.abspath(__file__)) + "/../../output/reads_file.tsv", sep="\t", index=False)
-	os.remove(os.path.dirname(os.path.abspath(__file__)) + "/../../output/fastq_read_counts.txt")
+	table_io.write_table(reads_df, os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + table_io.output_name("reads_file", arguments.args.out_format))
 	print("Reads file has been created!")
-	print("WARNING: Path names in script must be edited to represent Sample names!")
+	print("WARNING: Sample names are taken from the fastq file names and must be edited if they do not match the depth file!")
+
+
+def scan_fasta(fna_file, block_size=1048576):
+	"""
+	This function reads a bin fasta file once in fixed-size blocks and gets the length and GC content of each contig.
+	Input(s):
+	fna_file is a string containing the path to a bin fasta file.
+	block_size is the number of bytes read at a time.
+	Output(s):
+	A list containing the bin name and a list of [contig name, length, GC bases, AT bases] for each contig.
+	"""
+
+	contigs = []
+	#Header line being read, None while reading sequence lines
+	header = None
+	#Whether the next byte is the start of a line
+	line_start = True
+
+	with open(fna_file, 'rb') as handle:
+		while True:
+			block = handle.read(block_size)
+			if not block:
+				break
+			pos = 0
+			while pos < len(block):
+				if header is not None:
+					end = block.find(b'\n', pos)
+					if end == -1:
+						header += block[pos:]
+						pos = len(block)
+						continue
+					contigs.append([(header + block[pos:end]).rstrip(b'\r').decode(), 0, 0, 0])
+					header = None
+					pos = end + 1
+					line_start = True
+				elif line_start and block[pos:pos+1] == b'>':
+					header = b''
+					pos += 1
+				else:
+					#Count the sequence up to the next header in one slice
+					end = block.find(b'\n>', pos)
+					end = len(block) if end == -1 else end + 1
+					if contigs:
+						seq = block[pos:end]
+						contigs[-1][1] += len(seq) - seq.count(b'\n') - seq.count(b'\r')
+						contigs[-1][2] += seq.count(b'G') + seq.count(b'C') + seq.count(b'g') + seq.count(b'c')
+						contigs[-1][3] += seq.count(b'A') + seq.count(b'T') + seq.count(b'a') + seq.count(b't')
+					line_start = block[end-1:end] == b'\n'
+					pos = end
+	#Header on the last line of the file
+	if header is not None:
+		contigs.append([header.rstrip(b'\r').decode(), 0, 0, 0])
+
+	return [os.path.basename(fna_file)[:-4], contigs]
+
+
+def calc_n50(lengths):
+	"""
+	This function calculates the N50 of a bin.
+	Input(s):
+	lengths is a list containing the length of each contig in the bin.
+	Output(s):
+	An integer of the N50.
+	"""
 
+	lengths = np.sort(np.asarray(lengths, dtype=np.int64))[::-1]
+	if len(lengths) == 0:
+		return 0
+	half = np.searchsorted(np.cumsum(lengths), lengths.sum() / 2.0)
 
-def create_binsize_file(arguments):
+	return int(lengths[half])
+
+
+def scan_bins(fna_dir, threads=8):
+	"""
+	This function scans every bin fasta file in parallel, reading each of them once.
+	Input(s):
+	fna_dir is a string containing the path to the directory of bin fasta files, ending with a backslash.
+	threads is the number of fasta files scanned at the same time.
+	Output(s):
+	binsize_df is a pandas dataframe with the size, number of contigs, N50 and GC content of each bin.
+	contig_df is a pandas dataframe with the bin, length and GC content of each contig.
+	"""
+
+	fna_files = sorted(glob.glob(fna_dir + "*.fna"))
+	with multiprocessing.Pool(processes=max(1, min(threads, len(fna_files)))) as pool:
+		scanned = pool.map(scan_fasta, fna_files, chunksize=1)
+
+	bin_rows = []
+	contig_rows = []
+	for bin_name, contigs in scanned:
+		lengths = [c[1] for c in contigs]
+		gc = sum([c[2] for c in contigs])
+		at = sum([c[3] for c in contigs])
+		bin_rows.append([bin_name, sum(lengths), len(contigs), calc_n50(lengths), gc / float(gc + at) if gc + at else np.nan])
+		contig_rows.extend([[c[0], bin_name, c[1], c[2] / float(c[2] + c[3]) if c[2] + c[3] else np.nan] for c in contigs])
+
+	binsize_df = pd.DataFrame(bin_rows, columns=["Bin", "Size", "Contigs", "N50", "GC"])
+	contig_df = pd.DataFrame(contig_rows, columns=["Original_Contig_Name", "Bin", "Length", "GC"])
+
+	return [binsize_df, contig_df]
+
+
+def create_binsize_file(arguments, binsize_df, contig_df):
 	"""
 	This function creates the binsize file needed.
 	Input(s):
 	arguments are the command line arguments.
+	binsize_df is a pandas dataframe with the size, number of contigs, N50 and GC content of each bin.
+	contig_df is a pandas dataframe with the bin, length and GC content of each contig.
 	Output(s):
-	A file containing the bin size information is saved in the "output" folder.
+	Files containing the bin size and contig length information are saved in the "output" folder.
 	"""
 
-	#Run bach script to create a tab file containing the bin size information
-	bash_command = "sh " + os.path.dirname(os.path.abspath(__file__)) + "/../bash/calc_genome_size.sh " + arguments.args.fna_dir
-	os.system(bash_command)
-	#Read in  the outputted binsize tab file and add column names
-	binsize_df = pd.read_csv(arguments.args.fna_dir + "genomesize.tab", sep="\t", names=["Bin", "Size"])
-	#Save dataframe to file
-	binsize_df.to_csv(os.path.dirname(os.path.abspath(__file__)) + "/../../output/binsize_file.tsv", sep="\t", index=False)
-	#Delete unneeded tab file
-	os.remove(arguments.args.fna_dir + "genomesize.tab")
-	#Delete files created from bash script
-	for bins in glob.glob(arguments.args.fna_dir + '*.totalbp.txt'):
-		os.remove(bins)
+	#Save dataframes to file
+	table_io.write_table(binsize_df, os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + table_io.output_name("binsize_file", arguments.args.out_format))
+	table_io.write_table(contig_df, os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + table_io.output_name("contig_stats", arguments.args.out_format))
 	print("Bin size file has been created!")
 
 
+def read_depth_table(depth_file, **kwargs):
+	"""
+	This function reads a depth file without its totalAvgDepth and variance columns.
+	Input(s):
+	depth_file is a string containing the path to a txt, tsv or csv depth file.
+	kwargs are passed on to pandas.read_csv.
+	Output(s):
+	A pandas dataframe, or None if the file is not a txt, tsv or csv file.
+	"""
+
+	if 'txt' in depth_file:
+		sep = '\s+'
+	elif 'tsv' in depth_file:
+		sep = '\t'
+	elif 'csv' in depth_file:
+		sep = ','
+	else:
+		return None
+
+	#Skip the columns that are dropped anyway while parsing
+	return pd.read_csv(depth_file, sep=sep, usecols=lambda c: c != 'totalAvgDepth' and 'var' not in c, **kwargs)
+
+
+def list_depth_files(depth_dir):
+	"""
+	This function lists the depth files of a directory.
+	Input(s):
+	depth_dir is a string containing the path to the directory of depth files.
+	Output(s):
+	A sorted list containing the paths to the depth files.
+	"""
+
+	#Format directory
+	if depth_dir[-1] != '/':
+		depth_dir = depth_dir + '/'
+
+	return sorted([f for f in glob.glob(depth_dir+'*') if 'depth' in f])
+
+
+def iter_depth_files(depth_files):
+	"""
+	This function reads per-sample depth files one at a time and formats them into the long depth layout.
+	Input(s):
+	depth_files is a list containing the paths to the depth files.
+	Output(s):
+	A generator of pandas dataframes with the columns Original_Contig_Name, contigLen, Sample and Depth.
+	"""
+
+	single_sample = []
+	multi_sample = []
+
+	#Split the files on their header: one depth column per file or each bin mapped to all assemblies
+	for file in depth_files:
+		header = read_depth_table(file, nrows=0)
+		if header is None:
+			continue
+		if len(header.columns) > 3:
+			multi_sample.append(file)
+		else:
+			single_sample.append(file)
+
+	for file in single_sample + multi_sample:
+		depth_df = read_depth_table(file)
+		#Keep the contig order an outer join of the single sample files on contigName/contigLen would give
+		if file in single_sample and len(single_sample) > 1:
+			depth_df = depth_df.sort_values(['contigName', 'contigLen'], kind='mergesort')
+		yield format_depth_df(depth_df)
+
+
+def combine_depth_files(depth_files, depth_path):
+	"""
+	This function combines per-sample depth files into one long depth file, holding one input file in memory at a time.
+	Input(s):
+	depth_files is a list containing the paths to the depth files.
+	depth_path is a string containing the path to the combined depth file. Its extension sets the output format.
+	Output(s):
+	The combined depth file is written to depth_path.
+	"""
+
+	with table_io.TableWriter(depth_path) as depth_writer:
+		for depth_df in iter_depth_files(depth_files):
+			for start in range(0, len(depth_df), DEPTH_CHUNK_SIZE):
+				depth_writer.write(depth_df.iloc[start:start+DEPTH_CHUNK_SIZE])
+			del depth_df
+
+
+def format_wide_depth(depth_df):
+	"""
+	This function formats a depth dataframe with one column per sample into the long depth layout.
+	Input(s):
+	depth_df is a pandas dataframe containing the depth file in a wide format.
+	Output(s):
+	depth_df is a pandas dataframe with the columns Original_Contig_Name, contigLen, Sample and Depth.
+	"""
+
+	if 'totalAvgDepth' in depth_df.columns:
+		depth_df = depth_df.drop(columns=['totalAvgDepth'])
+	depth_df = depth_df[depth_df.columns.drop(list(depth_df.filter(regex='var')))]
+
+	return format_depth_df(depth_df)
+
+
 def create_depth_file(arguments, depth_format, depth_dir):
 	"""
 	This function creates the depth file needed.
 	Input(s):
 	arguments are the command line arguments.
-	depth_df is a dataframe containing the depth file in a wide format.
+	depth_format is a dataframe containing the depth file in a wide format, or the path to a directory of depth files.
+	depth_dir is a boolean value that is True if depth_format is a directory.
 	Output(s):
 	A file containing the depth information is saved in the "output" folder.
 	"""
 
+	depth_path = os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + table_io.output_name("depth_file", arguments.args.out_format)
+
 	#If depth txt files are not concatenated already
 	if depth_dir:
-		depth_list_1 = []
-		depth_list_2 = []
-		depth_concat_list = []
-
-		#Format directory
-		if depth_format[-1] != '/':
-			depth_format = depth_format + '/'
-		#Iterate through depth files in directory
-		for file in glob.glob(depth_format+'*'):
-			if 'depth' in file:
-				if 'txt' in file:
-					depth_df = pd.read_csv(file, sep='\s+')
-				elif 'tsv' in file:
-					depth_df = pd.read_csv(file, sep='\t')
-				elif 'csv' in file:
-					depth_df = pd.read_csv(file)
-				##If column exists, drop it
-				if 'totalAvgDepth' in depth_df.columns:
-					depth_df = depth_df.drop(columns=['totalAvgDepth'])
-				#Remove all columns containing var in them
-				depth_df = depth_df[depth_df.columns.drop(list(depth_df.filter(regex='var')))]
-				#If each bin was mapped to all assemblies
-				if len(depth_df.columns) > 3:
-					depth_df = format_depth_df(depth_df)
-					depth_list_1.append(depth_df)
-				else:
-					depth_list_2.append(depth_df)
-
-		if len(depth_list_2) > 0:
-			i = 1
-			for df in depth_list_2:
-				if i == 1:
-					depth_df = copy.deepcopy(df)
-				else:
-					depth_df = depth_df.merge(df, on=['contigName', 'contigLen'], how='outer')
-				i+=1
-			depth_df = format_depth_df(depth_df)
-			depth_concat_list.append(depth_df)
-		if len(depth_list_1) > 0:
-			depth_df = pd.concat(depth_list_1)
-			depth_concat_list.append(depth_df)
-		if len(depth_list_1) > 0 and len(depth_list_2) > 0:
-			depth_df = pd.concat(depth_concat_list)
+		combine_depth_files(list_depth_files(depth_format), depth_path)
 	else:
-		depth_df = depth_format
-		if 'totalAvgDepth' in depth_df.columns:
-			depth_df = depth_df.drop(columns=['totalAvgDepth'])
-		depth_df = depth_df[depth_df.columns.drop(list(depth_df.filter(regex='var')))]
-		depth_df = format_depth_df(depth_df)
+		depth_df = format_wide_depth(depth_format)
+		#Save dataframe to file
+		table_io.write_table(depth_df, depth_path)
 
-	#Save dataframe to file
-	depth_df.to_csv(os.path.dirname(os.path.abspath(__file__)) + "/../../output/depth_file.tsv", sep="\t", index=False)
 	print("Depth file has been created! Samples containing no depth information were removed.")
 	print("WARNING: If sample names in the \"Sample\" column does not match the other input files, it must be manually edited!")
 
@@ -174,32 +437,20 @@ def format_depth_df(depth_df):
 	return depth_df
 
 
-def create_mapping_file(arguments, bin_sample):
+def map_contigs(bin_sample, contig_df):
 	"""
-	This function creates the mapping file needed.
+	This function maps the contigs of each bin to the sampling site of the bin.
 	Input(s):
-	arguments are the command line arguments.
 	bin_sample is a dataframe mapping each bin to its respective sample.
+	contig_df is a pandas dataframe with the contig names of each bin from scan_bins.
 	Output(s):
-	A file containing the mapping information is saved in the "output" folder.
+	mapping_df is a pandas dataframe with the columns Original_Contig_Name, Bin and Sampling_Site.
 	"""
 
-	contig_lst = []
 	og_contig_lst = []
-	bin_lst = []
-
-	#Get contig names
-	for file in glob.glob(arguments.args.fna_dir+"*.fna"):
-		f = open(file, "r")
-		lines = f.readlines()
-		for l in lines:
-			if ">" in l:
-				contig_lst.append(l[1:-1])
-				#Get bin names for mapping
-				bin_lst.append(os.path.basename(file)[:-4])
 
 	#Add each contig name to each bin name in bin_sample
-	mapping_df = pd.DataFrame(zip(contig_lst, bin_lst), columns=["Original_Contig_Name", "Bin"])
+	mapping_df = contig_df[["Original_Contig_Name", "Bin"]]
 	mapping_df = mapping_df.merge(bin_sample, on="Bin", how="left")
 	mapping_df = mapping_df.dropna()
 
@@ -214,14 +465,31 @@ def create_mapping_file(arguments, bin_sample):
 		i+=1
 	mapping_df['Original_Contig_Name'] = og_contig_lst
 	mapping_df = mapping_df.dropna()
+
+	return mapping_df
+
+
+def create_mapping_file(arguments, bin_sample, contig_df):
+	"""
+	This function creates the mapping file needed.
+	Input(s):
+	arguments are the command line arguments.
+	bin_sample is a dataframe mapping each bin to its respective sample.
+	contig_df is a pandas dataframe with the contig names of each bin from scan_bins.
+	Output(s):
+	A file containing the mapping information is saved in the "output" folder.
+	"""
+
+	mapping_df = map_contigs(bin_sample, contig_df)
 	#Save dataframe to file
-	mapping_df.to_csv(os.path.dirname(os.path.abspath(__file__)) + "/../../output/mapping_file.tsv", sep="\t", index=False)
+	table_io.write_table(mapping_df, os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + table_io.output_name("mapping_file", arguments.args.out_format))
 	print("Mapping file has been created!")
 
 
 def main():
 
 	arguments = Command_line_args()
+	stage_metrics = metrics.StageMetrics.from_args('files_prep', arguments.args)
 
 	#Create output directory if not already present
 	if not os.path.exists(os.path.dirname(os.path.abspath(__file__)) + "/../../output"):
@@ -234,41 +502,57 @@ def main():
 	if arguments.args.fna_dir[-1] != "/":
 		arguments.args.fna_dir = arguments.args.fna_dir + "/"
 
-	#Check if files are tsv or csv
-	if arguments.args.bin_samples.endswith('.tsv'):
-		bin_sample_df = pd.read_csv(arguments.args.bin_samples, sep="\t")
-	elif arguments.args.bin_samples.endswith('.csv'):
-		bin_sample_df = pd.read_csv(arguments.args.bin_samples)
-	elif arguments.args.bin_samples.endswith('.txt'):
-		bin_sample_df = pd.read_csv(arguments.args.bin_samples, sep='\s+')
-	else:
+	#Check if files are tsv, csv, txt, parquet or feather
+	if table_io.table_format(arguments.args.bin_samples) is None:
 		print("Bin to sample file is not in tsv or csv format!")
 		quit()
+	with stage_metrics.phase('read') as phase:
+		bin_sample_df = table_io.read_table(arguments.args.bin_samples, default_format='tsv')
+		phase['rows_out'] = bin_sample_df
+
+	cache = stage_cache.StageCache.from_args(arguments.args)
+	output_dir = os.path.dirname(os.path.abspath(__file__)) + "/../../output/"
+	output_files = [table_io.output_name(f, arguments.args.out_format) for f in ["depth_file", "reads_file", "binsize_file", "contig_stats", "mapping_file"]]
 
 	#Create depth file
 	print("Beginning to create input files. This may take a while.")
-	if arguments.args.depth:
-		if arguments.args.depth.endswith('.tsv'):
-			depth_df = pd.read_csv(arguments.args.depth, sep="\t")
-		elif arguments.args.depth.endswith('.csv'):
-			depth_df = pd.read_csv(arguments.args.depth)
-		elif arguments.args.depth.endswith('.txt'):
-			depth_df = pd.read_csv(arguments.args.depth, sep='\s+')
-		else:
-			print("Depth file is not in tsv, csv, or txt format!")
-			quit()
-		create_depth_file(arguments, depth_df, False)
-	elif arguments.args.depth_dir:
-		create_depth_file(arguments, arguments.args.depth_dir, True)
-	else:
+	if not arguments.args.depth and not arguments.args.depth_dir:
 		print("Must have the depth or depth_dir arguments! Please rerun with the required arguments.")
 		quit()
+	depth_key = cache.key('files_prep.depth', [arguments.args.depth, arguments.args.depth_dir], {'out_format': arguments.args.out_format}, code=[__file__])
+	if not cache.fetch(depth_key, [output_dir + output_files[0]]):
+		#Depth files are read, combined and written in one phase
+		with stage_metrics.phase('depth_file'):
+			if arguments.args.depth:
+				if table_io.table_format(arguments.args.depth) is None:
+					print("Depth file is not in tsv, csv, or txt format!")
+					quit()
+				depth_df = table_io.read_table(arguments.args.depth, default_format='tsv')
+				create_depth_file(arguments, depth_df, False)
+			else:
+				create_depth_file(arguments, arguments.args.depth_dir, True)
+		cache.store(depth_key, [output_dir + output_files[0]])
 
 	#Create input files
-	create_reads_file(arguments)
-	create_binsize_file(arguments)
-	create_mapping_file(arguments, bin_sample_df)
-	print("Success!\nThe following files have been saved in the \"output\" directory:\n\ndepth_file.tsv\nreads_file.tsv\nbinsize_file.tsv\nmapping_file.tsv\n")
+	reads_key = cache.key('files_prep.reads', [arguments.args.fastq_dir], {'paired': arguments.args.paired, 'out_format': arguments.args.out_format}, code=[__file__])
+	if not cache.fetch(reads_key, [output_dir + output_files[1]]):
+		with stage_metrics.phase('reads_file'):
+			create_reads_file(arguments)
+		cache.store(reads_key, [output_dir + output_files[1]])
+	#Scan the bin fasta files once for the bin sizes and contig-to-bin mapping
+	fasta_files = [output_dir + f for f in output_files[2:]]
+	fasta_key = cache.key('files_prep.fasta', [arguments.args.fna_dir, arguments.args.bin_samples], {'out_format': arguments.args.out_format}, code=[__file__])
+	if not cache.fetch(fasta_key, fasta_files):
+		with stage_metrics.phase('read') as phase:
+			binsize_df, contig_df = scan_bins(arguments.args.fna_dir, arguments.args.threads)
+			phase['rows_out'] = contig_df
+		#The contigs are mapped to their samples as the mapping file is written
+		with stage_metrics.phase('write', contig_df):
+			create_binsize_file(arguments, binsize_df, contig_df)
+			create_mapping_file(arguments, bin_sample_df, contig_df)
+		cache.store(fasta_key, fasta_files)
+	stage_metrics.finish()
+	print("Success!\nThe following files have been saved in the \"output\" directory:\n\n" + "\n".join(output_files) + "\n")
 	print("WARNING: Verify that all the scaffold names in the depth and mapping files under the \"Original_Contig_Name\" column are formatted the same. If not, double check the headers in the initial depth file(s) used.\n")
 
 
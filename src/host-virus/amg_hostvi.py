@@ -12,38 +12,313 @@
 # ------------------------------
 
 import argparse
+import functools
 import glob
+import multiprocessing
 import numpy as np
 import os
 import pandas as pd
 import re
+from scipy import sparse
+import sys
 
-def format_vibrant(vibrant_df, vibrant_name):
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from utils import annotation_store
+from utils import metrics
+from utils import profile_io
+from utils import stage_cache
+from utils import table_io
+
+
+#Database columns of the dense metabolic profile
+PROFILE_DATABASES = ['KEGG', 'COG', 'PFAM', 'EC_NUMBER']
+#Sample name in the name of each Vibrant file
+VIBRANT_SAMPLE_REGEX = re.compile('individuals_(.+?)_scaffold')
+#Pathway column of each database in the Vibrant files
+VIBRANT_COLUMNS = {'KEGG': 'AMG KO', 'PFAM': 'Pfam'}
+
+
+def vibrant_sample(vibrant_name):
 	"""
-	This function formats the Vibrant scaffold names by adding the sampling_site name as a prefix.
+	This function gets the sample name of a Vibrant file.
 	Input(s):
-	vibrant_df is a pandas dataframe of the Vibrant output.
 	vibrant_name is a string of the name of the vibrant file.
 	Output(s):
-	vibrant_df is a pandas datafrmae that has been modified to include a Sample column and an altered scaffold column.
+	A string of the sample name.
+	"""
+
+	return VIBRANT_SAMPLE_REGEX.search(vibrant_name).group(1)
+
+
+def load_vibrant(vibrant, columns):
+	"""
+	This function reads the columns used from one Vibrant file.
+	Input(s):
+	vibrant is a string containing the path to a Vibrant AMG file.
+	columns is a list of the pathway columns to read.
+	Output(s):
+	sample_name is a string of the sample name.
+	column_values is a list of numpy arrays: the scaffolds prefixed with the sample name, then each pathway column.
+	"""
+
+	sample_name = vibrant_sample(os.path.basename(vibrant))
+	vibrant_df = pd.read_csv(vibrant, sep='\t', index_col=False, usecols=['scaffold'] + columns, dtype={c: str for c in ['scaffold'] + columns})
+	column_values = [(sample_name + '_' + vibrant_df['scaffold']).to_numpy(dtype=object)] + [vibrant_df[c].to_numpy(dtype=object) for c in columns]
+
+	return [sample_name, column_values]
+
+
+def read_vibrant(vibrant_file=None, vibrant_path=None, database=None, threads=8):
+	"""
+	This function reads the Vibrant output of one sample or of every sample in a directory.
+	Input(s):
+	vibrant_file is a string containing the path to a Vibrant AMG file.
+	vibrant_path is a string containing the path to a directory of Vibrant AMG files, used if vibrant_file is not given.
+	database is a string containing the database analyzed: KEGG or PFAM. Both pathway columns are read if None.
+	threads is the number of Vibrant files read at the same time.
+	Output(s):
+	phage_df is a pandas dataframe of the scaffold, pathway and Sample columns of the Vibrant output.
+	"""
+
+	if database is None:
+		columns = list(VIBRANT_COLUMNS.values())
+	else:
+		columns = [VIBRANT_COLUMNS[database]]
+
+	if vibrant_file:
+		vibrant_files = [vibrant_file]
+	else:
+		if vibrant_path[-1] != '/':
+			vibrant_path = vibrant_path + '/'
+		vibrant_files = glob.glob(vibrant_path + "VIBRANT_AMG*")
+
+	#Read each vibrant file in a separate process
+	loader = functools.partial(load_vibrant, columns=columns)
+	if threads > 1 and len(vibrant_files) > 1:
+		with multiprocessing.Pool(processes=min(threads, len(vibrant_files))) as pool:
+			loaded = pool.map(loader, vibrant_files)
+	else:
+		loaded = [loader(vibrant) for vibrant in vibrant_files]
+
+	#Fill each column once instead of concatenating the tables of every file
+	lengths = [len(column_values[0]) for sample_name, column_values in loaded]
+	bounds = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+	phage_columns = {}
+	for index, column in enumerate(['scaffold'] + columns):
+		values = np.empty(bounds[-1], dtype=object)
+		for (sample_name, column_values), start, end in zip(loaded, bounds[:-1], bounds[1:]):
+			values[start:end] = column_values[index]
+		phage_columns[column] = values
+	phage_columns['Sample'] = np.repeat(np.array([sample_name for sample_name, column_values in loaded], dtype=object), lengths)
+	phage_df = pd.DataFrame(phage_columns)
+
+	return phage_df
+
+
+def normalize_ids(ids, database):
+	"""
+	This function formats the Vibrant pathway names like the metabolic profile: KO:K00001 for KEGG and pfam00001 for PFAM.
+	Input(s):
+	ids is a pandas series of the Vibrant pathway names.
+	database is a string containing the database to analyze: KEGG or PFAM.
+	Output(s):
+	A pandas series of the formatted pathway names.
+	"""
+
+	ids = ids.astype(object)
+	if database == 'KEGG':
+		return ids.where(ids.str.startswith('KO:', na=True), 'KO:' + ids)
+	elif database == 'PFAM':
+		return ids.where(ids.str.startswith('pfam', na=True), 'pfam' + ids.str[2:])
+
+	return ids
+
+
+def sparse_profile(host_df, database):
+	"""
+	This function converts the metabolic profile, or a chunk of its rows, to a sparse matrix of counts.
+	Input(s):
+	host_df is a pandas dataframe of the metabolic profile with the counts of each pathway per bin.
+	database is a string containing the database to analyze: KEGG or PFAM.
+	Output(s):
+	pathways is a numpy array of the pathway of each row.
+	bins is a list of the bin of each column.
+	counts is a scipy.sparse csr matrix of the counts of each pathway per bin.
+	"""
+
+	#Drop the other database columns, the scaffolds without a bin and the totals, whichever of them
+	#the profile has, as SparseProfile.host_counts does for the long and sparse layouts
+	host_df = host_df.drop(columns=[col for col in PROFILE_DATABASES + ['NoBin', 'Total'] if col != database], errors='ignore')
+	bins = [col for col in host_df.columns.tolist() if col != database]
+	if database not in host_df.columns:
+		return [np.empty(0, dtype=object), bins, sparse.csr_matrix((0, len(bins)))]
+	host_df = host_df.dropna()
+
+	counts = sparse.csr_matrix(host_df[bins].to_numpy(dtype=float))
+
+	return [host_df[database].to_numpy(dtype=object), bins, counts]
+
+
+def read_host_profile(pathway_database, database, chunksize=1000):
+	"""
+	This function reads the metabolic profile into a sparse matrix. Dense profiles are read a chunk of rows at a time, so the dense table is never held in memory.
+	Input(s):
+	pathway_database is a string containing the path to the metabolic profile, in the dense, long or sparse layout of metabolic_profile.py.
+	database is a string containing the database to analyze: KEGG or PFAM.
+	chunksize is the number of rows of the metabolic profile read at a time.
+	Output(s):
+	pathways is a numpy array of the pathway of each row.
+	bins is a list of the bin of each column.
+	counts is a scipy.sparse csr matrix of the counts of each pathway per bin.
+	"""
+
+	#Long and sparse profiles already only hold the nonzero counts
+	if profile_io.profile_layout(pathway_database) != 'dense':
+		return profile_io.read_profile(pathway_database).host_counts(database)
+
+	pathway_list = []
+	count_list = []
+	bins = []
+	for chunk in table_io.iter_table(pathway_database, chunksize, default_format='tsv', index_col=False):
+		pathways, bins, counts = sparse_profile(chunk, database)
+		pathway_list.append(pathways)
+		count_list.append(counts)
+
+	if not count_list:
+		return [np.empty(0, dtype=object), bins, sparse.csr_matrix((0, 0))]
+
+	return [np.concatenate(pathway_list), bins, sparse.vstack(count_list, format='csr')]
+
+
+def read_store_profile(store_path, database, bins=None):
+	"""
+	This function counts the pathways of each bin from an annotation store instead of reading the metabolic profile.
+	Input(s):
+	store_path is a string containing the path to an annotation store built with a bin map.
+	database is a string containing the database to analyze: KEGG or PFAM.
+	bins is a list of the bins to read. Every bin is read if None.
+	Output(s):
+	pathways is a numpy array of the pathway of each row.
+	bins is a list of the bin of each column.
+	counts is a scipy.sparse csr matrix of the counts of each pathway per bin.
+	"""
+
+	if not os.path.isfile(store_path):
+		raise ValueError('The annotation store ' + store_path + ' does not exist!')
+
+	with annotation_store.AnnotationStore(store_path) as store:
+		counts_df = store.bin_counts(database, bins)
+
+	return profile_io.SparseProfile.from_long(counts_df).host_counts(database)
+
+
+def profile_pairs(pathways, bins, counts, database):
+	"""
+	This function lists the pathways present in each bin, without creating a row for every pathway and bin.
+	Input(s):
+	pathways is a numpy array of the pathway of each row of the counts.
+	bins is a list of the bin of each column of the counts.
+	counts is a scipy.sparse matrix of the counts of each pathway per bin.
+	database is a string containing the database to analyze: KEGG or PFAM.
+	Output(s):
+	host_df is a pandas dataframe with the database, Bin and Sample columns, ordered by bin and then by pathway like pandas.melt.
 	"""
 
-	sample_name = re.search('individuals_(.+?)_scaffold', vibrant_name).group(1)
-	vibrant_df['Sample'] = sample_name
-	vibrant_df['scaffold'] = sample_name + '_' + vibrant_df['scaffold']
+	#Column major order, with the nonzero rows of each bin sorted
+	counts = sparse.csc_matrix(counts)
+	counts.eliminate_zeros()
+	counts.sort_indices()
+	cols = np.repeat(np.arange(len(bins)), np.diff(counts.indptr))
+	rows = counts.indices
 
-	return vibrant_df
+	#Sample of each bin, extracted once per bin
+	bin_names = pd.Series(bins, dtype=object)
+	samples = bin_names.str.extract('(.+?)_Bin', expand=False).to_numpy(dtype=object)
+	host_df = pd.DataFrame({database: pathways[rows], 'Bin': bin_names.to_numpy(dtype=object)[cols], 'Sample': samples[cols]})
+
+	return host_df
+
+
+def compare_metabolism(host_df, phage_df, database):
+	"""
+	This function determines if the metabolic pathways of phages (scaffolds) are present in their hosts (bins).
+	Input(s):
+	host_df is a pandas dataframe of the metabolic profile with the counts of each pathway per bin.
+	phage_df is a pandas dataframe of the Vibrant output from read_vibrant.
+	database is a string containing the database to analyze: KEGG or PFAM.
+	Output(s):
+	phage_host_df is a pandas dataframe mapping each pathway to the bins and scaffolds it is present in.
+	phage_host_mapping_df is a pandas dataframe with the bins and scaffolds sharing a pathway.
+	"""
+
+	#Only keep the pathways present in each bin
+	host_df = profile_pairs(*sparse_profile(host_df, database), database)
+
+	return join_metabolism(host_df, phage_df, database)
+
+
+def join_metabolism(host_df, phage_df, database):
+	"""
+	This function joins the pathways present in the bins (hosts) with the pathways of the phages (scaffolds).
+	Input(s):
+	host_df is a pandas dataframe of the pathways present in each bin from profile_pairs.
+	phage_df is a pandas dataframe of the Vibrant output from read_vibrant.
+	database is a string containing the database to analyze: KEGG or PFAM.
+	Output(s):
+	phage_host_df is a pandas dataframe mapping each pathway to the bins and scaffolds it is present in.
+	phage_host_mapping_df is a pandas dataframe with the bins and scaffolds sharing a pathway.
+	"""
+
+	#Rename database columns
+	if database == 'KEGG':
+		phage_df = phage_df.rename(columns={'AMG KO': 'KEGG'})
+	elif database == 'PFAM':
+		phage_df = phage_df.rename(columns={'Pfam': 'PFAM'})
+	#Change pathway name format of all the rows at once
+	phage_df = phage_df[['scaffold', 'Sample', database]].copy()
+	phage_df[database] = normalize_ids(phage_df[database], database)
+
+	#Join the two dataframes, recording which of them each row comes from
+	phage_host_df = host_df.merge(phage_df, on=['Sample', database], how='outer', indicator='Presence')
+	phage_host_df = phage_host_df.drop(columns=['Sample'])
+	#Pathways only in the scaffolds, only in the bins or in both
+	presence = phage_host_df['Presence'].map({'right_only': 'phage', 'left_only': 'host', 'both': 'both'})
+	phage_host_df['Presence'] = presence.astype(object)
+	#Order rows by presence: phage, host, then both
+	order = pd.Categorical(presence, categories=['phage', 'host', 'both']).codes
+	phage_host_df = phage_host_df.iloc[np.argsort(order, kind='stable')]
+
+	phage_host_mapping_df = phage_host_df
+	#Only keep the bins mapped to scaffolds
+	if database == 'KEGG':
+		phage_host_mapping_df = phage_host_df[phage_host_df['Presence'] == 'both'].drop(columns=['Presence', 'KEGG'])
+	elif database == 'PFAM':
+		phage_host_mapping_df = phage_host_df[phage_host_df['Presence'] == 'both'].drop(columns=['Presence', 'PFAM'])
+
+	return [phage_host_df, phage_host_mapping_df]
 
 
 def main():
 
 	#Command line arguments
 	parser = argparse.ArgumentParser()
-	parser.add_argument('-p','--pathway_database', required=True, help="Input file in tsv format that contains the counts of each pathway per bin.")
+	parser.add_argument('-p','--pathway_database', required=False, help="Input file from metabolic_profile.py that contains the counts of each pathway per bin, in the dense, long or sparse (.npz) layout.")
 	parser.add_argument('-vf', '--vibrant_file', required=False, help="Input file from Vibrant in tsv format that contains phage scaffolds mapped to metabolic pathways.")
 	parser.add_argument('-vp', '--vibrant_path', required=False, help="Input path from Vibrant files in tsv format that contains phage scaffolds mapped to metabolic pathways.")
 	parser.add_argument('-d', '--database', required=True, help="Input only one of the following database names the user is interested in analyzing: KEGG or PFAM.")
+	parser.add_argument('-c', '--chunksize', required=False, default=1000, type=int, help='Number of rows of the metabolic profile read at a time [1000].')
+	parser.add_argument('-t', '--threads', required=False, default=8, type=int, help='Number of Vibrant files read at the same time [8].')
+	annotation_store.add_store_argument(parser, 'SQLite annotation store built by gff3_img5.py --store with a bin map, the pathways of each bin are counted from it instead of --pathway_database')
+	parser.add_argument('-b', '--bins', required=False, default='', help='Host bins read from --annotation_store, comma separated or in a file with one bin per line. Leave blank to read every bin.')
+	table_io.add_format_argument(parser)
+	stage_cache.add_cache_arguments(parser)
+	metrics.add_metrics_arguments(parser)
 	args = parser.parse_args()
+	stage_metrics = metrics.StageMetrics.from_args('amg_hostvi', args)
+
+	if not args.pathway_database and not args.annotation_store:
+		print('Either --pathway_database or --annotation_store is needed!')
+		quit()
 
 	#Create output directory if not already present
 	if not os.path.exists(os.path.dirname(os.path.abspath(__file__)) + "/../../output"):
@@ -51,98 +326,41 @@ def main():
 
 	drop_list = []
 
+	#Reuse the previous outputs if the inputs and database did not change
+	output_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../output/'
+	output_files = [output_dir + table_io.output_name('phage_host_metabolism', args.out_format), output_dir + table_io.output_name('phage_host_mapping', args.out_format)]
+	cache = stage_cache.StageCache.from_args(args)
+	bins = annotation_store.parse_names(args.bins)
+	cache_key = cache.key('amg_hostvi', [args.pathway_database, args.annotation_store, args.vibrant_file, args.vibrant_path], {'database': args.database.upper(), 'out_format': args.out_format, 'bins': bins}, code=[__file__])
+	if cache.fetch(cache_key, output_files):
+		stage_metrics.finish('cached')
+		return
+
 	print("Beginning to analyze phage and host metabolisms.")
 
 	#Read in input files
 	database = args.database.upper()
-	host_df = pd.read_csv(args.pathway_database, sep='\t', index_col=False)
-	#Drop unneeded database columns
-	if 'EC_NUMBER' in host_df.columns.tolist():
-		host_df = host_df.drop(columns=['EC_NUMBER'])
-	if 'COG' in host_df.columns.tolist():
-		host_df = host_df.drop(columns=['COG'])
-	if 'PFAM' in host_df.columns.tolist() and database != 'PFAM':
-		host_df = host_df.drop(columns=['PFAM'])
-	elif 'KEGG' in host_df.columns.tolist() and database != 'KEGG':
-		host_df = host_df.drop(columns=['KEGG'])
-	host_df = host_df.drop(columns=['NoBin', 'Total'])
-	host_df = host_df.dropna()
-
-	#Read in vibrant output
-	if args.vibrant_file:
-		phage_df = pd.read_csv(args.vibrant_file, sep='\t')
-		phage_df = format_vibrant(phage_df, args.vibrant_file.split('/')[-1])
-	else:
-		vibrant_list = []
-
-		if args.vibrant_path[-1] != '/':
-			vibrant_path = args.vibrant_path + '/'
+	with stage_metrics.phase('read') as phase:
+		#Only the pathways present in each bin are kept from the metabolic profile
+		if args.pathway_database:
+			host_df = profile_pairs(*read_host_profile(args.pathway_database, database, args.chunksize), database)
 		else:
-			vibrant_path = args.vibrant_path
-		#Format each vibrant file in directory and concatenate
-		for vibrant in glob.glob(vibrant_path + "VIBRANT_AMG*"):
-			vibrant_df = pd.read_csv(vibrant, sep='\t', index_col=False)
-			vibrant_df = format_vibrant(vibrant_df, vibrant.split('/')[-1])
-			vibrant_list.append(vibrant_df)
-		phage_df = pd.concat(vibrant_list)
-
-	#Format metabolic profile into two columns: KEGG pathways and Bins
-	host_df = pd.melt(host_df, id_vars=database, value_vars=host_df.columns.tolist()[1:])
-	host_df = host_df.rename(columns={'variable': 'Bin'})
-	#Drop rows that do not have KEGG pathways in bins
-	host_df = host_df[host_df.value != 0]
-	host_df = host_df.drop(columns=['value'])
-
-	#Add Sample column to metabolic profile (host dataframe)
-	host_df['Sample'] = host_df['Bin'].str.extract('(.+?)_Bin', expand=False)
+			host_df = profile_pairs(*read_store_profile(args.annotation_store, database, bins), database)
+		phage_df = read_vibrant(args.vibrant_file, args.vibrant_path, database, args.threads)
+		phase['rows_out'] = len(host_df) + len(phage_df)
 
-	#Rename database columns
-	if database == 'KEGG':
-		phage_df = phage_df.rename(columns={'AMG KO': 'KEGG'})
-	elif database == 'Pfam':
-		phage_df = phage_df.rename(columns={'Pfam': 'PFAM'})
-	#Change pathway name format
-	for val in phage_df[database]:
-		if database == 'KEGG':
-			if val[:3] != 'KO:':
-				phage_df.loc[phage_df[database] == val, database] = 'KO:' + val
-		elif database == 'PFAM':
-			if val[:4] != 'pfam':
-				phage_df.loc[phage_df[database] == val, database] = 'pfam' + val[2:]
-
-	#Join the two dataframes
-	phage_host_df = host_df.merge(phage_df[['scaffold', 'Sample', database]], on=['Sample', database], how='outer')
-	phage_host_df = phage_host_df.fillna(np.nan)
-
-	print('Determining if phages and hosts have common metabolic pathways. This may take a while. Ignore any warnings.')
-	phage_host_df = phage_host_df.drop(columns=['Sample'])
-	#Create new column determining presence of metabolic pathway
-	phage_host_df['Presence'] = np.nan
-	#Subset dataframe to alter "Presence" column accordingly
-	#Scaffold dataframe
-	dfp = phage_host_df[(phage_host_df['Bin'].isnull()) & (phage_host_df['scaffold'].notnull())]
-	dfp['Presence'] = 'phage'
-	#Bins dataframe
-	dfh = phage_host_df[(phage_host_df['scaffold'].isnull()) & (phage_host_df['Bin'].notnull())]
-	dfh['Presence'] = 'host'
-	#Dataframe containing both bins and scaffolds
-	dfb = phage_host_df[(phage_host_df['scaffold'].notnull()) & (phage_host_df['Bin'].notnull())]
-	dfb['Presence'] = 'both'
-	phage_host_df = pd.concat([dfp, dfh, dfb])
-
-	#Drop all rows with NaN in the Presence column
-	phage_host_df = phage_host_df.dropna(subset=['Presence'])
-	#Save file
-	phage_host_df.to_csv(os.path.dirname(os.path.abspath(__file__)) + '/../../output/phage_host_metabolism.tsv', sep='\t', index=False)
+	print('Determining if phages and hosts have common metabolic pathways.')
+	with stage_metrics.phase('merge', len(host_df) + len(phage_df)) as phase:
+		phage_host_df, phage_host_mapping_df = join_metabolism(host_df, phage_df, database)
+		phase['rows_out'] = phage_host_df
 
-	#Only keep the bins mapped to scaffolds
-	if database == 'KEGG':
-		phage_host_df = phage_host_df[phage_host_df['Presence'] == 'both'].drop(columns=['Presence', 'KEGG'])
-	elif database == 'PFAM':
-		phage_host_df = phage_host_df[phage_host_df['Presence'] == 'both'].drop(columns=['Presence', 'PFAM'])
-	#Save file
-	phage_host_df.to_csv(os.path.dirname(os.path.abspath(__file__)) + '/../../output/phage_host_mapping.tsv', sep='\t', index=False)
-	print("Success!\nThe following files have been saved in the \"output\" directory:\n\nphage_host_metabolism.tsv\nphage_host_mapping.tsv\n")
+	#Save files
+	with stage_metrics.phase('write', len(phage_host_df) + len(phage_host_mapping_df)):
+		table_io.write_table(phage_host_df, output_files[0], index=False)
+		table_io.write_table(phage_host_mapping_df, output_files[1], index=False)
+	cache.store(cache_key, output_files)
+	stage_metrics.finish()
+	print("Success!\nThe following files have been saved in the \"output\" directory:\n\n" + "\n".join([os.path.basename(f) for f in output_files]) + "\n")
 
 if __name__ == "__main__":
 	main()
@@ -18,62 +18,92 @@ import logging
 from datetime import datetime
 import numpy as np
 import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from utils import metrics
+from utils import table_io
+#------------------------------------------------------------------------------
+#Columns of the CRT output
+CRT_COLUMNS = ['gold_contig_id', 'crispr_no', 'position', 'repeat', 'spacer']
+#------------------------------------------------------------------------------
+def crt_frame(crt_df):
+    """
+    Convert CRT rows to a dataframe with one row per repeat and the spacer
+    following it. crispr is a categorical of the CRISPR IDs in the order they
+    appear, element numbers the repeats of each CRISPR, and only the lengths
+    of the repeats are kept.
+    """
+    crispr_codes, crispr_ids = pd.factorize(crt_df['gold_contig_id'] + '|CRISPR-' + crt_df['crispr_no'])
+    crispr_df = pd.DataFrame({
+        'crispr': pd.Categorical.from_codes(crispr_codes, categories = crispr_ids),
+        'gold_contig_id': pd.Categorical(crt_df['gold_contig_id']),
+        'element': pd.Series(crispr_codes).groupby(crispr_codes).cumcount().to_numpy(dtype = np.int32),
+        'repeat_length': crt_df['repeat'].str.len().to_numpy(dtype = np.int32),
+        #Exclude entries where the spacer is missing
+        'spacer': crt_df['spacer'].where(crt_df['spacer'] != 'c').to_numpy(dtype = object)})
+    crispr_df['spacer_length'] = crispr_df['spacer'].str.len().fillna(0).to_numpy(dtype = np.int32)
+
+    return crispr_df
+#------------------------------------------------------------------------------
+def crt_reader(crt_file, chunksize = None):
+    """
+    Read the CRT columns used, all at once or chunksize rows at a time.
+    """
+    return pd.read_csv(crt_file, sep = r'\s+', header = None,
+        names = CRT_COLUMNS, usecols = ['gold_contig_id', 'crispr_no', 'repeat', 'spacer'],
+        dtype = object, chunksize = chunksize)
 #------------------------------------------------------------------------------
 def read_crt(crt_file):
     """
-    Read CRISPR Recognition Tool output and return a dictionary.
+    Read CRISPR Recognition Tool output and return a dataframe with one row per
+    repeat and the spacer following it (see crt_frame).
     """
     try:
-        crt_handle = open(crt_file, 'r')
         logging.info('opening CRT input...')
+        try:
+            crt_df = crt_reader(crt_file)
+        except pd.errors.EmptyDataError:
+            crt_df = pd.DataFrame(columns = CRT_COLUMNS, dtype = object)
 
-        crispr_dict = dict()
-        repeat_no = 0
-        spacer_no = 0
-
-        for feature in crt_handle:
-            feature_list = feature.strip().split()
-            gold_contig_id = feature_list[0]
-            crispr_no = feature_list[1]
-            repeat_seq = feature_list[3]
-            spacer_seq = feature_list[4]
-
-            crispr_id = '{}|CRISPR-{}'.format(gold_contig_id, crispr_no)
-
-            if crispr_id in crispr_dict.keys():
-                repeat_no += 1
-                spacer_no += 1
-
-            else:
-                crispr_dict[crispr_id] = {}
-                repeat_no = 0
-                spacer_no = 0
-
-
-            repeat_id = 'repeat-{}'.format(repeat_no)
-            spacer_id = 'spacer-{}'.format(spacer_no)
-
-            crispr_dict[crispr_id]['gold_contig_id'] = gold_contig_id
-            crispr_dict[crispr_id][repeat_id] = repeat_seq
-
-            #Exclude entries where the spacer is missing
-            if not spacer_seq == 'c':
-                crispr_dict[crispr_id][spacer_id] = spacer_seq
-            else:
-                pass
-
-        crt_handle.close()
-
-        return crispr_dict
+        return crt_frame(crt_df)
 
     except IOError as e:
         logging.exception('cannot open file {}'.format(crt_file))
         print('ERROR: cannot open file {}'.format(crt_file))
         return None
 #------------------------------------------------------------------------------
-def crispr_quality(crispr_dict, min_spc, min_rep, n_rep, min_rep_warn = 7, n_rep_warn = 2):
+def iter_crt(crt_file, chunksize = 100000):
     """
-    Filter out poor-quality CRISPRs, return a dictionary of retained CRISPR info.
+    Read CRISPR Recognition Tool output chunksize rows at a time and yield
+    dataframes of complete CRISPR arrays (see crt_frame). The rows of an array
+    are contiguous in CRT output, so the last array of a chunk is held back
+    until the next chunk shows it is complete.
+    """
+    try:
+        reader = crt_reader(crt_file, chunksize)
+    except pd.errors.EmptyDataError:
+        return
+
+    partial = None
+    for crt_df in reader:
+        if len(crt_df) == 0:
+            continue
+        if partial is not None:
+            crt_df = pd.concat([partial, crt_df], ignore_index = True)
+        #Rows of the last array of the chunk
+        last = ((crt_df['gold_contig_id'] == crt_df['gold_contig_id'].iloc[-1]) &
+            (crt_df['crispr_no'] == crt_df['crispr_no'].iloc[-1])).to_numpy()
+        first_last = len(crt_df) - np.argmin(last[::-1]) if not last.all() else 0
+        partial = crt_df.iloc[first_last:]
+        if first_last > 0:
+            yield crt_frame(crt_df.iloc[:first_last])
+
+    if partial is not None and len(partial) > 0:
+        yield crt_frame(partial)
+#------------------------------------------------------------------------------
+def log_quality_settings(min_spc, min_rep, n_rep, min_rep_warn = 7, n_rep_warn = 2):
+    """
+    Log the CRISPR quality thresholds, with a warning for permissive ones.
     """
 
     logging.info('filtering poor-quality CRISPRs:')
@@ -81,94 +111,120 @@ def crispr_quality(crispr_dict, min_spc, min_rep, n_rep, min_rep_warn = 7, n_rep
     logging.info('minimum repeat length: {}'.format(min_rep))
     logging.info('minimum number of repeats: {}'.format(n_rep))
 
-    rm_crispr = []
     spurious = 'Output may be sourced from spurious CRISPRs.'
     if min_rep < min_rep_warn:
         logging.warning('WARNING: a minimum repeat length >= {} is recommended. {}'.format(min_rep_warn, spurious))
     if n_rep < n_rep_warn:
         logging.warning('WARNING: CRISPRs should contain >= {} repeats. {}'.format(n_rep_warn, spurious))
-
-    for crispr, feature in crispr_dict.items():
-        if isinstance(feature, dict):
-            repeats = [r for r in feature.keys() if r.startswith('repeat')]
-            spacers = [s for s in feature.keys() if s.startswith('spacer')]
-
-            if len(repeats) < n_rep:
-                logging.info('{} will be ignored; number of repeats < {}'.format(crispr, n_rep))
-                rm_crispr.append(crispr)
-
-            elif any([len(feature[spacer]) < min_spc for spacer in spacers]):
-                logging.info('{} will be ignored; contains spacer(s) of length < {} bp'.format(crispr, min_spc))
-                rm_crispr.append(crispr)
-
-            elif any([len(feature[repeat]) < min_rep for repeat in repeats]):
-                logging.info('{} will be ignored; contains repeat(s) of length < {} bp'.format(crispr, min_rep))
-                rm_crispr.append(crispr)
-            else:
-                pass
-    if rm_crispr:
-        rm_crispr = set(rm_crispr)
-        logging.info('{} CRISPR did not pass quality check'.format(len(rm_crispr)))
-
-        for rc in rm_crispr:
-            crispr_dict.pop(rc, None)
+#------------------------------------------------------------------------------
+def quality_filter(crispr_df, min_spc, min_rep, n_rep):
+    """
+    Remove the poor-quality CRISPRs from a dataframe of read_crt, return the
+    retained rows and a table of the number of CRISPRs removed for each reason.
+    """
+    #Per CRISPR counts, indexed by the codes of the crispr column
+    codes = crispr_df['crispr'].cat.codes.to_numpy()
+    ncrispr = len(crispr_df['crispr'].cat.categories)
+    repeats = np.bincount(codes, minlength = ncrispr)
+    short_spacers = np.bincount(codes, weights = (crispr_df['spacer'].notna() & (crispr_df['spacer_length'] < min_spc)).to_numpy(), minlength = ncrispr)
+    short_repeats = np.bincount(codes, weights = (crispr_df['repeat_length'] < min_rep).to_numpy(), minlength = ncrispr)
+
+    #The first failed check is the reason a CRISPR is removed
+    reasons = ['number of repeats < {}'.format(n_rep),
+        'contains spacer(s) of length < {} bp'.format(min_spc),
+        'contains repeat(s) of length < {} bp'.format(min_rep)]
+    checks = [repeats < n_rep, short_spacers > 0, short_repeats > 0]
+    reason_codes = np.select(checks, np.arange(len(reasons)), default = -1)
+    summary_df = pd.DataFrame({'reason':reasons,
+        'CRISPRs':np.bincount(reason_codes[reason_codes >= 0], minlength = len(reasons))})
+
+    if summary_df['CRISPRs'].sum():
+        crispr_df = crispr_df[reason_codes[codes] < 0]
+
+    return crispr_df, summary_df
+#------------------------------------------------------------------------------
+def log_rejections(summary_df):
+    """
+    Log the table of the number of CRISPRs removed for each reason.
+    """
+    nremoved = int(summary_df['CRISPRs'].sum())
+    if nremoved:
+        logging.info('{} CRISPR did not pass quality check:\n{}'.format(nremoved, summary_df.to_string(index = False)))
     else:
         logging.info('no CRISPRs will be removed due to quality check')
+#------------------------------------------------------------------------------
+def crispr_quality(crispr_df, min_spc, min_rep, n_rep, min_rep_warn = 7, n_rep_warn = 2):
+    """
+    Filter out poor-quality CRISPRs, return a dataframe of retained CRISPR info
+    and a table of the number of CRISPRs removed for each reason.
+    """
+    log_quality_settings(min_spc, min_rep, n_rep, min_rep_warn, n_rep_warn)
+    crispr_df, summary_df = quality_filter(crispr_df, min_spc, min_rep, n_rep)
+    log_rejections(summary_df)
 
-    return crispr_dict
+    return crispr_df, summary_df
 #------------------------------------------------------------------------------
 def img_bin_map(img_map, crispr_contigs):
     """
     Return a dictionary of contig IDs mapped to a Bin/MAG
-    containing a CRISPR array.
+    containing a CRISPR array, or of every contig if crispr_contigs is None.
     """
-    try:
-        bm_df = pd.read_csv(img_map, sep = '\t', compression = 'infer')
-    except:
-        logging.error('could not read IMG bin map input file {}'.format(img_map))
+    #The map can also be passed as a dataframe, e.g. by metagaia.py
+    if isinstance(img_map, pd.DataFrame):
+        bm_df = img_map.copy()
+    else:
+        try:
+            bm_df = table_io.read_table(img_map, default_format = 'tsv', compression = 'infer')
+        except:
+            logging.error('could not read IMG bin map input file {}'.format(img_map))
 
     bm_df['bin_contig'] = bm_df['Bin'] + '|' + bm_df['Original_Contig_Name']
-    bm_df = bm_df[bm_df['IMG_Contig_Name'].isin(crispr_contigs)]
+    if crispr_contigs is not None:
+        bm_df = bm_df[bm_df['IMG_Contig_Name'].isin(crispr_contigs)]
 
-    bm_dict = bm_df[['bin_contig', 'IMG_Contig_Name']].set_index('IMG_Contig_Name').T.to_dict('list')
+    bm_dict = dict(zip(bm_df['IMG_Contig_Name'], [[bin_contig] for bin_contig in bm_df['bin_contig']]))
 
     return bm_dict
 #------------------------------------------------------------------------------
-def write_spacer_fasta(crispr_dict, spacer_fasta, id_change=None):
+def fasta_records(crispr_df, id_change=None):
     """
-    Write an output FASTA file of CRISPR spacer sequences.
+    Format the spacers of a dataframe of read_crt as FASTA records, return the
+    text, the number of spacers and the number of CRISPR IDs changed.
     """
+    spacer_df = crispr_df[crispr_df['spacer'].notna()]
+    codes = spacer_df['crispr'].cat.codes.to_numpy()
+    #Spacers of each CRISPR together, in the order the CRISPRs appear
+    if not pd.Index(codes).is_monotonic_increasing:
+        order = np.argsort(codes, kind = 'stable')
+        spacer_df = spacer_df.iloc[order]
+        codes = codes[order]
+
+    #CRISPR IDs are prefixed with their bin and contig once per CRISPR
+    crispr_ids = pd.Series(spacer_df['crispr'].cat.categories, dtype = object)
+    changed = 0
     if id_change:
-        changed = []
-    else:
-        pass
-
+        crispr_contigs = crispr_ids.str.split('|', n = 1).str[0]
+        bin_contigs = crispr_contigs.map(lambda contig: id_change[contig][0] if contig in id_change else np.nan).astype(object)
+        changed = int(bin_contigs.notna()[np.unique(crispr_df['crispr'].cat.codes.to_numpy())].sum())
+        crispr_ids = (bin_contigs + '|' + crispr_ids).fillna(crispr_ids)
+
+    #Header and sequence lines alternate
+    lines = np.empty(2 * len(spacer_df), dtype = object)
+    lines[0::2] = '>' + crispr_ids.to_numpy()[codes] + '|spacer-' + spacer_df['element'].astype(str).to_numpy(dtype = object)
+    lines[1::2] = spacer_df['spacer'].to_numpy()
+    text = '\n'.join(lines) + '\n' if len(lines) else ''
+
+    return text, len(spacer_df), changed
+#------------------------------------------------------------------------------
+def write_spacer_fasta(crispr_df, spacer_fasta, id_change=None):
+    """
+    Write an output FASTA file of CRISPR spacer sequences.
+    """
     try:
         fasta_handle = open(spacer_fasta, 'w')
-        nspacers = 0
-
-        for crispr, feature in crispr_dict.items():
-            if id_change:
-                gold_oid = crispr.split('|')[0]
-                if gold_oid in id_change.keys():
-                    crispr = '{}|{}'.format(id_change[gold_oid][0], crispr)
-                    changed.append(crispr)
-                else:
-                    pass
-            else:
-                pass
-
-            if isinstance(feature, dict):
-                spacers = [s for s in feature.keys() if s.startswith('spacer')]
-                for spacer in spacers:
-                    spacer_header = '>{}|{}'.format(crispr, spacer)
-                    spacer_entry = '{}\n{}\n'.format(spacer_header, feature[spacer])
-                    fasta_handle.write(spacer_entry)
-                nspacers += len(spacers)
-            else:
-                logging.error('ERROR: CRISPR dictionary does not contain nested feature dict')
-                logging.error('Cannot write to output FASTA, exiting...')
-                sys.exit(1)
+
+        text, nspacers, changed = fasta_records(crispr_df, id_change)
+        fasta_handle.write(text)
 
         spacer_msg = '{} spacers written to: {}'.format(nspacers, spacer_fasta)
 
@@ -176,12 +232,10 @@ def write_spacer_fasta(crispr_dict, spacer_fasta, id_change=None):
         logging.info(spacer_msg)
 
         if changed:
-            logging.info('{} CRISPR IDs changed'.format(len(changed)))
+            logging.info('{} CRISPR IDs changed'.format(changed))
         else:
             pass
 
-
-
         fasta_handle.close()
 
 
@@ -190,46 +244,97 @@ def write_spacer_fasta(crispr_dict, spacer_fasta, id_change=None):
 
     return None
 #------------------------------------------------------------------------------
-def main():
-
-    logfile_default = 'spacer_extract_crt_{}.log'.format(str(datetime.now().strftime('%d-%m-%Y_%H-%M-%S')))
-
-    #epilog = 'spacer_extract_crt.py -i IMG CRT CRISPR file'
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-i','--crt_file', required=True, type=str, help='Input file in tsv format containing CRISPR Recognition Tool output. Required.')
-    parser.add_argument('-o', '--output_fasta', required=True, type=str, help='Path to output FASTA file containing CRISPR spacer sequences. Required.')
-    parser.add_argument('-s', '--min_spacer_length', required=False, type=int, default=23, help='minimum length for a CRISPR spacer. Default = 23')
-    parser.add_argument('-r', '--min_repeat_length', required=False, type=int, default=11, help='minimum length for a CRISPR repeat. Default = 11')
-    parser.add_argument('-m', '--min_repeats', required=False, type=int, default=3, help='minimum number of repeats required to retain CRISPR. Default = 3')
-    parser.add_argument('-q', '--quality_off', required=False, action='store_true', help='use this option to skip quality control of CRISPRs')
-    parser.add_argument('-c', '--img_bin_map', required=False, action='store', type=str, help='bin map output from img_bin_map.py')
-    parser.add_argument('-l', '--logfile', required=False, action='store', default=logfile_default, help='path to logfile')
-    args = parser.parse_args()
-
-    logging_format = '%(name)s :: %(levelname)s :: %(message)s :: %(asctime)s'
-
-    logging.basicConfig(filename = args.logfile,
-        level = logging.DEBUG,
-        format = logging_format)
-
-    print('Logfile written to: {}'.format(args.logfile))
-
-    logging.info('SCRIPT: {}'.format(os.path.basename(__file__)))
+def stream_spacers(crt_file, output_fasta, min_spacer_length=23, min_repeat_length=11,
+    min_repeats=3, quality_off=False, img_map=None, chunksize=100000, stage_metrics=None):
+    """
+    Parse a CRT file chunksize rows at a time, filter each complete CRISPR array
+    and append its spacers to the FASTA file, so memory does not grow with the
+    input. The bin map is read once and applied as the spacers are written.
+    Return False if no CRISPR was found.
+    """
+    if stage_metrics is None:
+        stage_metrics = metrics.StageMetrics('stream_spacers')
+
+    bcd = dict()
+    if img_map is not None:
+        try:
+            bcd = img_bin_map(img_map, None)
+        except:
+            logging.warning('could not get crispr bin ids')
+
+    if quality_off:
+        logging.info('skipping CRISPR quality control')
+    else:
+        log_quality_settings(min_spacer_length, min_repeat_length, min_repeats)
 
-    crispr_dict = dict()
+    ncrispr = 0
+    nspacers = 0
+    changed = 0
+    summary_df = None
+    try:
+        with stage_metrics.phase('write') as phase, open(output_fasta, 'w', buffering = 1048576) as fasta_handle:
+            for crispr_df in iter_crt(crt_file, chunksize):
+                ncrispr += len(crispr_df['crispr'].cat.categories)
+                if not quality_off:
+                    crispr_df, chunk_summary_df = quality_filter(crispr_df, min_spacer_length, min_repeat_length, min_repeats)
+                    summary_df = chunk_summary_df if summary_df is None else summary_df.assign(CRISPRs = summary_df['CRISPRs'] + chunk_summary_df['CRISPRs'])
+                text, chunk_spacers, chunk_changed = fasta_records(crispr_df, bcd)
+                fasta_handle.write(text)
+                nspacers += chunk_spacers
+                changed += chunk_changed
+            phase['rows_out'] = nspacers
+    except IOError:
+        logging.exception('could not stream CRT file {} to output FASTA {}'.format(crt_file, output_fasta))
+        print('ERROR: could not stream CRT file {} to output FASTA {}'.format(crt_file, output_fasta))
+        return False
+
+    if ncrispr == 0:
+        logging.error('no CRISPR found in {}!'.format(crt_file))
+        return False
+
+    if summary_df is not None:
+        log_rejections(summary_df)
+        logging.info('{} of {} CRISPRs retained'.format(ncrispr - int(summary_df['CRISPRs'].sum()), ncrispr))
+
+    spacer_msg = '{} spacers written to: {}'.format(nspacers, output_fasta)
+    print(spacer_msg)
+    logging.info(spacer_msg)
+    if changed:
+        logging.info('{} CRISPR IDs changed'.format(changed))
+
+    print('Finished!')
+    logging.info('Finished')
+    return True
+#------------------------------------------------------------------------------
+def extract_spacers(crt_file, output_fasta, min_spacer_length=23, min_repeat_length=11,
+    min_repeats=3, quality_off=False, img_map=None, stage_metrics=None, stream=False,
+    chunksize=100000):
+    """
+    Parse a CRT file, filter the CRISPRs and write their spacers to a FASTA file.
+    The read, filter and write phases are recorded in stage_metrics if given.
+    With stream, the file is processed chunksize rows at a time (see stream_spacers).
+    Return False if no CRISPR was found.
+    """
+    if stream:
+        return stream_spacers(crt_file, output_fasta, min_spacer_length, min_repeat_length,
+            min_repeats, quality_off, img_map, chunksize, stage_metrics)
 
+    if stage_metrics is None:
+        stage_metrics = metrics.StageMetrics('extract_spacers')
 
-    crispr_dict = read_crt(args.crt_file)
+    with stage_metrics.phase('read') as phase:
+        crispr_df = read_crt(crt_file)
+        phase['rows_out'] = crispr_df
 
-    fasta_write_exception = 'could not write output spacer FASTA {}'.format(args.output_fasta)
+    fasta_write_exception = 'could not write output spacer FASTA {}'.format(output_fasta)
 
 
-    if crispr_dict:
+    if crispr_df is not None and len(crispr_df) > 0:
         bcd = dict()
-        if args.img_bin_map:
+        if img_map is not None:
             try:
-                gold_contigs_crispr = list(set([crispr_dict[key]['gold_contig_id'] for key in crispr_dict.keys()]))
-                bcd = img_bin_map(args.img_bin_map, gold_contigs_crispr)
+                gold_contigs_crispr = crispr_df['gold_contig_id'].cat.categories.tolist()
+                bcd = img_bin_map(img_map, gold_contigs_crispr)
 
             except:
                 logging.warning('could not get crispr bin ids')
@@ -240,42 +345,91 @@ def main():
             pass
 
 
-        ncrispr = len(crispr_dict.keys())
-        if not args.quality_off:
+        ncrispr = len(crispr_df['crispr'].cat.categories)
+        if not quality_off:
             try:
                 logging.info('CRISPR quality control')
-                crispr_dict_filter = crispr_quality(crispr_dict, min_spc = args.min_spacer_length,
-                    min_rep = args.min_repeat_length, n_rep = args.min_repeats)
+                with stage_metrics.phase('filter', crispr_df) as phase:
+                    crispr_df_filter, rejected_df = crispr_quality(crispr_df, min_spc = min_spacer_length,
+                        min_rep = min_repeat_length, n_rep = min_repeats)
+                    phase['rows_out'] = crispr_df_filter
 
-                ncrispr_retained = len(crispr_dict_filter.keys())
+                ncrispr_retained = ncrispr - int(rejected_df['CRISPRs'].sum())
                 logging.info('{} of {} CRISPRs retained'.format(ncrispr_retained, ncrispr))
 
             except:
-                logging.exception('could not filter CRISPR dictionary')
+                logging.exception('could not filter CRISPR dataframe')
 
             #Write to output FASTA
             try:
-                logging.info('writing CRISPR spacers to output FASTA: {}'.format(args.output_fasta))
-                write_spacer_fasta(crispr_dict = crispr_dict_filter,
-                spacer_fasta = args.output_fasta,
-                id_change = bcd)
+                logging.info('writing CRISPR spacers to output FASTA: {}'.format(output_fasta))
+                with stage_metrics.phase('write', crispr_df_filter):
+                    write_spacer_fasta(crispr_df = crispr_df_filter,
+                    spacer_fasta = output_fasta,
+                    id_change = bcd)
             except:
                 logging.exception(fasta_write_exception)
 
         else:
             logging.info('skipping CRISPR quality control')
             try:
-                write_spacer_fasta(crispr_dict = crispr_dict,
-                spacer_fasta = args.output_fasta,
-                id_change = bcd)
+                with stage_metrics.phase('write', crispr_df):
+                    write_spacer_fasta(crispr_df = crispr_df,
+                    spacer_fasta = output_fasta,
+                    id_change = bcd)
             except:
                 logging.exception(fasta_write_exception)
 
         print('Finished!')
         logging.info('Finished')
+        return True
     else:
-        logging.error('CRISPR dictionary is empty!')
+        logging.error('CRISPR dataframe is empty!')
+        return False
+#------------------------------------------------------------------------------
+def main():
+
+    logfile_default = 'spacer_extract_crt_{}.log'.format(str(datetime.now().strftime('%d-%m-%Y_%H-%M-%S')))
+
+    #epilog = 'spacer_extract_crt.py -i IMG CRT CRISPR file'
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i','--crt_file', required=True, type=str, help='Input file in tsv format containing CRISPR Recognition Tool output. Required.')
+    parser.add_argument('-o', '--output_fasta', required=True, type=str, help='Path to output FASTA file containing CRISPR spacer sequences. Required.')
+    parser.add_argument('-s', '--min_spacer_length', required=False, type=int, default=23, help='minimum length for a CRISPR spacer. Default = 23')
+    parser.add_argument('-r', '--min_repeat_length', required=False, type=int, default=11, help='minimum length for a CRISPR repeat. Default = 11')
+    parser.add_argument('-m', '--min_repeats', required=False, type=int, default=3, help='minimum number of repeats required to retain CRISPR. Default = 3')
+    parser.add_argument('-q', '--quality_off', required=False, action='store_true', help='use this option to skip quality control of CRISPRs')
+    parser.add_argument('-c', '--img_bin_map', required=False, action='store', type=str, help='bin map output from img_bin_map.py')
+    parser.add_argument('-l', '--logfile', required=False, action='store', default=logfile_default, help='path to logfile')
+    parser.add_argument('--stream', required=False, action='store_true', help='parse, filter and write the CRISPR arrays a chunk of CRT rows at a time, so memory does not grow with the input. The rows of each array must be contiguous, as CRT writes them')
+    parser.add_argument('--chunksize', required=False, type=int, default=100000, help='number of CRT rows read at a time with --stream. Default = 100000')
+    metrics.add_metrics_arguments(parser)
+    args = parser.parse_args()
+    stage_metrics = metrics.StageMetrics.from_args('spacer_extract_crt', args)
+
+    logging_format = '%(name)s :: %(levelname)s :: %(message)s :: %(asctime)s'
+
+    logging.basicConfig(filename = args.logfile,
+        level = logging.DEBUG,
+        format = logging_format)
+
+    print('Logfile written to: {}'.format(args.logfile))
+
+    logging.info('SCRIPT: {}'.format(os.path.basename(__file__)))
+
+    if not extract_spacers(crt_file = args.crt_file,
+        output_fasta = args.output_fasta,
+        min_spacer_length = args.min_spacer_length,
+        min_repeat_length = args.min_repeat_length,
+        min_repeats = args.min_repeats,
+        quality_off = args.quality_off,
+        img_map = args.img_bin_map,
+        stage_metrics = stage_metrics,
+        stream = args.stream,
+        chunksize = args.chunksize):
+        stage_metrics.finish('no CRISPR found')
         sys.exit(1)
+    stage_metrics.finish()
 #------------------------------------------------------------------------------
 if __name__ == "__main__":
     main()
@@ -13,10 +13,15 @@ Create a file mapping IMG, GOLD, original Contig IDs to Bin(s) for downstream us
 import argparse
 import logging
 import os
+import sys
 from datetime import datetime
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils import metrics
+from utils import table_io
+
 #------------------------------------------------------------------------------
 def map_gold(scaffold_map, sample_map, bin_map,
     scaffold_samples=False, only_bin=False):
@@ -27,7 +32,7 @@ def map_gold(scaffold_map, sample_map, bin_map,
     #Read in the component dataframes
     try:
         logging.info('reading IMG --> GOLD scaffold map to Pandas DF')
-        gold_scaffold_df = pd.read_csv(scaffold_map, sep = '\t',
+        gold_scaffold_df = table_io.read_table(scaffold_map, default_format = 'tsv',
             names = ['Original_Contig_Name', 'IMG_Contig_Name'],
             compression = 'infer')
 
@@ -41,15 +46,19 @@ def map_gold(scaffold_map, sample_map, bin_map,
 
     try:
         logging.info('reading GOLD --> Sample ID map to Pandas DF')
-        gold_sample_df = pd.read_csv(sample_map, sep = '\t', compression = 'infer')
+        gold_sample_df = table_io.read_table(sample_map, default_format = 'tsv', compression = 'infer')
     except IOError as e:
         logging.exception('could not open {}'.format(sample_map))
 
-    try:
-        logging.info('reading renamed contig --> Bin --> Sample ID map to Pandas DF')
-        bin_map_df = pd.read_csv(bin_map, sep = '\t', compression = 'infer')
-    except IOError as e:
-        logging.exception('could not open {}'.format(bin_map))
+    #The bin map can also be passed as a dataframe, e.g. by metagaia.py
+    if isinstance(bin_map, pd.DataFrame):
+        bin_map_df = bin_map
+    else:
+        try:
+            logging.info('reading renamed contig --> Bin --> Sample ID map to Pandas DF')
+            bin_map_df = table_io.read_table(bin_map, default_format = 'tsv', compression = 'infer')
+        except IOError as e:
+            logging.exception('could not open {}'.format(bin_map))
 
     ###MERGE START
     gold_scaffold_sample_df = pd.merge(gold_scaffold_df, gold_sample_df,
@@ -84,13 +93,15 @@ def main():
 
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('-o', '--output', required=True, type=str, help='Path to output map file. Required.')
+    parser.add_argument('-o', '--output', required=True, type=str, help='Path to output map file. A .parquet or .feather extension writes a columnar file. Required.')
     parser.add_argument('-b', '--bin_map', required=True, action='store', type=str, help='bin-contig-sample map file')
     parser.add_argument('-c', '--contig_map', required=True, action='store', type=str, help='IMG contig to GOLD map')
     parser.add_argument('-g', '--gold_sample_map', required=True, help='Mapping file of GOLD IDs to Sample IDs')
     parser.add_argument('-l', '--logfile', required=False, action='store', default=logfile_default, help='path to logfile')
+    metrics.add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    stage_metrics = metrics.StageMetrics.from_args('img_bin_map', args)
 
     logging_format = '%(name)s :: %(levelname)s :: %(message)s :: %(asctime)s'
 
@@ -107,14 +118,18 @@ def main():
     assert os.path.isfile(args.gold_sample_map)
 
     try:
-        bin_map_df = map_gold(scaffold_map = args.contig_map,
-            sample_map = args.gold_sample_map,
-            bin_map = args.bin_map,
-            scaffold_samples=True,
-            only_bin=True)
+        #The maps are read within the merge phase
+        with stage_metrics.phase('merge') as phase:
+            bin_map_df = map_gold(scaffold_map = args.contig_map,
+                sample_map = args.gold_sample_map,
+                bin_map = args.bin_map,
+                scaffold_samples=True,
+                only_bin=True)
+            phase['rows_out'] = bin_map_df
         #Write the mapping dataframe to TSV file
         try:
-            bin_map_df.to_csv(args.output, index=False, sep='\t', encoding='utf-8')
+            with stage_metrics.phase('write', bin_map_df):
+                table_io.write_table(bin_map_df, args.output, index=False, default_format='tsv', encoding='utf-8')
             write_success = 'Writing to output tsv: {}'.format(args.output)
             print(write_success)
             logging.info(write_success)
@@ -128,6 +143,7 @@ def main():
         logging.error('Could not create bin map')
     finally:
         logging.info('read/write try/except block is finished')
+    stage_metrics.finish()
 
 
 #------------------------------------------------------------------------------
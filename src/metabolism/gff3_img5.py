@@ -7,25 +7,206 @@ Purpose: Parse IMG 5.0 GFF3 output for MetaGaia metabolic analysis.
 """
 
 import argparse
+import collections
+import csv
 import logging
+import multiprocessing
+import numpy as np
 import pandas as pd
 import os
+import re
 import sys
 from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from utils import annotation_store
+from utils import metrics
+from utils import stage_cache
+from utils import table_io
+#pyarrow (7.0 or later, to skip the comment lines) reads the GFF3 files and splits the
+#attributes without python strings. Without it, pandas and a regular expression are used
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    if not hasattr(pa_csv, 'InvalidRow'):
+        pa = None
+except ImportError:
+    pa = None
+#------------------------------------------------------------------------------
+#The nine GFF3 columns, those of the img5 format, and the gene coordinates
+GFF3_COLUMNS = ['seqid', 'source', 'type', 'start', 'end', 'score', 'strand', 'phase', 'attributes']
+IMG5_COLUMNS = ['seqid', 'type', 'attributes']
+COORDINATE_COLUMNS = ['start', 'end', 'strand']
+SEMICOLON = ord(';')
+EQUALS = ord('=')
+WHITESPACE = np.frombuffer(b' \t\n\r\x0b\x0c', dtype = np.uint8)
 #------------------------------------------------------------------------------
-def gff3_to_df(gff_file, attribute_select, format='img5'):
+def attribute_values(attributes, keys):
     """
-    Parse a GFF3 file and return a Pandas dataframe.
+    Extract the values of the selected attributes from every record, NaN where they
+    are missing. The value is the text after the first = of a key=value pair, and
+    the last pair is kept when a key is repeated, as when splitting the pairs.
     """
+    pair_regex = re.compile('(?:^|;)({})=([^;=]*)'.format('|'.join(re.escape(key) for key in keys)))
+    record_pairs = [dict(pair_regex.findall(record.rstrip())) for record in attributes.to_numpy()]
 
-    valid_formats = ['standard', 'img5']
-    format_error_msg = 'ERROR - gff3_to_df() requires a valid format, choose from: {}'.format(' '.join(valid_formats))
-    gff_data = []
+    values = {}
+    for key in keys:
+        values[key] = pd.Series([pairs.get(key, np.nan) for pairs in record_pairs], index = attributes.index, dtype = object)
+
+    return values
+#------------------------------------------------------------------------------
+def string_buffers(array):
+    """
+    Offsets and bytes of a pyarrow string array.
+    """
+    offset_type = np.int64 if pa.types.is_large_string(array.type) else np.int32
+    offsets = np.frombuffer(array.buffers()[1], dtype = offset_type)[array.offset:array.offset + len(array) + 1]
+    data = array.buffers()[2]
+    data = np.frombuffer(data, dtype = np.uint8) if data is not None else np.zeros(0, dtype = np.uint8)
+
+    return offsets.astype(np.int64), data
+#------------------------------------------------------------------------------
+def chunk_attribute_values(chunk, keys):
+    """
+    Split the attributes of a pyarrow chunk, working on the bytes of the chunk
+    with numpy. Returns the pyarrow strings of each key.
+    """
+    if len(chunk) == 0:
+        return {key:pa.array([], type = pa.string()) for key in keys}
+
+    #Each record is ended by a ;, so the chunk is one stream of key=value; pairs
+    stream = pc.binary_join_element_wise(chunk, ';', '')
+    offsets, data = string_buffers(stream)
+    #Trailing whitespace is not part of the last value of a record, pyarrow trims it if a
+    #record ends with ASCII whitespace or a multibyte character that may be whitespace
+    last_bytes = data[offsets[1:] - 2][offsets[1:] - offsets[:-1] > 1]
+    if np.isin(last_bytes, WHITESPACE).any() or (last_bytes >= 0x80).any():
+        stream = pc.binary_join_element_wise(pc.utf8_rtrim_whitespace(chunk), ';', '')
+        offsets, data = string_buffers(stream)
+
+    text = data[offsets[0]:offsets[-1]]
+    separators = np.flatnonzero((text == SEMICOLON) | (text == EQUALS)) + offsets[0]
+    is_equals = data[separators] == EQUALS
+    #The stream cut before and after each separator, so the text after separator i is token 2 * i + 2
+    token_offsets = np.empty(2 * len(separators) + 1, dtype = np.int32)
+    token_offsets[0] = offsets[0]
+    token_offsets[1::2] = separators
+    token_offsets[2::2] = separators + 1
+    tokens = pa.Array.from_buffers(pa.string(), len(token_offsets) - 1,
+        [None, pa.py_buffer(token_offsets), stream.buffers()[2]])
+
+    #The first = of a pair follows a ; and ends the key, the value runs to the next ; or =
+    pair_equals = np.flatnonzero(is_equals & ~np.concatenate(([False], is_equals[:-1])))
+    key_starts = np.where(pair_equals > 0, separators[pair_equals - 1] + 1, offsets[0])
+    equals = separators[pair_equals]
+    key_lengths = equals - key_starts
+    first_bytes = data[key_starts]
+
+    values = {}
+    for key in keys:
+        key_bytes = np.frombuffer(key.encode('utf-8'), dtype = np.uint8)
+        candidates = key_lengths == len(key_bytes)
+        if len(key_bytes) > 0:
+            candidates &= first_bytes == key_bytes[0]
+        pairs = np.flatnonzero(candidates)
+        for position, key_byte in enumerate(key_bytes[1:], 1):
+            pairs = pairs[data[key_starts[pairs] + position] == key_byte]
+        records = np.searchsorted(offsets, equals[pairs], side = 'right') - 1
+        #The pairs are in order, so the last of repeated pairs is the last of its record
+        last = np.ones(len(records), dtype = bool)
+        last[:-1] = records[1:] != records[:-1]
+        take = np.full(len(chunk), -1, dtype = np.int64)
+        take[records[last]] = 2 * pair_equals[pairs[last]] + 2
+        values[key] = tokens.take(pa.array(take, mask = take < 0))
+
+    return values
+#------------------------------------------------------------------------------
+def arrow_attribute_values(attributes, keys):
+    """
+    Extract the values of the selected attributes from pyarrow strings, as
+    attribute_values does, chunk by chunk.
+    """
+    chunk_values = [chunk_attribute_values(chunk, keys) for chunk in attributes.chunks]
+
+    values = {}
+    for key in keys:
+        values[key] = pa.chunked_array([chunk[key] for chunk in chunk_values], type = pa.string()).to_pandas()
+
+    return values
+#------------------------------------------------------------------------------
+def read_gff_arrow(gff_file, columns):
+    """
+    Read the selected GFF3 columns as strings with pyarrow, skipping the comment and
+    directive lines. Also returns whether other lines do not have nine columns, an
+    empty attributes column counting as missing.
+    """
+    malformed = []
+
+    def skip_record(row):
+        if not (row.text or '').startswith('#'):
+            malformed.append(row.number)
+        return 'skip'
 
     try:
-        gff_handle = open(gff_file, 'r', encoding = 'utf-8')
-    except IOError as e:
-        print('Could not open {}'.format(gff_file))
+        gff_table = pa_csv.read_csv(gff_file,
+            read_options = pa_csv.ReadOptions(column_names = GFF3_COLUMNS),
+            parse_options = pa_csv.ParseOptions(delimiter = '\t', quote_char = False, invalid_row_handler = skip_record),
+            convert_options = pa_csv.ConvertOptions(include_columns = columns,
+                column_types = {column:pa.string() for column in columns}, strings_can_be_null = False))
+    except pa.ArrowInvalid:
+        #pyarrow does not read empty files
+        if os.path.getsize(gff_file) > 0:
+            raise
+        gff_table = pa.table({column:pa.array([], type = pa.string()) for column in columns})
+
+    if gff_table.num_rows > 0 and pc.min(pc.binary_length(gff_table['attributes'])).as_py() == 0:
+        malformed.append(None)
+
+    return gff_table, len(malformed) > 0
+#------------------------------------------------------------------------------
+def read_gff_pandas(gff_file):
+    """
+    Read the GFF3 columns with pandas, dropping the comment and directive lines.
+    Also returns whether other lines do not have nine columns.
+    """
+    #start and end are parsed by the C engine, the other columns are kept as strings
+    text_dtypes = {column:object for column in GFF3_COLUMNS if column not in ['start', 'end']}
+    try:
+        gff_df = pd.read_csv(gff_file, sep = '\t', header = None,
+            names = GFF3_COLUMNS, dtype = text_dtypes, quoting = csv.QUOTE_NONE,
+            encoding = 'utf-8', engine = 'c')
+    except pd.errors.EmptyDataError:
+        gff_df = pd.DataFrame(columns = GFF3_COLUMNS, dtype = object)
+
+    #Comment and directive lines only fill the first column
+    short_records = gff_df[gff_df['attributes'].isna()]
+    comments = short_records['seqid'].str.startswith('#', na = False)
+
+    return gff_df.drop(index = short_records.index), not comments.all()
+#------------------------------------------------------------------------------
+def gff_positions(positions):
+    """
+    GFF3 start or end positions as nullable integers, NA where they are not integers.
+    """
+    if pa is not None:
+        try:
+            integers = pc.cast(pa.array(positions), pa.int64()).to_numpy(zero_copy_only = False)
+            return pd.Series(integers, index = positions.index).astype('Int64')
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+
+    return pd.to_numeric(positions, errors = 'coerce').astype('Int64')
+#------------------------------------------------------------------------------
+def gff3_to_df(gff_file, attribute_select, format='img5', coordinates=False):
+    """
+    Parse a GFF3 file and return a Pandas dataframe. With coordinates, the img5
+    format also has the typed Gene_Start, Gene_Stop and Strand columns.
+    """
+
+    valid_formats = ['standard', 'img5']
+    format_error_msg = 'ERROR - gff3_to_df() requires a valid format, choose from: {}'.format(' '.join(valid_formats))
 
     if not format in valid_formats:
         print(format_error_msg)
@@ -33,96 +214,182 @@ def gff3_to_df(gff_file, attribute_select, format='img5'):
     else:
         print('Parsing {}, expecting {} GFF3 format...'.format(gff_file, format))
 
-    for record in gff_handle:
-        record_dict = {}
-        if not record.startswith('#'):
-            record = record.rstrip()
-            record_list = record.split('\t')
-            if len(record_list) < 9:
-                print('Only {} column(s) in {}  - not consistent with GFF3 standard!'.format(len(record_list), gff_file))
-                return None
-            else:
-                seqid = record_list[0]
-                source = record_list[1]
-                ftype = record_list[2]
-                start = record_list[3]
-                end = record_list[4]
-                score = record_list[5]
-                strand = record_list[6]
-                phase = record_list[7]
-                attributes = record_list[8]
-                attributes_list = attributes.split(';')
-
-                attributes_dict = {}
-                if attributes_list:
-                    for attribute in attributes_list:
-                        alist = attribute.split('=')
-                        att_key = alist[0]
-                        att_value = alist[1]
-                        attributes_dict[att_key] = att_value
-                else:
-                    pass
-
-                if format == 'standard':
-                    gff_dict = {'Contig_Name':seqid, 'source':source, 'ftype':ftype,
-                    'start':start, 'end':end, 'score':score, 'strand':strand,
-                    'phase':phase, 'attributes':attributes_dict}
-                elif format == 'img5':
-                    record_dict['IMG_Contig_Name'] = seqid
-                    record_dict['Gene_Type'] = ftype
-
-                else:
-                    print(format_error_msg)
-
-                for key in attribute_select:
-                    if key in attributes_dict.keys():
-                    #if key in attribute_select:
-                        record_dict[key] = attributes_dict[key]
-
-                    else:
-                        record_dict[key] = 'NaN'
-
-        gff_data.append(record_dict)
-
-    gff_handle.close()
-
-    print('Converting GFF3 dict to pandas df...')
-    gff_df = pd.DataFrame.from_dict(gff_data)
-
-    return gff_df
-
-#------------------------------------------------------------------------------
-def gff_pd_multiread(path_file, attr_sel, colsep = '\t', format = 'img5'):
+    #pyarrow only reads the columns of the output
+    if format == 'standard':
+        read_columns = GFF3_COLUMNS
+    else:
+        read_columns = [column for column in GFF3_COLUMNS if column in IMG5_COLUMNS or (coordinates and column in COORDINATE_COLUMNS)]
+
+    if pa is not None:
+        gff_table, malformed = read_gff_arrow(gff_file, read_columns)
+    else:
+        gff_df, malformed = read_gff_pandas(gff_file)
+
+    if malformed:
+        print('Records without 9 columns in {} - not consistent with GFF3 standard!'.format(gff_file))
+        return None
+
+    #The attributes are split in pyarrow and only the values are converted to pandas
+    if pa is not None:
+        gff_df = gff_table.select([column for column in read_columns if column != 'attributes']).to_pandas()
+        values = arrow_attribute_values(gff_table['attributes'], attribute_select)
+    else:
+        values = attribute_values(gff_df['attributes'], attribute_select)
+
+    if 'start' in gff_df.columns:
+        start = gff_positions(gff_df['start'])
+        end = gff_positions(gff_df['end'])
+        strand = gff_df['strand'].astype('category')
+
+    if format == 'standard':
+        columns = {'Contig_Name':gff_df['seqid'], 'source':gff_df['source'],
+        'ftype':gff_df['type'], 'start':start, 'end':end, 'score':gff_df['score'],
+        'strand':strand, 'phase':gff_df['phase']}
+    else:
+        columns = {'IMG_Contig_Name':gff_df['seqid'], 'Gene_Type':gff_df['type'].astype('category')}
+        if coordinates:
+            columns.update({'Gene_Start':start, 'Gene_Stop':end, 'Strand':strand})
+
+    columns.update(values)
+
+    return pd.DataFrame(columns).reset_index(drop = True)
+
+#------------------------------------------------------------------------------
+def gff_paths(path_file):
     """
-    Read in a file with paths of multiple GFF files,
-    read them in as pandas dataframes, and concatenate them.
+    Read the GFF file paths listed in a path file, skipping the missing files.
     """
-    pd_df_list = []
-
     try:
         path_handle = open(path_file, 'r')
     except IOError as e:
-        print('could not open path file {}')
+        print('could not open path file {}'.format(path_file))
+        return []
 
+    paths = []
     for path in path_handle:
         path = path.strip()
         if os.path.isfile(os.path.abspath(path)):
-            try:
-                df = gff3_to_df(gff_file = path,
-                    attribute_select = attr_sel,
-                    format = format)
-
-                pd_df_list.append(df)
-
-            except IOError as e:
-                print('WARNING - could not convert GFF file {} to pandas dataframe'.format(path))
+            paths.append(path)
 
     path_handle.close()
 
+    return paths
+#------------------------------------------------------------------------------
+def parse_gff_job(job):
+    """
+    Parse one GFF file in a worker process. job is (path, attribute_select, format, coordinates).
+    """
+    path, attr_sel, format, coordinates = job
+    try:
+        return gff3_to_df(gff_file = path, attribute_select = attr_sel, format = format, coordinates = coordinates)
+    except IOError as e:
+        print('WARNING - could not convert GFF file {} to pandas dataframe'.format(path))
+        return None
+#------------------------------------------------------------------------------
+def iter_gff_parts(paths, attr_sel, format = 'img5', threads = 1, coordinates = False):
+    """
+    Parse GFF files in worker processes and yield (path, dataframe) in the order
+    of the paths as soon as each file is done. At most 2 * threads parsed files
+    are held waiting for an earlier one, so memory stays at a few files.
+    """
+    jobs = [(path, attr_sel, format, coordinates) for path in paths]
+    #No more processes than cores or files
+    threads = min(threads, os.cpu_count() or 1, len(jobs))
+
+    if threads <= 1:
+        for job in jobs:
+            yield job[0], parse_gff_job(job)
+        return
+
+    window = 2 * threads
+    with multiprocessing.Pool(processes = threads) as pool:
+        pending = collections.deque()
+        for job in jobs:
+            pending.append((job[0], pool.apply_async(parse_gff_job, (job,))))
+            if len(pending) >= window:
+                path, result = pending.popleft()
+                yield path, result.get()
+        while pending:
+            path, result = pending.popleft()
+            yield path, result.get()
+#------------------------------------------------------------------------------
+def gff_pd_multiread(path_file, attr_sel, colsep = '\t', format = 'img5', threads = 1, coordinates = False):
+    """
+    Read in a file with paths of multiple GFF files,
+    read them in as pandas dataframes, and concatenate them.
+    """
+    pd_df_list = [df for path, df in iter_gff_parts(gff_paths(path_file), attr_sel, format, threads, coordinates)]
+
     gff_df_concat = pd.concat(pd_df_list)
 
     return gff_df_concat
 #------------------------------------------------------------------------------
+def part_name(output, gff_file):
+    """
+    Name the output part of one GFF file after the output and the GFF file.
+    """
+    output_root, output_ext = os.path.splitext(output)
+    gff_root = os.path.splitext(os.path.basename(gff_file))[0]
+
+    return '{}_{}{}'.format(output_root, gff_root, output_ext)
+#------------------------------------------------------------------------------
+def stream_gff_parts(paths, attr_sel, output, img_map = None, parts = False, threads = 1, store = None, coordinates = False):
+    """
+    Parse multiple GFF files, merge each one with the IMG bin map and write it
+    as soon as it is done, to the output or to one part per GFF file, and to
+    an annotation_store.AnnotationStore if one is given.
+    Return the written files and the number of rows.
+    """
+    written = []
+    rows = 0
+    writer = None
+
+    try:
+        for path, img_df in iter_gff_parts(paths, attr_sel, 'img5', threads, coordinates):
+            if img_df is None:
+                continue
+            scaffold_anno_df = annotate_scaffolds(img_df, img_map)
+            if parts:
+                written.append(part_name(output, path))
+                table_io.write_table(scaffold_anno_df, written[-1], index=True, default_format='tsv', encoding='utf-8')
+            else:
+                if writer is None:
+                    writer = table_io.TableWriter(output, default_format='tsv')
+                    written.append(output)
+                #Number the rows across the files, as when the files are concatenated and merged
+                scaffold_anno_df.index = pd.RangeIndex(rows, rows + len(scaffold_anno_df))
+                writer.write(scaffold_anno_df, index=True)
+            if store is not None:
+                store.add(scaffold_anno_df)
+            rows += len(scaffold_anno_df)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return written, rows
+#------------------------------------------------------------------------------
+def annotate_scaffolds(img_df, img_map=None):
+    """
+    Merge the GFF3 annotations with the IMG bin map and rename the
+    accession columns for use with metabolic_profile.py.
+    """
+    if img_map is not None:
+        try:
+            scaffold_anno_df = pd.merge(img_df, img_map,
+                on = 'IMG_Contig_Name', how = 'left')
+        except Exception:
+            logging.exception('could not merge img/gff3 dataframe with img_map')
+            raise
+    else:
+        scaffold_anno_df = img_df
+
+    #Column names for IMG Annotation output file for use with metabolic_profile.py
+    accession_colname_dict = {'cog':'COG_ID', 'ko':'KO_Term',
+    'pfam':'PFAM_ID', 'ec_number':'EC_Number', 'ID':'IMG_Gene_ID',
+    'locus_tag':'Locus_Tag'}
+
+    return scaffold_anno_df.rename(columns=accession_colname_dict)
+#------------------------------------------------------------------------------
 def main():
 
     script_basename = os.path.basename(__file__)
@@ -136,12 +403,19 @@ def main():
 
     parser.add_argument('-i','--input_gff', required=False, help='Path to input GFF3 file from IMG 5.0.')
     parser.add_argument('-p','--path_file', required=False, help='File contaning paths to input GFF3 file(s) from IMG 5.0 for processing multiple files.')
-    parser.add_argument('-o', '--output', required=True, help='Output tsv file.')
+    parser.add_argument('-o', '--output', required=True, help='Output tsv file. Use a .parquet or .feather extension to write a columnar file instead.')
     parser.add_argument('-f', '--fields', required=False, type=str, default=field_default, help='GFF attributes to parse. Input as a comma-separated string. Default: {}'.format(field_default))
     parser.add_argument('-m', '--img_map', required=False, help='Contig - IMG contig - GOLD OID - Sample - Bin map generated by img_bin_map.py.')
     parser.add_argument('-l', '--logfile', required=False, action='store', default=logfile_default, help='path to logfile')
+    parser.add_argument('-t', '--threads', required=False, type=int, default=8, help='Number of GFF3 files from --path_file parsed at the same time, at most the number of cores. Default: 8')
+    parser.add_argument('--store', required=False, type=str, default='', help='Also save the annotations in this SQLite annotation store, indexed by IMG contig, original contig and bin, to be read by metabolic_profile.py and amg_hostvi.py. An existing store is replaced.')
+    parser.add_argument('--parts', required=False, action='store_true', help='With --path_file, write one output file per GFF3 file, named after --output and the GFF3 file, instead of one output file.')
+    parser.add_argument('--coordinates', required=False, action='store_true', help='Also write the Gene_Start, Gene_Stop and Strand of each gene.')
+    stage_cache.add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    stage_metrics = metrics.StageMetrics.from_args('gff3_img5', args)
 
     #Set up logger
     logging_format = '%(name)s :: %(levelname)s :: %(message)s :: %(asctime)s'
@@ -166,59 +440,94 @@ def main():
     else:
         key_fields = field_default.split(',')
 
-    if args.input_gff and not args.path_file:
-        try:
-            img_df = gff3_to_df(gff_file = args.input_gff,
-            format = 'img5',
-            attribute_select = key_fields)
-        except IOError as e:
-            print('could not parse GFF3 file {} - ensure this is not a path file'.format(args.input_gff))
-
-    elif args.path_file and os.path.isfile(os.path.abspath(args.path_file)) and not args.input_gff:
-        multi_gff_msg = 'Reading in multiple GFF3 files based on paths in {}'.format(args.path_file)
-        print(multi_gff_msg)
-        logging.info(multi_gff_msg)
-        img_df = gff_pd_multiread(path_file = args.path_file, attr_sel = key_fields)
+    #Reuse the previous output if the GFF3 files, map and fields did not change
+    cache = stage_cache.StageCache.from_args(args)
+    gff_inputs = [args.input_gff, args.path_file, args.img_map]
+    if args.path_file and os.path.isfile(args.path_file):
+        with open(args.path_file, 'r') as path_handle:
+            gff_inputs = gff_inputs + [p.strip() for p in path_handle if p.strip()]
+    multi_gff = args.path_file and os.path.isfile(os.path.abspath(args.path_file)) and not args.input_gff
+    paths = gff_paths(args.path_file) if multi_gff else []
+    outputs = [part_name(args.output, path) for path in paths] if args.parts and multi_gff else [args.output]
+    outputs = outputs + ([args.store] if args.store else [])
+    cache_key = cache.key('gff3_img5', gff_inputs, {'fields': key_fields, 'parts': args.parts, 'store': args.store, 'coordinates': args.coordinates}, code=[__file__])
+    if cache.fetch(cache_key, outputs):
+        logging.info('inputs unchanged, output restored from cache {}'.format(args.cache_dir))
+        stage_metrics.finish('cached')
+        return
+
+    with stage_metrics.phase('read') as phase:
+        img_map = None
+        if args.img_map:
+                try:
+                    print('reading GOLD --> Sample ID map to Pandas DF')
+                    img_map = table_io.read_table(args.img_map, default_format = 'tsv')
+                except IOError as e:
+                    img_map_error_msg = 'Could not open {}'.format(args.img_map)
+                    print('ERROR: {}'.format(img_map_error_msg))
+                    logging.error(img_map_error_msg)
+        else:
+            logging.info('No --img_map, ignoring merge...')
+        phase['rows_out'] = img_map
 
-    elif args.path_file and args.input_gff:
+    if args.path_file and args.input_gff:
         input_error_msg = 'Specify either a single GFF3 file, or a file containing multiple GFF3 paths for --input_gff'
         print('ERROR: {}'.format(input_error_msg))
         logging.error(input_error_msg)
         sys.exit(1)
-    else:
-        pass
 
-    if args.img_map:
+    elif multi_gff:
+        multi_gff_msg = 'Reading in multiple GFF3 files based on paths in {}'.format(args.path_file)
+        print(multi_gff_msg)
+        logging.info(multi_gff_msg)
+        #Each file is merged with the map and written as soon as it is parsed, in the order of the path file
+        try:
+            with stage_metrics.phase('write', len(paths)) as phase:
+                store = annotation_store.AnnotationStore(args.store, overwrite = True) if args.store else None
+                try:
+                    written, phase['rows_out'] = stream_gff_parts(paths, key_fields, args.output,
+                        img_map = img_map, parts = args.parts, threads = args.threads, store = store,
+                        coordinates = args.coordinates)
+                    if store is not None:
+                        store.create_indexes()
+                        written.append(args.store)
+                finally:
+                    if store is not None:
+                        store.close()
+            print('Writing to output {}'.format(', '.join(written)))
+            cache.store(cache_key, written)
+        except IOError as e:
+            print('WARNING - unable to write output tsv file {}'.format(args.output))
+
+    elif args.input_gff:
+        with stage_metrics.phase('read'):
             try:
-                print('reading GOLD --> Sample ID map to Pandas DF')
-                img_map = pd.read_csv(args.img_map, sep = '\t')
+                img_df = gff3_to_df(gff_file = args.input_gff,
+                format = 'img5',
+                attribute_select = key_fields,
+                coordinates = args.coordinates)
             except IOError as e:
-                img_map_error_msg = 'Could not open {}'.format(args.img_map)
-                print('ERROR: {}'.format(img_map_error_msg))
-                logging.error(img_map_error_msg)
-            try:
-                scaffold_anno_df = pd.merge(img_df, img_map,
-                    on = 'IMG_Contig_Name', how = 'left')
-            except:
-                logging.error('could not merge img/gff3 dataframe with img_map')
+                print('could not parse GFF3 file {} - ensure this is not a path file'.format(args.input_gff))
 
-            print(scaffold_anno_df.head())
-    else:
-        logging.info('No --img_map, ignoring merge...')
+        with stage_metrics.phase('merge', img_df) as phase:
+            scaffold_anno_df = annotate_scaffolds(img_df, img_map)
+            phase['rows_out'] = scaffold_anno_df
 
-    #Column names for IMG Annotation output file for use with metabolic_profile.py
-    accession_colname_dict = {'cog':'COG_ID', 'ko':'KO_Term',
-    'pfam':'PFAM_ID', 'ec_number':'EC_Number', 'ID':'IMG_Gene_ID',
-    'locus_tag':'Locus_Tag'}
-
-    scaffold_anno_df.rename(columns=accession_colname_dict, inplace=True)
+        #Write to the output TSV file
+        try:
+            with stage_metrics.phase('write', scaffold_anno_df):
+                table_io.write_table(scaffold_anno_df, args.output, index=True, default_format='tsv', encoding='utf-8')
+                if args.store:
+                    with annotation_store.AnnotationStore(args.store, overwrite = True) as store:
+                        store.add(scaffold_anno_df)
+                        store.create_indexes()
+            print('Writing to output tsv {}'.format(args.output))
+            cache.store(cache_key, outputs)
+        except IOError as e:
+            print('WARNING - unable to write output tsv file {}'.format(args.output))
 
-    #Write to the output TSV file
-    try:
-        scaffold_anno_df.to_csv(args.output, index=True, sep='\t', encoding='utf-8')
-        print('Writing to output tsv {}'.format(args.output))
-    except IOError as e:
-        print('WARNING - unable to write output tsv file {}'.format(args.output))
+    summary = stage_metrics.finish()
+    logging.info('finished in {:.1f} s'.format(summary['wall_s']))
 
 #------------------------------------------------------------------------------
 if __name__ == '__main__':
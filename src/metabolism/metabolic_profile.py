@@ -12,10 +12,26 @@
 # ------------------------------
 
 import argparse
-import copy
+import functools
 import glob
+import multiprocessing
+import numpy as np
 import os
 import pandas as pd
+from scipy import sparse
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from utils import annotation_store
+from utils import metrics
+from utils import profile_io
+from utils import stage_cache
+from utils import table_io
+
+
+#Columns of the IMG files used to map the scaffolds, of which the annotations are read as categoricals
+IMG_COLUMNS = ['Original_Contig_Name', 'COG_ID', 'PFAM_ID', 'KO_Term', 'EC_Number', 'Bin']
+IMG_CATEGORIES = ['COG_ID', 'PFAM_ID', 'KO_Term', 'EC_Number', 'Bin']
 
 
 class Command_line_args():
@@ -35,30 +51,81 @@ class Command_line_args():
 		self.parser.add_argument('-p', '--imganno_path', required=False, help=("Input path containing only the IMG files. Rows are genes columns are IMG annotations in each file."))
 		self.parser.add_argument('-m', '--mapping', required=True, help=("A tsv file containing original contig name, sample, and bin columns. Created from the files_prep.py script."))
 		self.parser.add_argument('-d', '--database', required=True, help=("Database(s) of interest to merge together. Input as a list."))
+		self.parser.add_argument('-t', '--threads', required=False, default=8, type=int, help='Number of IMG files read at the same time with --imganno_path [8].')
+		self.parser.add_argument('--write_master', required=False, action='store_true', help='Save all the columns of the IMG files given with --imganno_path in one IMG_consolidated_master file. Otherwise only the columns used are read.')
+		annotation_store.add_store_argument(self.parser, 'SQLite annotation store built by gff3_img5.py --store. The IMG annotations are read from it when --imganno_file and --imganno_path are not given, otherwise the annotations they contain are saved in it')
+		self.parser.add_argument('-b', '--bins', required=False, default='', help=('Bins to profile, comma separated or in a file with one bin per line. Only the annotations of their scaffolds are read from --annotation_store. Leave blank to profile every bin.'))
 		self.parser.add_argument('-c', '--consistency', required=False, default="", help=('Boolean value that determines if scaffolds not containing a value for each database should be kept. Leave blank if consistency check is not needed.'))
+		table_io.add_format_argument(self.parser)
+		profile_io.add_profile_format_argument(self.parser)
+		stage_cache.add_cache_arguments(self.parser)
+		metrics.add_metrics_arguments(self.parser)
 		self.args = self.parser.parse_args()
 
 
-def map_scaffolds(arguments, img_df, mapping_df):
+def unique_per_group(group_codes, num_groups, columns):
 	"""
-	This function saves and returns a dataframe that contains the KEGG, COG, PFAM, and EC_Number values for each scaffold.
+	This function lists the unique values of each column within each group, in the order they first appear, like groupby().apply(lambda x: x[col].unique().tolist()).
+	Input(s):
+	group_codes is a numpy array of the group of each row, from 0 to num_groups - 1.
+	num_groups is the number of groups.
+	columns is a list of pandas series or numpy arrays of the values of each column.
+	Output(s):
+	value_lists is a list containing, for each column, a list of the unique values of each group. Missing values are kept once, as unique() keeps them.
+	"""
+
+	num_rows = len(group_codes)
+	code_list = []
+	unique_list = []
+	offset = 0
+	#Codes of every value of every column, with missing values as a value of their own
+	for values in columns:
+		value_codes, uniques = pd.factorize(values)
+		code_list.append(np.where(value_codes < 0, len(uniques), value_codes) + offset)
+		unique_list.append(np.append(np.asarray(uniques, dtype=object), np.nan))
+		offset = offset + len(uniques) + 1
+	codes = np.concatenate(code_list) if code_list else np.empty(0, dtype=np.int64)
+	groups = np.tile(np.asarray(group_codes, dtype=np.int64), len(columns))
+
+	#First row of each value in each group, ordered by column, group and then by row
+	unique_keys, first = np.unique(groups * max(offset, 1) + codes, return_index=True)
+	value_columns = first // max(num_rows, 1)
+	value_groups = unique_keys // max(offset, 1)
+	order = np.lexsort((first, value_groups, value_columns))
+	first = first[order]
+	value_columns = value_columns[order]
+	value_groups = value_groups[order]
+	#Only the values kept are converted back from their codes
+	all_values = np.concatenate(unique_list)[codes[first]] if columns else np.empty(0, dtype=object)
+
+	#Split the values of each column into one list per group
+	value_lists = []
+	for index in range(len(columns)):
+		in_column = value_columns == index
+		bounds = np.concatenate([[0], np.cumsum(np.bincount(value_groups[in_column], minlength=num_groups))])
+		flat = all_values[in_column].tolist()
+		value_lists.append([flat[start:end] for start, end in zip(bounds[:-1], bounds[1:])])
+
+	return value_lists
+
+
+def scaffold_databases(img_df, mapping_df, consistency=''):
+	"""
+	This function returns a dataframe that contains the KEGG, COG, PFAM, and EC_Number values for each scaffold.
 	Input(s):
-	arguments is a class containing all the command line arguments.
 	img_df is a pandas dataframe containing the IMG annotations.
 	mapping_df is a pandas dataframe mapping the original contig name to its corresponding bin and sample.
+	consistency is a value that determines if scaffolds not containing a value for each database are dropped when it is not empty.
 	Output(s):
 	databases_df is a pandas dataframe that maps each scaffold to metabolic pathways that are found for it.
-	files_list is a list containing all the files created in this function.
 	"""
 
-	files_list = []
-
 	#Map scaffolds
 	mapping_df = mapping_df[['Original_Contig_Name', 'Bin']]
 	if 'Bin' not in img_df.columns:
 		scaff_df = pd.merge(img_df, mapping_df, on='Original_Contig_Name', how='left')
 	else:
-		scaff_df = copy.deepcopy(img_df)
+		scaff_df = img_df
 	#Rename columns
 	scaff_df = scaff_df.rename(columns={'Original_Contig_Name': 'Scaffold'})
 	mapping_df = mapping_df.rename(columns={'Original_Contig_Name': 'Scaffold'})
@@ -67,37 +134,49 @@ def map_scaffolds(arguments, img_df, mapping_df):
 	taxonomy_df = scaff_df[['Scaffold','COG_ID','PFAM_ID','KO_Term', 'EC_Number', 'Bin']]
 
 	#Drop row if NaN is present in any of the four databases
-	if arguments.args.consistency:
+	if consistency:
 		taxonomy_df = taxonomy_df.dropna()
 
+	#Sorted scaffold codes, as groupby sorts the scaffolds and leaves out missing ones
+	scaffold_codes, scaffolds = pd.factorize(taxonomy_df['Scaffold'], sort=True)
+	keep = scaffold_codes >= 0
+	#Unique KOs, COGs, PFAMs and ECs of each scaffold in a single pass
+	value_lists = unique_per_group(scaffold_codes[keep], len(scaffolds), [taxonomy_df[c][keep] for c in ['KO_Term', 'COG_ID', 'PFAM_ID', 'EC_Number']])
+	databases_df = pd.DataFrame({'Scaffold': scaffolds, 'KEGG': value_lists[0], 'COG': value_lists[1], 'PFAM': value_lists[2], 'EC_NUMBER': value_lists[3]})
+	#Map bins to each scaffold
+	databases_df = databases_df.merge(mapping_df, on='Scaffold', how='left')
+	#Fill bin NaNs as NoBin
+	databases_df = databases_df.fillna({'Bin': 'NoBin'})
 
-	#Create a dataframe with bins and kos per bin
-	taxonomy_df = taxonomy_df.groupby('Scaffold')
-	kegg_df = pd.DataFrame(taxonomy_df.apply(lambda x: x['KO_Term'].unique().tolist()), columns=['KEGG'])
+	return databases_df
 
 
-	#Create a dataframe with bins and cogs per bin
-	cog_df = pd.DataFrame(taxonomy_df.apply(lambda x: x['COG_ID'].unique().tolist()), columns=['COG'])
-	#Merge KEGG and COG dataframes
-	databases_df = kegg_df.merge(cog_df, on='Scaffold', how='outer')
+def map_scaffolds(arguments, img_df, mapping_df, stage_metrics=None):
+	"""
+	This function saves and returns a dataframe that contains the KEGG, COG, PFAM, and EC_Number values for each scaffold.
+	Input(s):
+	arguments is a class containing all the command line arguments.
+	img_df is a pandas dataframe containing the IMG annotations.
+	mapping_df is a pandas dataframe mapping the original contig name to its corresponding bin and sample.
+	stage_metrics is a metrics.StageMetrics the groupby and write phases are recorded in.
+	Output(s):
+	databases_df is a pandas dataframe that maps each scaffold to metabolic pathways that are found for it.
+	files_list is a list containing all the files created in this function.
+	"""
 
-	#Create a dataframe with bins and pfams per bin
-	pfam_df = pd.DataFrame(taxonomy_df.apply(lambda x: x['PFAM_ID'].unique().tolist()), columns=['PFAM'])
-	#Merge KEGG/COG with PFAM dataframe
-	databases_df = databases_df.merge(pfam_df, on='Scaffold', how='outer')
+	files_list = []
+	if stage_metrics is None:
+		stage_metrics = metrics.StageMetrics('map_scaffolds')
 
-	#Create a dataframe with bins and ECs per bin
-	ec_df = pd.DataFrame(taxonomy_df.apply(lambda x: x['EC_Number'].unique().tolist()), columns=['EC_NUMBER'])
-	#Merge KEGG/COG/PFAM with EC dataframe
-	databases_df = databases_df.merge(ec_df, on='Scaffold', how='outer')
-	#Map bins to each scaffold
-	databases_df = databases_df.merge(mapping_df, on='Scaffold', how='left')
-	#Fill bin NaNs as NoBin
-	databases_df = databases_df.fillna({'Bin': 'NoBin'})
+	with stage_metrics.phase('groupby', img_df) as phase:
+		databases_df = scaffold_databases(img_df, mapping_df, arguments.args.consistency)
+		phase['rows_out'] = databases_df
 
-	files_list.append(uniquify(os.path.dirname(os.path.abspath(__file__)) + "/../../output/mapped_scaffolds.tsv").split('/')[-1])
+	mapped_path = uniquify(os.path.dirname(os.path.abspath(__file__)) + "/../../output/" + table_io.output_name("mapped_scaffolds", arguments.args.out_format))
+	files_list.append(mapped_path.split('/')[-1])
 	#Save file in output folder
-	databases_df.to_csv(uniquify(os.path.dirname(os.path.abspath(__file__)) + "/../../output/mapped_scaffolds.tsv"), index=False, sep="\t")
+	with stage_metrics.phase('write', databases_df):
+		table_io.write_table(databases_df, mapped_path, index=False)
 
 	return [databases_df, files_list]
 
@@ -121,88 +200,231 @@ def uniquify(path):
 	return path
 
 
-def get_database_counts(extract_list, databases_df):
+def database_counts_matrix(extract_list, databases_df):
+	"""
+	This function counts the number of times each database value appears in each bin, for all the databases at once.
+	Input(s):
+	extract_list is a list of the desired databases to analyze.
+	databases_df is a pandas dataframe that maps each scaffold to metabolic pathway that are found for it.
+	Output(s):
+	A profile_io.SparseProfile with a row per database value and a column per bin.
+	"""
+
+	#Explode the list of values of each scaffold into one row per value, for every database
+	value_list = []
+	bin_list = []
+	database_list = []
+	for index, d in enumerate(extract_list):
+		exploded = databases_df[[d, 'Bin']].explode(d)
+		exploded = exploded[exploded[d].notna()]
+		value_list.append(exploded[d].to_numpy(dtype=object))
+		bin_list.append(exploded['Bin'].to_numpy(dtype=object))
+		database_list.append(np.full(len(exploded), index))
+	values = np.concatenate(value_list) if value_list else np.empty(0, dtype=object)
+	bin_values = np.concatenate(bin_list) if bin_list else np.empty(0, dtype=object)
+	databases = np.concatenate(database_list) if database_list else np.empty(0, dtype=int)
+
+	#Integer codes of the values and bins, in the sorted order of a groupby
+	value_codes, unique_values = pd.factorize(values, sort=True)
+	bin_codes, bins = pd.factorize(bin_values, sort=True)
+	#One row per database and value, ordered by database and then by value
+	row_keys, row_codes = np.unique(databases * len(unique_values) + value_codes, return_inverse=True)
+
+	#Duplicate (row, bin) pairs are added together when converted to csr
+	counts = sparse.coo_matrix((np.ones(len(values), dtype=np.int64), (row_codes.reshape(-1), bin_codes)), shape=(len(row_keys), len(bins))).tocsr()
+	row_databases = row_keys // max(len(unique_values), 1)
+	row_values = np.asarray(unique_values, dtype=object)[row_keys % max(len(unique_values), 1)]
+
+	return profile_io.SparseProfile(counts, extract_list, row_databases, row_values, bins)
+
+
+def count_databases(extract_list, databases_df):
+	"""
+	This function counts the number of times a database value appears in a bin.
+	Input(s):
+	extract_list is a list of the desired databases to analyze.
+	databases_df is a pandas dataframe that maps each scaffold to metabolic pathway that are found for it.
+	Output(s):
+	final_df is a pandas dataframe indexed by the database values, with a column with the counts of each bin and a Total column.
+	"""
+
+	return database_counts_matrix(extract_list, databases_df).dense()
+
+
+def get_database_counts(extract_list, databases_df, out_format='tsv', stage_metrics=None, profile_format='dense'):
 	"""
 	This function saves a file containing the number of times a database value appears in a bin.
 	Input(s):
 	extract_list is a list of the desired databases to analyze.
 	databases_df is a pandas dataframe that maps each scaffold to metabolic pathway that are found for it.
+	out_format is a string containing the format of the saved file (tsv, parquet or feather).
+	stage_metrics is a metrics.StageMetrics the pivot and write phases are recorded in.
+	profile_format is a string containing the layout of the saved file: dense, long or sparse.
 	Output(s):
 	files_list is a list containing all the files created in this function.
 	"""
 
 	files_list = []
-	dfs_list = []
-
-	#For each database the user wants to analyze
-	for d in extract_list:
-		db_list = []
-		bin_list = []
-		#For the column containing the desired database
-		for row in range(len(databases_df[d])):
-			#For the row in the database column
-			for k in range(len(databases_df[d][row])):
-				#Append metabolic pathway and bin in a list of values per scaffold
-				db_list.append(databases_df[d][row][k])
-				bin_list.append(databases_df['Bin'][row])
-
-		#Create dataframe with each database value mapped to the bin that contains it
-		db_bin_df = pd.DataFrame(data={d: db_list, 'Bin': bin_list})
-		#Group by and count the number of times the metabolic pathway appears in a bin
-		count_df = db_bin_df.groupby([d, 'Bin']).size().reset_index()
-		#Rename columns
-		count_df.columns = [d, 'Bin', 'Count']
-		#Pivot long to wide so that row index are metabolic pathway and columns are the bin names
-		count_df = count_df.pivot(index=d, columns='Bin')
-		#Reorganize column names
-		count_df.columns = count_df.columns.droplevel()
-		#Replace NaN with 0.0
-		count_df = count_df.fillna(0)
-		#Create a total columns
-		count_df['Total'] = count_df.sum(axis=1)
-		#Rename index
-		count_df.index.names = [d]
-		count_df = count_df.reset_index()
-
-		dfs_list.append(count_df)
-
-	#Combine multiple database dataframes into one
-	final_df = pd.concat(dfs_list)
-	final_df = final_df.set_index(extract_list)
-	final_df = final_df.fillna(0.0)
+	if stage_metrics is None:
+		stage_metrics = metrics.StageMetrics('get_database_counts')
+
+	with stage_metrics.phase('pivot', databases_df) as phase:
+		profile = database_counts_matrix(extract_list, databases_df)
+		#The long and sparse layouts only hold the nonzero counts
+		if profile_format == 'dense':
+			final_df = profile.dense()
+		elif profile_format == 'long':
+			final_df = profile.long()
+		else:
+			final_df = profile
+		phase['rows_out'] = final_df
 	#Save dataframe containing multiple database columns
-	files_list.append(uniquify(os.path.dirname(os.path.abspath(__file__)) + '/../../output/complete_metabolic_profile.tsv').split('/')[-1])
-	final_df.to_csv(uniquify(os.path.dirname(os.path.abspath(__file__)) + '/../../output/complete_metabolic_profile.tsv'), sep='\t', index=True)
+	profile_path = uniquify(os.path.dirname(os.path.abspath(__file__)) + '/../../output/' + profile_io.profile_file_name(profile_format, out_format))
+	files_list.append(profile_path.split('/')[-1])
+	with stage_metrics.phase('write', final_df):
+		if profile_format == 'sparse':
+			profile.write(profile_path)
+		else:
+			table_io.write_table(final_df, profile_path, index=profile_format == 'dense')
 
 	return files_list
 
-def concat_img(img_path):
+def read_img_file(img, projected=True):
 	"""
-	This function will concatenate the IMG files if there are more than one present within a directory.
+	This function reads one IMG file.
 	Input(s):
-	img_path is a string containing the path to the img files needed for concatenation.
+	img is a string containing the path to the IMG file.
+	projected is a boolean value that determines if only the IMG_COLUMNS are read, with the annotations as categoricals.
 	Output(s):
-	img_file is a pandas dataframe that contains all the IMG information in one file.
+	img_df is a pandas dataframe that contains the IMG information.
 	"""
 
-	files_list = []
-	img_list = []
+	if not projected:
+		return table_io.read_table(img, default_format='tsv')
+
+	if table_io.table_format(img) in table_io.COLUMNAR_FORMATS:
+		img_df = table_io.read_table(img, default_format='tsv', columns=lambda c: c in IMG_COLUMNS, categories=True)
+	else:
+		img_df = table_io.read_table(img, default_format='tsv', columns=lambda c: c in IMG_COLUMNS, dtype=dict([(c, 'category') for c in IMG_CATEGORIES] + [('Original_Contig_Name', str)]))
+	for col in IMG_CATEGORIES:
+		if col in img_df.columns and not isinstance(img_df[col].dtype, pd.CategoricalDtype):
+			img_df[col] = img_df[col].astype('category')
+
+	return img_df
+
+
+def concat_categorical(img_list):
+	"""
+	This function concatenates dataframes column by column, keeping the categorical columns categorical.
+	Input(s):
+	img_list is a list of pandas dataframes.
+	Output(s):
+	img_df is a pandas dataframe with the rows of every dataframe and a new index.
+	"""
+
+	columns = []
+	for img_df in img_list:
+		columns = columns + [c for c in img_df.columns if c not in columns]
+
+	img_columns = {}
+	for col in columns:
+		#Files without the column get missing values
+		parts = [img_df[col] if col in img_df.columns else pd.Series(pd.Categorical([np.nan] * len(img_df))) for img_df in img_list]
+		if all([isinstance(part.dtype, pd.CategoricalDtype) for part in parts]):
+			img_columns[col] = pd.api.types.union_categoricals(parts, sort_categories=True)
+		else:
+			img_columns[col] = pd.concat(parts, ignore_index=True).to_numpy()
+
+	return pd.DataFrame(img_columns, columns=columns)
+
+
+def read_img_dir(img_path, projected=False, threads=1):
+	"""
+	This function reads and concatenates the IMG files present within a directory.
+	Input(s):
+	img_path is a string containing the path to the img files needed for concatenation.
+	projected is a boolean value that determines if only the IMG_COLUMNS are read, with the annotations as categoricals.
+	threads is the number of IMG files read at the same time.
+	Output(s):
+	img_file is a pandas dataframe that contains all the IMG information.
+	"""
 
 	if img_path[-1] != '/':
 		img_path = img_path + '/'
 
-	for img in glob.glob(img_path + '*'):
-		if img.endswith('.tsv'):
-			img_df = pd.read_csv(img, sep='\t')
-		elif img.endswith('.csv'):
-			img_df = pd.read_csv(img)
-		elif img.endswith('.txt'):
-			img_df = pd.read_csv(img, sep='\s+')
-		img_list.append(img_df)
+	img_files = [img for img in glob.glob(img_path + '*') if table_io.table_format(img) is not None]
+	if not img_files:
+		raise ValueError('No tsv, csv, txt, parquet or feather IMG files were found in ' + img_path)
+	#Read each IMG file in a separate process
+	reader = functools.partial(read_img_file, projected=projected)
+	if threads > 1 and len(img_files) > 1:
+		with multiprocessing.Pool(processes=min(threads, len(img_files))) as pool:
+			img_list = pool.map(reader, img_files)
+	else:
+		img_list = [reader(img) for img in img_files]
+
+	if projected:
+		img_file = concat_categorical(img_list)
+	else:
+		img_file = pd.concat(img_list)
+
+	return img_file
+
+
+def read_img_store(store_path, mapping_df, bins=None):
+	"""
+	This function reads the IMG annotations from an annotation store.
+	Input(s):
+	store_path is a string containing the path to the annotation store.
+	mapping_df is a pandas dataframe mapping the original contig name to its corresponding bin and sample.
+	bins is a list of the bins whose scaffolds are read. Every scaffold is read if None.
+	Output(s):
+	img_df is a pandas dataframe with the IMG_COLUMNS, with the annotations as categoricals.
+	"""
+
+	if not os.path.isfile(store_path):
+		raise ValueError('The annotation store ' + store_path + ' does not exist!')
+
+	#Only the scaffolds of the bins are read, through the index of the store
+	contigs = None
+	if bins is not None:
+		contigs = mapping_df.loc[mapping_df['Bin'].isin(bins), 'Original_Contig_Name'].tolist()
+	with annotation_store.AnnotationStore(store_path) as store:
+		img_df = store.query(IMG_COLUMNS, contigs=contigs, categories=IMG_CATEGORIES)
+	#Stores built without a bin map get the bins from the mapping file
+	if img_df['Bin'].isna().all():
+		img_df = img_df.drop(columns=['Bin'])
+
+	return img_df
 
-	img_file = pd.concat(img_list)
-	files_list.append(uniquify(os.path.dirname(os.path.abspath(__file__)) + '/../../output/IMG_consolidated_master.tsv').split('/')[-1])
-	img_file.to_csv(uniquify(os.path.dirname(os.path.abspath(__file__)) + '/../../output/IMG_consolidated_master.tsv'), sep='\t')
+
+def concat_img(img_path, out_format='tsv', stage_metrics=None, write_master=True, threads=1):
+	"""
+	This function will concatenate the IMG files if there are more than one present within a directory.
+	Input(s):
+	img_path is a string containing the path to the img files needed for concatenation.
+	out_format is a string containing the format of the saved file (tsv, parquet or feather).
+	stage_metrics is a metrics.StageMetrics the read and write phases are recorded in.
+	write_master is a boolean value that determines if every column of the IMG files is read and saved in one file.
+	threads is the number of IMG files read at the same time.
+	Output(s):
+	img_file is a pandas dataframe that contains all the IMG information in one file.
+	files_list is a list containing all the files created in this function.
+	"""
+
+	files_list = []
+	if stage_metrics is None:
+		stage_metrics = metrics.StageMetrics('concat_img')
+
+	with stage_metrics.phase('read') as phase:
+		#Only the columns used are read unless the consolidated file is saved
+		img_file = read_img_dir(img_path, not write_master, threads)
+		phase['rows_out'] = img_file
+	if write_master:
+		master_path = uniquify(os.path.dirname(os.path.abspath(__file__)) + '/../../output/' + table_io.output_name('IMG_consolidated_master', out_format))
+		files_list.append(master_path.split('/')[-1])
+		with stage_metrics.phase('write', img_file):
+			table_io.write_table(img_file, master_path, index=True)
 
 	return [img_file, files_list]
 
@@ -211,6 +433,7 @@ def main():
 
 	#Command line arguments
 	arguments = Command_line_args()
+	stage_metrics = metrics.StageMetrics.from_args('metabolic_profile', arguments.args)
 
 	saved_files = []
 
@@ -228,34 +451,69 @@ def main():
 			print('The ' + check + ' column is not mapped in the mapped_scaffolds file!')
 			quit()
 
+	#Reuse the previous outputs if the inputs and parameters did not change
+	output_dir = os.path.dirname(os.path.abspath(__file__)) + "/../../output/"
+	cached_files = [table_io.output_name('mapped_scaffolds', arguments.args.out_format), profile_io.profile_file_name(arguments.args.profile_format, arguments.args.out_format)]
+	if not arguments.args.imganno_file and arguments.args.write_master:
+		cached_files = [table_io.output_name('IMG_consolidated_master', arguments.args.out_format)] + cached_files
+	cache = stage_cache.StageCache.from_args(arguments.args)
+	bins = annotation_store.parse_names(arguments.args.bins)
+	read_store = arguments.args.annotation_store and not arguments.args.imganno_file and not arguments.args.imganno_path
+	cache_key = cache.key('metabolic_profile', [arguments.args.imganno_file, arguments.args.imganno_path, arguments.args.mapping] + ([arguments.args.annotation_store] if read_store else []), {'database': databases_list, 'consistency': arguments.args.consistency, 'out_format': arguments.args.out_format, 'profile_format': arguments.args.profile_format, 'write_master': arguments.args.write_master, 'annotation_store': arguments.args.annotation_store, 'bins': bins}, code=[__file__])
+	cached_files = [uniquify(output_dir + f) for f in cached_files]
+	if arguments.args.annotation_store and not read_store:
+		cached_files = cached_files + [arguments.args.annotation_store]
+	if cache.fetch(cache_key, cached_files):
+		print("Success!\nThe following files have been saved in the \"output\" directory:\n")
+		for f in cached_files:
+			print(os.path.basename(f))
+		print()
+		stage_metrics.finish('cached')
+		return
+
 	#Read mapping file created previously (bin_abundance step)
-	mapping_df = pd.read_csv(arguments.args.mapping, sep="\t")
+	with stage_metrics.phase('read') as phase:
+		mapping_df = table_io.read_table(arguments.args.mapping, default_format='tsv')
+		phase['rows_out'] = mapping_df
 
 
 	#Read in IMG annotated file
-	if arguments.args.imganno_file:
+	if read_store:
+		print('Reading the IMG information from the annotation store.')
+		with stage_metrics.phase('read') as phase:
+			img_df = read_img_store(arguments.args.annotation_store, mapping_df, bins)
+			phase['rows_out'] = img_df
+	elif arguments.args.imganno_file:
 		print('Reading in consolidated IMG file.')
-		if arguments.args.imganno_file.endswith('.tsv'):
-			img_df = pd.read_csv(arguments.args.imganno_file, sep='\t')
-		elif arguments.args.imganno_file.endswith('.csv'):
-			img_df = pd.read_csv(arguments.args.imganno_file)
-		elif arguments.args.imganno_file.endswith('.txt'):
-			img_df = pd.read_csv(arguments.args.imganno_file, sep='\s+')
+		with stage_metrics.phase('read') as phase:
+			img_df = read_img_file(arguments.args.imganno_file)
+			phase['rows_out'] = img_df
 	else:
-		print('Creating a consolidated IMG file containing all the IMG information for ALL sample(s).')
-		img_concat = concat_img(arguments.args.imganno_path)
+		if arguments.args.write_master:
+			print('Creating a consolidated IMG file containing all the IMG information for ALL sample(s).')
+		else:
+			print('Reading the IMG information for ALL sample(s).')
+		img_concat = concat_img(arguments.args.imganno_path, arguments.args.out_format, stage_metrics, arguments.args.write_master, arguments.args.threads)
 		img_df = img_concat[0]
 		saved_files = img_concat[1]
+	#Save the annotations read in the annotation store
+	if arguments.args.annotation_store and not read_store:
+		with stage_metrics.phase('write', img_df):
+			with annotation_store.AnnotationStore(arguments.args.annotation_store, overwrite=True) as store:
+				store.add(img_df)
+				store.create_indexes()
 	print('Beginning to map scaffolds to bins and database values. Getting count of each database value in each bin. This may take a while.')
 	#Map scaffolds to each of the databases
-	scaffold_mapping = map_scaffolds(arguments, img_df, mapping_df)
+	scaffold_mapping = map_scaffolds(arguments, img_df, mapping_df, stage_metrics)
 	databases_df = scaffold_mapping[0]
 	if len(saved_files) == 0:
 		saved_files = scaffold_mapping[1]
 	else:
 		saved_files = saved_files + scaffold_mapping[1]
 	#Get the counts of each metabolic pathway in each bin
-	saved_files = saved_files + get_database_counts(databases_list, databases_df)
+	saved_files = saved_files + get_database_counts(databases_list, databases_df, arguments.args.out_format, stage_metrics, arguments.args.profile_format)
+	cache.store(cache_key, [output_dir + f for f in saved_files] + ([arguments.args.annotation_store] if arguments.args.annotation_store and not read_store else []))
+	stage_metrics.finish()
 
 	print("Success!\nThe following files have been saved in the \"output\" directory:\n")
 	for f in saved_files:
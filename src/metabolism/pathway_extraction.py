@@ -16,6 +16,12 @@
 import argparse
 import os
 import pandas as pd
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from utils import metrics
+from utils import profile_io
+from utils import table_io
 
 
 class Command_line_args():
@@ -32,61 +38,54 @@ class Command_line_args():
 		#Command line arguments
 		self.parser = argparse.ArgumentParser()
 		self.parser.add_argument('-c', '--customdata', required=True, help=("Input file in tsv format with at least one column with the header containing the pathways of interest. The headers of the metabolic pathway must correspond with its respective database (eg. KEGG, COG, PFAM, or EC_NUMBER)."))
-		self.parser.add_argument('-p', '--pathway_database', required=True, help=("Input file in tsv format that contains the counts of each pathways per bin."))
+		self.parser.add_argument('-p', '--pathway_database', required=True, help=("Input file from metabolic_profile.py that contains the counts of each pathways per bin, in the dense, long or sparse (.npz) layout."))
 		self.parser.add_argument('-d', '--database', required=True, help=("Database(s) of interest to merge together. Input as a list."))
+		table_io.add_format_argument(self.parser)
+		metrics.add_metrics_arguments(self.parser)
 		self.args = self.parser.parse_args()
 
 
-def main():
-
-	print('Make sure the pathway codes in the user provided file are formatted the same as it is throughout MetaGaia!')
-	#Command line arguments
-	arguments = Command_line_args()
-
-	#Create output directory if not already present
-	if not os.path.exists(os.path.dirname(os.path.abspath(__file__)) + "/../../output"):
-		os.makedirs(os.path.dirname(os.path.abspath(__file__)) + "/../../output")
+def extract_pathways(user_df, pathway_df, databases_list):
+	"""
+	This function extracts the pathways of interest from the metabolic profile.
+	Input(s):
+	user_df is a pandas dataframe with a column for each database containing the pathways of interest.
+	pathway_df is a pandas dataframe that contains the counts of each pathway per bin, with a column for each database, or a profile_io.SparseProfile.
+	databases_list is a list of the databases of interest.
+	Output(s):
+	final_df is a pandas dataframe with the extracted pathways indexed by their database value.
+	"""
 
 	pathways_lst = []
 
-	#Read in files
-	user_df = pd.read_csv(arguments.args.customdata, sep='\t', index_col=False)
-	pathway_df = pd.read_csv(arguments.args.pathway_database, sep='\t', index_col=False)
-
-	#Verify database name is valid
-	if ' ' in arguments.args.database:
-		databases_list = arguments.args.database.upper().strip('[]').split(', ')
-	else:
-		databases_list = arguments.args.database.upper().strip('[]').split(',')
 	for check in databases_list:
-		if check not in ['KEGG', 'COG', 'PFAM', 'EC_NUMBER']:
-			print('Invalid database name was entered!')
-			quit()
-		else:
-			#Unstack columns with muliple values if necessary
-			if user_df[check].str.contains(',').sum() > 1:
-				if user_df[check].str.contains(', ').sum() > 1:
-					add_df = user_df[check].str.split(', ').apply(pd.Series,1).stack()
-				else:
-					add_df = user_df[check].str.split(',').apply(pd.Series,1).stack()
-				add_df.index = add_df.index.droplevel(-1)
-				add_df.name = check
-				del user_df[check]
-				user_df = user_df.join(add_df)
-
-			for val in user_df[check]:
-				if check == 'KEGG':
-					if str(val)[:3] != 'KO:':
-						user_df.loc[user_df[check] == str(val), check] = 'KO:' + str(val)
-				elif check == 'PFAM':
-					if str(val)[:4] != 'pfam':
-						user_df.loc[user_df[check] == str(val), check] = 'pfam' + str(val)[2:]
-				elif check == 'EC_NUMBER':
-					if str(val)[:3] != 'EC:':
-						user_df.loc[user_df[check] == str(val), check] = 'EC:' + str(val)
+		#Unstack columns with muliple values if necessary
+		if user_df[check].str.contains(',').sum() > 1:
+			if user_df[check].str.contains(', ').sum() > 1:
+				add_df = user_df[check].str.split(', ').apply(pd.Series,1).stack()
+			else:
+				add_df = user_df[check].str.split(',').apply(pd.Series,1).stack()
+			add_df.index = add_df.index.droplevel(-1)
+			add_df.name = check
+			del user_df[check]
+			user_df = user_df.join(add_df)
+
+		for val in user_df[check]:
+			if check == 'KEGG':
+				if str(val)[:3] != 'KO:':
+					user_df.loc[user_df[check] == str(val), check] = 'KO:' + str(val)
+			elif check == 'PFAM':
+				if str(val)[:4] != 'pfam':
+					user_df.loc[user_df[check] == str(val), check] = 'pfam' + str(val)[2:]
+			elif check == 'EC_NUMBER':
+				if str(val)[:3] != 'EC:':
+					user_df.loc[user_df[check] == str(val), check] = 'EC:' + str(val)
 	user_df = user_df.reset_index().drop(columns=['index'])
 
-	print('Beginning to extract pathway information.')
+	#Only lay out the pathways of interest of a sparse profile
+	if isinstance(pathway_df, profile_io.SparseProfile):
+		pathway_df = pathway_df.dense(set(user_df[databases_list].stack().tolist())).reset_index()
+
 	for d in databases_list:
 		#Subset dataframe
 		extracted_df = pathway_df[pathway_df[d].isin(user_df[d].unique())]
@@ -110,9 +109,51 @@ def main():
 	#Combine all dataframes
 	final_df = pd.concat(pathways_lst)
 	final_df = final_df.set_index('Database')
+
+	return final_df
+
+
+def main():
+
+	print('Make sure the pathway codes in the user provided file are formatted the same as it is throughout MetaGaia!')
+	#Command line arguments
+	arguments = Command_line_args()
+	stage_metrics = metrics.StageMetrics.from_args('pathway_extraction', arguments.args)
+
+	#Create output directory if not already present
+	if not os.path.exists(os.path.dirname(os.path.abspath(__file__)) + "/../../output"):
+		os.makedirs(os.path.dirname(os.path.abspath(__file__)) + "/../../output")
+
+	#Read in files
+	with stage_metrics.phase('read') as phase:
+		user_df = table_io.read_table(arguments.args.customdata, default_format='tsv', index_col=False)
+		if profile_io.profile_layout(arguments.args.pathway_database) == 'dense':
+			pathway_df = table_io.read_table(arguments.args.pathway_database, default_format='tsv', index_col=False)
+		else:
+			pathway_df = profile_io.read_profile(arguments.args.pathway_database)
+		phase['rows_out'] = pathway_df
+
+	#Verify database name is valid
+	if ' ' in arguments.args.database:
+		databases_list = arguments.args.database.upper().strip('[]').split(', ')
+	else:
+		databases_list = arguments.args.database.upper().strip('[]').split(',')
+	for check in databases_list:
+		if check not in ['KEGG', 'COG', 'PFAM', 'EC_NUMBER']:
+			print('Invalid database name was entered!')
+			quit()
+
+	print('Beginning to extract pathway information.')
+	with stage_metrics.phase('merge', pathway_df) as phase:
+		final_df = extract_pathways(user_df, pathway_df, databases_list)
+		phase['rows_out'] = final_df
+
 	#Save file
-	final_df.to_csv(os.path.dirname(os.path.abspath(__file__)) + '/../../output/extracted_pathways.tsv', sep='\t', index=True)
-	print("Success!\nThe following files have been saved in the \"output\" directory:\n\nextracted_pathways.tsv\n")
+	extracted_file = table_io.output_name('extracted_pathways', arguments.args.out_format)
+	with stage_metrics.phase('write', final_df):
+		table_io.write_table(final_df, os.path.dirname(os.path.abspath(__file__)) + '/../../output/' + extracted_file, index=True)
+	stage_metrics.finish()
+	print("Success!\nThe following files have been saved in the \"output\" directory:\n\n" + extracted_file + "\n")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     metagaia.py
+# Purpose:  run the MetaGaia scripts as one pipeline described by a config file,
+#           passing the tables between the steps in memory.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+"""Run the MetaGaia pipeline from a JSON (or YAML) config file.
+
+The config has one section per step to run (files_prep, bin_abundance,
+bin_abundance_viz, img_bin_map, gff3_img5, metabolic_profile,
+pathway_extraction, amg_hostvi and spacer_extract_crt), holding the options
+of the script of the same name. Steps that are not in the config are not run,
+and the tables they would create can be given as files in the "tables" section.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import pandas as pd
+import sys
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+#Make the scripts importable by name, including the ones in the host-virus directory
+for script_dir in ['abundance', 'metabolism', 'host-virus', '']:
+    sys.path.insert(0, os.path.join(SRC_DIR, script_dir))
+from utils import metrics
+from utils import pipeline
+from utils import profile_io
+from utils import table_io
+
+
+STAGES = ['files_prep', 'bin_abundance', 'bin_abundance_viz', 'img_bin_map', 'gff3_img5',
+          'metabolic_profile', 'pathway_extraction', 'amg_hostvi', 'spacer_extract_crt']
+#File names the tables are saved as, the same as the scripts use
+TABLE_FILES = {
+    'reads': 'reads_file',
+    'binsize': 'binsize_file',
+    'contig_stats': 'contig_stats',
+    'mapping': 'mapping_file',
+    'depth': 'depth_file',
+    'abundance': 'MetaGaia_OUT_abundanceby_bin',
+    'top_abundances': 'top_sample_abundances',
+    'img_map': 'img_bin_map',
+    'img_annotations': 'img_annotations',
+    'mapped_scaffolds': 'mapped_scaffolds',
+    'metabolic_profile': 'complete_metabolic_profile',
+    'extracted_pathways': 'extracted_pathways',
+    'phage_host_metabolism': 'phage_host_metabolism',
+    'phage_host_mapping': 'phage_host_mapping',
+}
+#Tables saved with their index, as the scripts do
+INDEXED_TABLES = ['top_abundances', 'img_annotations', 'extracted_pathways']
+DATABASES = ['KEGG', 'COG', 'PFAM', 'EC_NUMBER']
+
+
+def load_config(config_file):
+    """
+    Reads the pipeline config file.
+    Input(s):
+    config_file is a string containing the path to a .json, .yaml or .yml file.
+    Output(s):
+    A dictionary with the config.
+    """
+
+    with open(config_file, 'r') as handle:
+        if os.path.splitext(config_file)[1].lower() in ['.yaml', '.yml']:
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('YAML config files require PyYAML. To install it, run `pip install pyyaml`, or use a JSON config file.')
+            config = yaml.safe_load(handle)
+        else:
+            config = json.load(handle)
+
+    unknown = [k for k in config if k not in STAGES + ['output_dir', 'out_format', 'threads', 'write', 'tables', 'metrics_json', 'profile_dir']]
+    if unknown:
+        raise ValueError('Unknown config section(s): ' + ', '.join(unknown))
+
+    return config
+
+
+def database_list(database, allowed=DATABASES):
+    """
+    Parses the database option of a step.
+    Input(s):
+    database is a list of database names or a comma-separated string, as given to the scripts.
+    allowed is a list of the database names the step accepts.
+    Output(s):
+    A list of upper case database names.
+    """
+
+    if isinstance(database, str):
+        database = database.strip('[]').replace(' ', '').split(',')
+    database = [d.upper() for d in database]
+    for check in database:
+        if check not in allowed:
+            raise ValueError('Invalid database name {}! Choose from {}.'.format(check, ', '.join(allowed)))
+
+    return database
+
+
+def files_prep_stage(options, threads):
+    """
+    Creates the reads, binsize, contig stats, mapping and depth tables (files_prep.py).
+    """
+
+    files_prep = importlib.import_module('files_prep')
+
+    def run(tables):
+        fastq_dir = os.path.join(options['fastq_dir'], '')
+        fna_dir = os.path.join(options['fna_dir'], '')
+        bin_sample_df = table_io.read_table(options['bin_samples'], default_format='tsv')
+
+        reads_df = files_prep.count_reads(fastq_dir, options.get('threads', threads), options.get('chunk_size', 4194304), options.get('paired', False))
+        binsize_df, contig_df = files_prep.scan_bins(fna_dir, options.get('threads', threads))
+        mapping_df = files_prep.map_contigs(bin_sample_df, contig_df)
+        if options.get('depth'):
+            depth_df = files_prep.format_wide_depth(table_io.read_table(options['depth'], default_format='tsv'))
+        else:
+            depth_df = pd.concat(list(files_prep.iter_depth_files(files_prep.list_depth_files(options['depth_dir']))))
+
+        return {'reads': reads_df, 'binsize': binsize_df, 'contig_stats': contig_df, 'mapping': mapping_df, 'depth': depth_df}
+
+    return pipeline.Stage('files_prep', run, [], ['reads', 'binsize', 'contig_stats', 'mapping', 'depth'])
+
+
+def bin_abundance_stage(options):
+    """
+    Calculates the abundance of each bin in each sample (bin_abundance.py).
+    """
+
+    bin_abundance = importlib.import_module('bin_abundance')
+
+    def run(tables):
+        abundance_df = bin_abundance.calculate_abundance(tables['reads'], tables['mapping'], tables['depth'], tables['binsize'], float(options.get('readablenum', 100000000)))
+        return {'abundance': abundance_df}
+
+    return pipeline.Stage('bin_abundance', run, ['reads', 'mapping', 'depth', 'binsize'], ['abundance'])
+
+
+def bin_abundance_viz_stage(options):
+    """
+    Plots the bin abundances and returns the top bins in each sample (bin_abundance_viz.py).
+    """
+
+    #Plots are only saved to files, never shown, and may be drawn outside the main thread
+    import matplotlib
+    matplotlib.use('Agg')
+    bin_abundance_viz = importlib.import_module('bin_abundance_viz')
+
+    #The bin abundances are passed in memory, so -b is left empty
+    argv = ['-b', '']
+    for option, value in options.items():
+        #Flags such as "batch": true are given without a value
+        if value is True:
+            argv = argv + ['--' + option]
+        elif value is not False:
+            argv = argv + ['--' + option, str(value)]
+    arguments = bin_abundance_viz.Command_line_args(argv)
+
+    def run(tables):
+        top_df = bin_abundance_viz.visualize(arguments, tables['abundance'], table_io.read_table(arguments.args.taxonomy_info, default_format='tsv'))
+        return {'top_abundances': top_df}
+
+    return pipeline.Stage('bin_abundance_viz', run, ['abundance'], ['top_abundances'])
+
+
+def img_bin_map_stage(options):
+    """
+    Maps IMG and GOLD contig IDs to the bins (img_bin_map.py).
+    """
+
+    img_bin_map = importlib.import_module('img_bin_map')
+
+    def run(tables):
+        img_map_df = img_bin_map.map_gold(scaffold_map = options['contig_map'],
+            sample_map = options['gold_sample_map'],
+            bin_map = tables['mapping'],
+            scaffold_samples = True,
+            only_bin = True)
+        return {'img_map': img_map_df}
+
+    return pipeline.Stage('img_bin_map', run, ['mapping'], ['img_map'])
+
+
+def gff3_img5_stage(options, use_img_map, threads):
+    """
+    Parses the IMG GFF3 annotations (gff3_img5.py).
+    """
+
+    gff3_img5 = importlib.import_module('gff3_img5')
+    fields = options.get('fields', 'ID,ko,pfam,ec_number,cog,locus_tag')
+    if isinstance(fields, str):
+        fields = fields.split(',')
+
+    def run(tables):
+        if options.get('input_gff'):
+            img_df = gff3_img5.gff3_to_df(gff_file = options['input_gff'], attribute_select = fields, format = 'img5', coordinates = options.get('coordinates', False))
+        else:
+            img_df = gff3_img5.gff_pd_multiread(path_file = options['path_file'], attr_sel = fields, threads = options.get('threads', threads), coordinates = options.get('coordinates', False))
+        return {'img_annotations': gff3_img5.annotate_scaffolds(img_df, tables.get('img_map'))}
+
+    return pipeline.Stage('gff3_img5', run, ['img_map'] if use_img_map else [], ['img_annotations'])
+
+
+def metabolic_profile_stage(options, use_img_annotations, threads):
+    """
+    Counts the metabolic pathways of each bin (metabolic_profile.py).
+    """
+
+    metabolic_profile = importlib.import_module('metabolic_profile')
+    databases = database_list(options['database'])
+
+    def run(tables):
+        if use_img_annotations:
+            img_df = tables['img_annotations']
+        elif options.get('imganno_file'):
+            img_df = metabolic_profile.read_img_file(options['imganno_file'])
+        else:
+            img_df = metabolic_profile.read_img_dir(options['imganno_path'], True, options.get('threads', threads))
+        databases_df = metabolic_profile.scaffold_databases(img_df, tables['mapping'], options.get('consistency', ''))
+        profile_df = metabolic_profile.count_databases(databases, databases_df).reset_index()
+        return {'mapped_scaffolds': databases_df, 'metabolic_profile': profile_df}
+
+    inputs = ['img_annotations', 'mapping'] if use_img_annotations else ['mapping']
+    return pipeline.Stage('metabolic_profile', run, inputs, ['mapped_scaffolds', 'metabolic_profile'])
+
+
+def pathway_extraction_stage(options):
+    """
+    Extracts the pathways of interest from the metabolic profile (pathway_extraction.py).
+    """
+
+    pathway_extraction = importlib.import_module('pathway_extraction')
+    databases = database_list(options['database'])
+
+    def run(tables):
+        user_df = table_io.read_table(options['customdata'], default_format='tsv', index_col=False)
+        return {'extracted_pathways': pathway_extraction.extract_pathways(user_df, tables['metabolic_profile'], databases)}
+
+    return pipeline.Stage('pathway_extraction', run, ['metabolic_profile'], ['extracted_pathways'])
+
+
+def amg_hostvi_stage(options, threads):
+    """
+    Finds the metabolic pathways shared by phages and their hosts (amg_hostvi.py).
+    """
+
+    amg_hostvi = importlib.import_module('amg_hostvi')
+    database = database_list(options['database'], ['KEGG', 'PFAM'])[0]
+
+    def run(tables):
+        phage_df = amg_hostvi.read_vibrant(options.get('vibrant_file'), options.get('vibrant_path'), database, options.get('threads', threads))
+        phage_host_df, phage_host_mapping_df = amg_hostvi.compare_metabolism(tables['metabolic_profile'], phage_df, database)
+        return {'phage_host_metabolism': phage_host_df, 'phage_host_mapping': phage_host_mapping_df}
+
+    return pipeline.Stage('amg_hostvi', run, ['metabolic_profile'], ['phage_host_metabolism', 'phage_host_mapping'])
+
+
+def spacer_extract_crt_stage(options, use_img_map, output_dir):
+    """
+    Writes the CRISPR spacers found by CRT to a FASTA file (spacer_extract_crt.py).
+    """
+
+    spacer_extract_crt = importlib.import_module('spacer_extract_crt')
+
+    def run(tables):
+        found = spacer_extract_crt.extract_spacers(crt_file = options['crt_file'],
+            output_fasta = options.get('output_fasta', os.path.join(output_dir, 'crispr_spacers.fasta')),
+            min_spacer_length = options.get('min_spacer_length', 23),
+            min_repeat_length = options.get('min_repeat_length', 11),
+            min_repeats = options.get('min_repeats', 3),
+            quality_off = options.get('quality_off', False),
+            img_map = tables.get('img_map'),
+            stream = options.get('stream', False),
+            chunksize = options.get('chunksize', 100000))
+        if not found:
+            raise ValueError('No CRISPR was found in {}!'.format(options['crt_file']))
+        return {}
+
+    return pipeline.Stage('spacer_extract_crt', run, ['img_map'] if use_img_map else [], [])
+
+
+def build_pipeline(config, given_tables):
+    """
+    Creates the steps listed in the config.
+    Input(s):
+    config is a dictionary with the config.
+    given_tables is a list of the names of the tables given as files in the config.
+    Output(s):
+    A pipeline.Pipeline.
+    """
+
+    threads = config.get('threads', 4)
+    output_dir = config.get('output_dir', os.path.join(SRC_DIR, '..', 'output'))
+    stages = []
+    if 'files_prep' in config:
+        stages.append(files_prep_stage(config['files_prep'], threads))
+    if 'bin_abundance' in config:
+        stages.append(bin_abundance_stage(config['bin_abundance']))
+    if 'bin_abundance_viz' in config:
+        stages.append(bin_abundance_viz_stage(config['bin_abundance_viz']))
+    if 'img_bin_map' in config:
+        stages.append(img_bin_map_stage(config['img_bin_map']))
+    has_img_map = 'img_bin_map' in config or 'img_map' in given_tables
+    if 'gff3_img5' in config:
+        stages.append(gff3_img5_stage(config['gff3_img5'], has_img_map, threads))
+    if 'metabolic_profile' in config:
+        has_annotations = 'gff3_img5' in config or 'img_annotations' in given_tables
+        stages.append(metabolic_profile_stage(config['metabolic_profile'], has_annotations, threads))
+    if 'pathway_extraction' in config:
+        stages.append(pathway_extraction_stage(config['pathway_extraction']))
+    if 'amg_hostvi' in config:
+        stages.append(amg_hostvi_stage(config['amg_hostvi'], threads))
+    if 'spacer_extract_crt' in config:
+        stages.append(spacer_extract_crt_stage(config['spacer_extract_crt'], has_img_map, output_dir))
+
+    return pipeline.Pipeline(stages)
+
+
+def run_pipeline(config_file):
+    """
+    Runs the pipeline described by a config file and saves the requested tables.
+    Input(s):
+    config_file is a string containing the path to the config file.
+    Output(s):
+    A list containing the paths to the saved tables.
+    """
+
+    config = load_config(config_file)
+    output_dir = config.get('output_dir', os.path.join(SRC_DIR, '..', 'output'))
+    out_format = config.get('out_format', 'tsv')
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    #Tables given as files instead of being created by a step
+    tables = {}
+    for name, path in config.get('tables', {}).items():
+        if name not in TABLE_FILES:
+            raise ValueError('Unknown table {}! Choose from {}.'.format(name, ', '.join(TABLE_FILES)))
+        if name == 'metabolic_profile' and profile_io.profile_layout(path) != 'dense':
+            tables[name] = profile_io.read_profile(path).dense().reset_index()
+        else:
+            tables[name] = table_io.read_table(path, default_format='tsv')
+
+    metagaia = build_pipeline(config, list(tables.keys()))
+
+    #Save the requested tables, by default the ones no step uses
+    write = config.get('write')
+    if write == 'all':
+        write = [t for s in metagaia.stages for t in s.outputs]
+    elif write is None:
+        used = set([t for s in metagaia.stages for t in s.inputs])
+        write = [t for s in metagaia.stages for t in s.outputs if t not in used]
+    elif isinstance(write, str):
+        write = [write]
+    elif not isinstance(write, list):
+        raise ValueError('write must be "all", a table name or a list of table names, not {!r}'.format(write))
+    unknown = [t for t in write if t not in TABLE_FILES]
+    if unknown:
+        raise ValueError('Unknown table(s) to write: ' + ', '.join(unknown))
+
+    saved = []
+    def save_table(name, df):
+        if name in write:
+            path = os.path.join(output_dir, table_io.output_name(TABLE_FILES[name], out_format))
+            table_io.write_table(df, path, index=name in INDEXED_TABLES)
+            saved.append(path)
+
+    metagaia.run(tables, threads=config.get('threads', 4), on_table=save_table, profile_dir=config.get('profile_dir', ''))
+    if config.get('metrics_json'):
+        metrics.write_metrics(config['metrics_json'], metagaia.metrics)
+
+    print("Success!\nThe following files have been saved in the \"" + output_dir + "\" directory:\n\n" + "\n".join([os.path.basename(f) for f in saved]) + "\n")
+
+    return saved
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='Run the steps described by a config file.')
+    run_parser.add_argument('-c', '--config', required=True, type=str, help='Pipeline config file in JSON format, or YAML if PyYAML is installed.')
+    args = parser.parse_args()
+
+    if args.command != 'run':
+        parser.print_help()
+        sys.exit(1)
+
+    #Steps run in threads, so worker processes are started fresh instead of forked from them
+    multiprocessing.set_start_method('spawn')
+    run_pipeline(args.config)
+
+
+if __name__ == "__main__":
+    main()
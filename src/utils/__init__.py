@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     utils
+# Purpose:  helpers shared by the MetaGaia abundance, metabolism and host-virus scripts.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     annotation_store.py
+# Purpose:  keep the gene annotations of the GFF3 and IMG files in a SQLite file indexed by IMG contig,
+#           original contig and bin, so the annotations of a few bins or scaffolds can be read without the whole project.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import os
+import sqlite3
+
+import pandas as pd
+
+
+ANNOTATION_TABLE = 'annotations'
+#Columns of the store, as named by gff3_img5.py and in the IMG files. Columns missing from a table are left empty.
+STORE_COLUMNS = ['IMG_Gene_ID', 'Locus_Tag', 'IMG_Contig_Name', 'Original_Contig_Name', 'Bin', 'Gene_Type',
+                 'Gene_Start', 'Gene_Stop', 'Strand', 'KO_Term', 'COG_ID', 'PFAM_ID', 'EC_Number']
+INTEGER_COLUMNS = ['Gene_Start', 'Gene_Stop']
+#Columns the queries select rows by
+INDEXED_COLUMNS = ['IMG_Contig_Name', 'Original_Contig_Name', 'Bin']
+#Annotation column of each database of the metabolic profile
+DATABASE_COLUMNS = {'KEGG': 'KO_Term', 'COG': 'COG_ID', 'PFAM': 'PFAM_ID', 'EC_NUMBER': 'EC_Number'}
+
+
+def add_store_argument(parser, help_text):
+    """
+    Adds the --annotation_store command line argument to a script's parser.
+    Input(s):
+    parser is an argparse.ArgumentParser.
+    help_text is a string describing how the script uses the store.
+    Output(s):
+    None.
+    """
+
+    parser.add_argument('-s', '--annotation_store', required=False, type=str, default='', help=help_text + ' [""].')
+
+
+def parse_names(names):
+    """
+    Reads a list of bins or scaffolds given on the command line.
+    Input(s):
+    names is a string containing comma separated names, or the path to a file with one name per line.
+    Output(s):
+    A list of strings, or None if names is empty.
+    """
+
+    if not names:
+        return None
+    if os.path.isfile(names):
+        with open(names, 'r') as handle:
+            return [line.strip() for line in handle if line.strip()]
+
+    return [name.strip() for name in names.split(',') if name.strip()]
+
+
+class AnnotationStore():
+    """
+    This class reads and writes the gene annotations in a SQLite file, with a row per gene.
+    Input(s):
+    path is a string containing the path to the SQLite file. It is created if it does not exist.
+    overwrite is a boolean value that determines if the annotations already in the file are removed.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, path, overwrite=False):
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        if overwrite:
+            self.connection.execute('DROP TABLE IF EXISTS {}'.format(ANNOTATION_TABLE))
+        column_types = ', '.join(['{} {}'.format(c, 'INTEGER' if c in INTEGER_COLUMNS else 'TEXT') for c in STORE_COLUMNS])
+        self.connection.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(ANNOTATION_TABLE, column_types))
+        self.connection.commit()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+    def add(self, annotations_df):
+        """
+        Appends annotations to the store.
+        Input(s):
+        annotations_df is a pandas dataframe with some of the STORE_COLUMNS, e.g. the output of gff3_img5.py or an IMG file.
+        Output(s):
+        The number of rows added.
+        """
+
+        columns = [c for c in STORE_COLUMNS if c in annotations_df.columns]
+        if not columns:
+            raise ValueError('None of the columns {} are in the annotations!'.format(', '.join(STORE_COLUMNS)))
+        #Missing values are stored as NULL
+        values = annotations_df[columns].astype(object)
+        values = values.where(values.notna(), None)
+        self.connection.executemany('INSERT INTO {} ({}) VALUES ({})'.format(ANNOTATION_TABLE, ', '.join(columns), ', '.join(['?'] * len(columns))),
+                                    values.itertuples(index=False, name=None))
+        self.connection.commit()
+
+        return len(values)
+
+    def create_indexes(self):
+        """
+        Indexes the store by IMG contig, original contig and bin. Called once the annotations are added, as
+        filling an indexed table is slower.
+        Input(s):
+        No other inputs needed.
+        Output(s):
+        None.
+        """
+
+        for col in INDEXED_COLUMNS:
+            self.connection.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(ANNOTATION_TABLE, col))
+        self.connection.execute('ANALYZE')
+        self.connection.commit()
+
+    def selection(self, bins=None, contigs=None, img_contigs=None):
+        """
+        Builds the WHERE clause selecting the genes of some bins or scaffolds. The names are put in temporary
+        tables, so any number of them can be given.
+        Input(s):
+        bins is a list of the bins to select, or None for every bin.
+        contigs is a list of the original contig names to select, or None for every contig.
+        img_contigs is a list of the IMG contig names to select, or None for every contig.
+        Output(s):
+        A string containing the WHERE clause, empty if nothing is selected.
+        """
+
+        conditions = []
+        for col, names in [('Bin', bins), ('Original_Contig_Name', contigs), ('IMG_Contig_Name', img_contigs)]:
+            if names is None:
+                continue
+            name_table = 'selected_' + col
+            self.connection.execute('DROP TABLE IF EXISTS temp.{}'.format(name_table))
+            self.connection.execute('CREATE TEMP TABLE {} (name TEXT PRIMARY KEY)'.format(name_table))
+            self.connection.executemany('INSERT OR IGNORE INTO temp.{} VALUES (?)'.format(name_table), [(str(name),) for name in names])
+            conditions.append('{} IN (SELECT name FROM temp.{})'.format(col, name_table))
+
+        if not conditions:
+            return ''
+
+        return ' WHERE ' + ' AND '.join(conditions)
+
+    def query(self, columns=None, bins=None, contigs=None, img_contigs=None, categories=()):
+        """
+        Reads the annotations of some bins or scaffolds, e.g. all the KO terms of 50 bins or the genes of some viral scaffolds.
+        Input(s):
+        columns is a list of the STORE_COLUMNS to read, or None for all of them.
+        bins is a list of the bins to select, or None for every bin.
+        contigs is a list of the original contig names to select, or None for every contig.
+        img_contigs is a list of the IMG contig names to select, or None for every contig.
+        categories is a list of the columns returned as categoricals.
+        Output(s):
+        A pandas dataframe with a row per gene, in the order the genes were added.
+        """
+
+        columns = STORE_COLUMNS if columns is None else columns
+        unknown = [c for c in columns if c not in STORE_COLUMNS]
+        if unknown:
+            raise ValueError('{} are not columns of the annotation store!'.format(', '.join(unknown)))
+
+        where = self.selection(bins, contigs, img_contigs)
+        annotations_df = pd.read_sql_query('SELECT {} FROM {}{} ORDER BY rowid'.format(', '.join(columns), ANNOTATION_TABLE, where), self.connection)
+        for col in INTEGER_COLUMNS:
+            if col in annotations_df.columns:
+                annotations_df[col] = annotations_df[col].astype('Int64')
+        for col in categories:
+            if col in annotations_df.columns:
+                annotations_df[col] = annotations_df[col].astype('category')
+
+        return annotations_df
+
+    def bin_counts(self, database, bins=None):
+        """
+        Counts the scaffolds of each bin with each value of a database, as in the metabolic profile.
+        Genes without a bin are left out.
+        Input(s):
+        database is a string containing the database: KEGG, COG, PFAM or EC_NUMBER.
+        bins is a list of the bins to count, or None for every bin.
+        Output(s):
+        A pandas dataframe with the Database, Pathway, Bin and Count columns, ordered by pathway and bin.
+        """
+
+        col = DATABASE_COLUMNS[database]
+        where = self.selection(bins)
+        where = (where + ' AND ' if where else ' WHERE ') + '{} IS NOT NULL AND Bin IS NOT NULL'.format(col)
+        #Scaffolds without an original name are counted by their IMG name
+        counts_df = pd.read_sql_query('SELECT {0} AS Pathway, Bin, COUNT(DISTINCT COALESCE(Original_Contig_Name, IMG_Contig_Name)) AS Count '
+                                      'FROM {1}{2} GROUP BY {0}, Bin ORDER BY {0}, Bin'.format(col, ANNOTATION_TABLE, where), self.connection)
+        counts_df.insert(0, 'Database', database)
+
+        return counts_df
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        Input(s):
+        No other inputs needed.
+        Output(s):
+        None.
+        """
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
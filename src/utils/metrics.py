@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     metrics.py
+# Purpose:  record the wall time, CPU time, peak memory and row counts of each phase
+#           of a MetaGaia step, and save them as json with an optional cProfile dump.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import atexit
+import contextlib
+import cProfile
+import datetime
+import json
+import numbers
+import os
+import resource
+import sys
+import time
+
+
+#Names of the phases recorded by the scripts, so the metrics of different steps can be compared
+PHASES = ['read', 'merge', 'groupby', 'pivot', 'write']
+
+
+def add_metrics_arguments(parser):
+    """
+    Adds the metrics and profiling command line arguments to a script's parser.
+    Input(s):
+    parser is an argparse.ArgumentParser.
+    Output(s):
+    None.
+    """
+
+    parser.add_argument('--metrics_json', '--metrics-json', dest='metrics_json', required=False, type=str, default='', help='Save the wall time, CPU time, peak memory and row counts of each phase of the step (read, merge, groupby, pivot, write) in this json file [""].')
+    parser.add_argument('--profile', required=False, type=str, default='', help='Save a cProfile dump of the step in this file, to be read with pstats or snakeviz [""].')
+
+
+def peak_rss():
+    """
+    Gets the peak resident memory of the process so far.
+    Input(s):
+    No other inputs needed.
+    Output(s):
+    The peak resident memory in MB.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and in kB elsewhere
+    if sys.platform == 'darwin':
+        return peak / 1024**2
+
+    return peak / 1024
+
+
+def count_rows(table):
+    """
+    Counts the rows of a table.
+    Input(s):
+    table is a pandas dataframe, another object with a length, or None.
+    Output(s):
+    An integer, or None if the table has no length.
+    """
+
+    if table is None or not hasattr(table, '__len__'):
+        return None
+
+    return len(table)
+
+
+def to_rows(rows):
+    """
+    Converts a number of rows or a table to a number of rows.
+    Input(s):
+    rows is an integer, a table or None.
+    Output(s):
+    An integer, or None.
+    """
+
+    if isinstance(rows, numbers.Integral):
+        return int(rows)
+
+    return count_rows(rows)
+
+
+class StageMetrics():
+    """
+    This class records the metrics of each phase of a step. The peak memory of a phase is the peak
+    resident memory of the process at the end of the phase, so it includes the phases before it.
+    Input(s):
+    stage is a string naming the step.
+    metrics_json is a string containing the path to the json file the metrics are saved in. Nothing is saved if empty.
+    profile is a string containing the path to the cProfile dump. The step is not profiled if empty.
+    cpu_clock is the function giving the CPU time, e.g. time.thread_time for steps run in a thread.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, stage, metrics_json='', profile='', cpu_clock=time.process_time):
+
+        self.stage = stage
+        self.metrics_json = metrics_json
+        self.profile = profile
+        self.cpu_clock = cpu_clock
+        self.phases = []
+        self.profiler = None
+        self.started = None
+        self.finished = False
+        self.error = None
+
+    @classmethod
+    def from_args(cls, stage, args):
+        """
+        Creates and starts the metrics of a script from the arguments added by add_metrics_arguments.
+        The metrics are saved when the script exits if finish() is not called, e.g. after quit(), with
+        the error status if the script died with an uncaught exception.
+        Input(s):
+        stage is a string naming the step.
+        args is the argparse.Namespace of the script.
+        Output(s):
+        A StageMetrics.
+        """
+
+        stage_metrics = cls(stage, getattr(args, 'metrics_json', ''), getattr(args, 'profile', ''))
+        stage_metrics.start()
+        atexit.register(stage_metrics.finish, 'exited')
+        #Uncaught exceptions reach the excepthook before the atexit handlers run
+        previous_hook = sys.excepthook
+        def excepthook(exc_type, exc_value, exc_traceback):
+            stage_metrics.error = '{}: {}'.format(exc_type.__name__, exc_value)
+            stage_metrics.finish('error')
+            previous_hook(exc_type, exc_value, exc_traceback)
+        sys.excepthook = excepthook
+
+        return stage_metrics
+
+    def start(self):
+        """
+        Starts the clocks and the profiler.
+        Input(s):
+        No other inputs needed.
+        Output(s):
+        None.
+        """
+
+        self.started = [datetime.datetime.now().isoformat(timespec='seconds'), time.perf_counter(), self.cpu_clock()]
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextlib.contextmanager
+    def phase(self, name, rows_in=None):
+        """
+        Records the metrics of the code run within the with block.
+        Input(s):
+        name is a string naming the phase, preferably one of PHASES.
+        rows_in is the number of input rows, or a table they are counted from.
+        Output(s):
+        A dictionary for the phase, whose rows_out can be set within the with block to a number or a table.
+        """
+
+        #The input rows are counted before the phase in case it modifies its input
+        record = {'phase': name, 'rows_in': to_rows(rows_in), 'rows_out': None}
+        wall = time.perf_counter()
+        cpu = self.cpu_clock()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall
+            record['cpu_s'] = self.cpu_clock() - cpu
+            record['peak_rss_mb'] = peak_rss()
+            record['rows_out'] = to_rows(record['rows_out'])
+            self.phases.append(record)
+
+    def summary(self, status='ok'):
+        """
+        Summarizes the metrics of the step.
+        Input(s):
+        status is a string describing how the step ended.
+        Output(s):
+        A dictionary with the totals of the step and a list of its phases.
+        """
+
+        if self.started is None:
+            self.start()
+
+        summary = {'stage': self.stage,
+                   'status': status,
+                   'command': ' '.join(sys.argv),
+                   'started': self.started[0],
+                   'wall_s': time.perf_counter() - self.started[1],
+                   'cpu_s': self.cpu_clock() - self.started[2],
+                   'peak_rss_mb': peak_rss(),
+                   'phases': self.phases}
+        if self.error is not None:
+            summary['error'] = self.error
+
+        return summary
+
+    def finish(self, status='ok'):
+        """
+        Stops the profiler and saves the profile and the metrics. Only the first call has an effect.
+        Input(s):
+        status is a string describing how the step ended.
+        Output(s):
+        A dictionary with the metrics of the step.
+        """
+
+        if self.finished:
+            return None
+        self.finished = True
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile)
+        summary = self.summary(status)
+        if self.metrics_json:
+            write_metrics(self.metrics_json, summary)
+
+        return summary
+
+
+def write_metrics(path, metrics):
+    """
+    Writes metrics to a json file, creating its directory if needed.
+    Input(s):
+    path is a string containing the path to the json file.
+    metrics is a dictionary, or a list of dictionaries.
+    Output(s):
+    None.
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as handle:
+        json.dump(metrics, handle, indent=2)
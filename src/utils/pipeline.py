@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     pipeline.py
+# Purpose:  run MetaGaia steps as a dependency graph, passing the tables between
+#           them in memory and running independent steps at the same time.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import concurrent.futures
+import os
+import time
+
+from utils import metrics
+
+
+class Stage():
+    """
+    This class describes one step of a pipeline.
+    Input(s):
+    name is a string naming the step.
+    function is called with a dictionary of the input tables of the step and returns a dictionary of its output tables.
+    inputs is a list of the names of the tables the step needs.
+    outputs is a list of the names of the tables the step returns.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, name, function, inputs=None, outputs=None):
+
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs or [])
+        self.outputs = list(outputs or [])
+
+
+class Pipeline():
+    """
+    This class runs steps once all the tables they need are available. Steps that do not depend on
+    each other run at the same time in a pool of threads, and each table is dropped from memory once
+    no remaining step needs it.
+    Input(s):
+    stages is a list of Stage.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, stages=None):
+
+        self.stages = []
+        #Metrics of each step run, in the order they finished
+        self.metrics = []
+        self.profile_dir = ''
+        for stage in stages or []:
+            self.add(stage)
+
+    def add(self, stage):
+        """
+        Adds a step to the pipeline.
+        Input(s):
+        stage is a Stage. Its outputs must not be returned by another step.
+        Output(s):
+        None.
+        """
+
+        for other in self.stages:
+            if other.name == stage.name:
+                raise ValueError('The pipeline already has a step named {}!'.format(stage.name))
+            shared = set(other.outputs) & set(stage.outputs)
+            if shared:
+                raise ValueError('{} and {} both return {}!'.format(other.name, stage.name, ', '.join(sorted(shared))))
+        self.stages.append(stage)
+
+    def check(self, tables):
+        """
+        Checks that every table needed by a step is given or returned by another step, and that the steps have no cycle.
+        Input(s):
+        tables is a list of the names of the tables given to run().
+        Output(s):
+        A list of the steps in an order they can run in.
+        """
+
+        available = set(tables)
+        for stage in self.stages:
+            available.update(stage.outputs)
+        for stage in self.stages:
+            missing = [t for t in stage.inputs if t not in available]
+            if missing:
+                raise ValueError('{} needs {}, which no step returns and was not given!'.format(stage.name, ', '.join(missing)))
+
+        order = []
+        done = set(tables)
+        pending = list(self.stages)
+        while pending:
+            ready = [s for s in pending if all([t in done for t in s.inputs])]
+            if not ready:
+                raise ValueError('The steps {} depend on each other!'.format(', '.join([s.name for s in pending])))
+            for stage in ready:
+                pending.remove(stage)
+                done.update(stage.outputs)
+                order.append(stage)
+
+        return order
+
+    def run(self, tables=None, threads=4, keep=None, on_table=None, profile_dir=''):
+        """
+        Runs every step of the pipeline.
+        Input(s):
+        tables is a dictionary of the tables given to the pipeline, e.g. read from files.
+        threads is the maximum number of steps running at the same time.
+        keep is a list of the names of the tables returned at the end. Other tables are dropped once they are no longer needed.
+        on_table is called with the name and the dataframe of each table as soon as a step returns it, e.g. to save it.
+        profile_dir is a string containing the directory a cProfile dump of each step is saved in. Steps are not profiled if empty,
+        and run one at a time otherwise so each dump only holds its own step.
+        Output(s):
+        A dictionary of the tables named in keep.
+        """
+
+        available = dict(tables or {})
+        keep = set(keep or [])
+        self.metrics = []
+        self.profile_dir = profile_dir
+        if profile_dir:
+            threads = 1
+            if not os.path.exists(profile_dir):
+                os.makedirs(profile_dir)
+        self.check(available.keys())
+        pending = list(self.stages)
+        running = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+            while pending or running:
+                #Start every step whose inputs are available
+                for stage in [s for s in pending if all([t in available for t in s.inputs])]:
+                    pending.remove(stage)
+                    print('Starting ' + stage.name + '.')
+                    inputs = dict([(t, available[t]) for t in stage.inputs])
+                    running[pool.submit(self.run_stage, stage, inputs)] = stage
+
+                done, _ = concurrent.futures.wait(list(running.keys()), return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        outputs, seconds = future.result()
+                    except Exception:
+                        print('ERROR: ' + stage.name + ' failed! Waiting for the running steps to finish.')
+                        pending = []
+                        for other in running:
+                            other.cancel()
+                        raise
+                    print('Finished ' + stage.name + ' in {:.1f} s.'.format(seconds))
+                    summary = [m for m in self.metrics if m['stage'] == stage.name][-1]
+                    for name in stage.outputs:
+                        available[name] = outputs[name]
+                        if on_table is not None:
+                            start = time.perf_counter()
+                            on_table(name, outputs[name])
+                            summary['phases'].append({'phase': 'write', 'table': name, 'rows_in': metrics.count_rows(outputs[name]),
+                                                               'wall_s': time.perf_counter() - start, 'peak_rss_mb': metrics.peak_rss()})
+
+                    #Drop the tables no remaining step needs
+                    needed = set(keep)
+                    for other in pending + list(running.values()):
+                        needed.update(other.inputs)
+                    for name in list(available.keys()):
+                        if name not in needed:
+                            del available[name]
+
+        return dict([(t, available[t]) for t in keep if t in available])
+
+    def run_stage(self, stage, inputs):
+        """
+        Runs one step, records its metrics and checks that it returns all its tables. The CPU time
+        is the time of the step's thread, while the peak memory is the peak of the whole process.
+        Input(s):
+        stage is a Stage.
+        inputs is a dictionary of the input tables of the step.
+        Output(s):
+        outputs is a dictionary of the output tables of the step.
+        seconds is the time the step took to run.
+        """
+
+        profile = os.path.join(self.profile_dir, stage.name + '.pstats') if self.profile_dir else ''
+        stage_metrics = metrics.StageMetrics(stage.name, profile=profile, cpu_clock=time.thread_time)
+        stage_metrics.start()
+        try:
+            with stage_metrics.phase('run', sum([metrics.count_rows(t) or 0 for t in inputs.values()])) as phase:
+                outputs = stage.function(inputs) or {}
+                phase['rows_out'] = sum([metrics.count_rows(t) or 0 for t in outputs.values()])
+        except Exception:
+            self.metrics.append(stage_metrics.finish('failed'))
+            raise
+        missing = [t for t in stage.outputs if t not in outputs]
+        if missing:
+            raise ValueError('{} did not return {}!'.format(stage.name, ', '.join(missing)))
+        summary = stage_metrics.finish()
+        self.metrics.append(summary)
+
+        return [outputs, summary['wall_s']]
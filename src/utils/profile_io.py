@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     profile_io.py
+# Purpose:  hold the metabolic profile (counts of each pathway per bin) as a sparse matrix, and
+#           read and write it as the dense table, a long table of the nonzero counts or a binary file.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import numpy as np
+import os
+import pandas as pd
+from scipy import sparse
+
+from utils import table_io
+
+
+#Layouts the metabolic profile can be saved in with --profile_format
+PROFILE_FORMATS = ['dense', 'long', 'sparse']
+#Columns of the long layout, with one row per database, pathway and bin with a nonzero count
+LONG_COLUMNS = ['Database', 'Pathway', 'Bin', 'Count']
+SPARSE_EXTENSION = '.npz'
+
+
+def add_profile_format_argument(parser):
+    """
+    Adds the --profile_format command line argument to a script's parser.
+    Input(s):
+    parser is an argparse.ArgumentParser.
+    Output(s):
+    None.
+    """
+
+    parser.add_argument('--profile_format', required=False, type=str, choices=PROFILE_FORMATS, default='dense', help='Layout of the metabolic profile: dense (a row per pathway and a column per bin), long (a row per pathway and bin with a nonzero count) or sparse (a binary .npz file) [dense].')
+
+
+def profile_file_name(profile_format, out_format='tsv'):
+    """
+    Gets the file name of the metabolic profile.
+    Input(s):
+    profile_format is a string containing the layout of the profile: dense, long or sparse.
+    out_format is a string containing the format of the dense and long tables (tsv, parquet or feather).
+    Output(s):
+    A string containing the file name.
+    """
+
+    if profile_format == 'sparse':
+        return 'complete_metabolic_profile' + SPARSE_EXTENSION
+    elif profile_format == 'long':
+        return table_io.output_name('complete_metabolic_profile_long', out_format)
+
+    return table_io.output_name('complete_metabolic_profile', out_format)
+
+
+def profile_layout(path, default_format='tsv'):
+    """
+    Finds the layout of a metabolic profile file, reading at most its first row.
+    Input(s):
+    path is a string containing the path to the metabolic profile.
+    default_format is a string containing the table format used when the extension is not recognized.
+    Output(s):
+    A string containing the layout: dense, long or sparse.
+    """
+
+    if path.lower().endswith(SPARSE_EXTENSION):
+        return 'sparse'
+    for chunk in table_io.iter_table(path, 1, default_format=default_format, index_col=False):
+        if chunk.columns.tolist() == LONG_COLUMNS:
+            return 'long'
+        break
+
+    return 'dense'
+
+
+def read_profile(path, default_format='tsv'):
+    """
+    Reads a metabolic profile saved in the long or sparse layout.
+    Input(s):
+    path is a string containing the path to the metabolic profile.
+    default_format is a string containing the table format used when the extension is not recognized.
+    Output(s):
+    A SparseProfile.
+    """
+
+    layout = profile_layout(path, default_format)
+    if layout == 'sparse':
+        return SparseProfile.read(path)
+    elif layout == 'long':
+        return SparseProfile.from_long(table_io.read_table(path, default_format=default_format, index_col=False))
+
+    raise ValueError('{} is a dense metabolic profile, read it with table_io.read_table!'.format(path))
+
+
+class SparseProfile():
+    """
+    This class holds the counts of each pathway per bin of one or more databases as a sparse matrix.
+    Input(s):
+    counts is a scipy.sparse matrix with a row per database and pathway and a column per bin.
+    databases is a list of the database names.
+    row_databases is a numpy array of the index in databases of each row, in increasing order.
+    pathways is a numpy array of the pathway of each row, sorted within each database.
+    bins is a numpy array of the sorted bin names of the columns.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, counts, databases, row_databases, pathways, bins):
+
+        self.counts = sparse.csr_matrix(counts)
+        self.counts.eliminate_zeros()
+        self.databases = list(databases)
+        self.row_databases = np.asarray(row_databases, dtype=np.int64)
+        self.pathways = np.asarray(pathways, dtype=object)
+        self.bins = np.asarray(bins, dtype=object)
+
+    def __len__(self):
+
+        return self.counts.nnz
+
+    @classmethod
+    def from_long(cls, long_df):
+        """
+        Creates the profile from a table in the long layout.
+        Input(s):
+        long_df is a pandas dataframe with the LONG_COLUMNS columns.
+        Output(s):
+        A SparseProfile.
+        """
+
+        database_codes, databases = pd.factorize(long_df['Database'])
+        pathway_codes, pathways = pd.factorize(long_df['Pathway'], sort=True)
+        bin_codes, bins = pd.factorize(long_df['Bin'], sort=True)
+        #One row per database and pathway, ordered by database and then by pathway
+        row_keys, row_codes = np.unique(database_codes.astype(np.int64) * max(len(pathways), 1) + pathway_codes, return_inverse=True)
+        counts = sparse.coo_matrix((long_df['Count'].to_numpy(), (row_codes.reshape(-1), bin_codes)), shape=(len(row_keys), len(bins)))
+
+        return cls(counts, databases, row_keys // max(len(pathways), 1), np.asarray(pathways, dtype=object)[row_keys % max(len(pathways), 1)], bins)
+
+    @classmethod
+    def read(cls, path):
+        """
+        Reads the profile from a binary file written by write.
+        Input(s):
+        path is a string containing the path to the .npz file.
+        Output(s):
+        A SparseProfile.
+        """
+
+        with np.load(path) as arrays:
+            counts = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']))
+            return cls(counts, arrays['databases'].tolist(), arrays['row_databases'], arrays['pathways'].astype(object), arrays['bins'].astype(object))
+
+    def write(self, path):
+        """
+        Writes the profile to a binary file, creating its directory if needed.
+        Input(s):
+        path is a string containing the path to the .npz file.
+        Output(s):
+        None.
+        """
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        #Names are saved as fixed width strings so the file can be read without pickle
+        with open(path, 'wb') as handle:
+            np.savez_compressed(handle, data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr, shape=np.array(self.counts.shape),
+                                databases=np.array(self.databases, dtype=str), row_databases=self.row_databases,
+                                pathways=self.pathways.astype(str), bins=self.bins.astype(str))
+
+    def long(self):
+        """
+        Lists the nonzero counts.
+        Input(s):
+        No other inputs needed.
+        Output(s):
+        A pandas dataframe with the LONG_COLUMNS columns, ordered by database, pathway and bin.
+        """
+
+        counts = self.counts.tocoo()
+        order = np.lexsort((counts.col, counts.row))
+        rows = counts.row[order]
+        cols = counts.col[order]
+
+        return pd.DataFrame({'Database': np.asarray(self.databases, dtype=object)[self.row_databases[rows]],
+                             'Pathway': self.pathways[rows],
+                             'Bin': self.bins[cols],
+                             'Count': counts.data[order]}, columns=LONG_COLUMNS)
+
+    def database_bins(self):
+        """
+        Finds the bins with a count for each database.
+        Input(s):
+        No other inputs needed.
+        Output(s):
+        A list containing, for each database, a numpy array of the rows and a numpy array of the sorted columns with a count.
+        """
+
+        database_bins = []
+        for index in range(len(self.databases)):
+            rows = np.nonzero(self.row_databases == index)[0]
+            database_bins.append([rows, np.unique(self.counts[rows].indices)])
+
+        return database_bins
+
+    def dense(self, pathways=None):
+        """
+        Lays the counts out as the complete metabolic profile: a row per pathway of each database, a column
+        per bin and a Total column, with the same columns and column types whichever rows are kept.
+        Input(s):
+        pathways is a collection of the pathways to keep. All the pathways are kept if None.
+        Output(s):
+        A pandas dataframe indexed by the database columns.
+        """
+
+        dfs_list = []
+        column_floats = {}
+        column_missing = {}
+        database_bins = self.database_bins()
+        for index, d in enumerate(self.databases):
+            rows, cols = database_bins[index]
+            #Bins missing a value are NaN after a pivot, which makes the counts floats
+            is_float = self.counts[rows][:, cols].nnz < len(rows) * len(cols)
+            if pathways is not None:
+                rows = rows[pd.Series(self.pathways[rows]).isin(pathways).to_numpy()]
+            db_counts = self.counts[rows][:, cols].toarray().astype(float if is_float else np.int64)
+            count_df = pd.DataFrame(db_counts, index=pd.Index(self.pathways[rows], name=d), columns=pd.Index(self.bins[cols], name='Bin'))
+            #Create a total columns
+            count_df['Total'] = count_df.sum(axis=1)
+            count_df = count_df.reset_index()
+            dfs_list.append(count_df)
+            for col in self.bins[cols].tolist() + ['Total']:
+                column_floats[col] = column_floats.get(col, False) or is_float
+
+        #Combine multiple database dataframes into one
+        final_df = pd.concat(dfs_list)
+        final_df = final_df.set_index(self.databases)
+        final_df = final_df.fillna(0.0)
+        #Columns missing from a database are NaN before fillna, which makes them floats
+        for index, d in enumerate(self.databases):
+            for col in set(final_df.columns) - set(dfs_list[index].columns):
+                column_missing[col] = True
+        for col in final_df.columns:
+            final_df[col] = final_df[col].astype(float if column_floats.get(col, False) or column_missing.get(col, False) else np.int64)
+
+        return final_df
+
+    def host_counts(self, database):
+        """
+        Gets the counts of one database in the bins, leaving out the scaffolds without a bin, with the
+        bins in the order of the columns of the dense profile.
+        Input(s):
+        database is a string containing the database.
+        Output(s):
+        pathways is a numpy array of the pathway of each row.
+        bins is a list of the bin of each column.
+        counts is a scipy.sparse csr matrix of the counts of each pathway per bin.
+        """
+
+        #Bins of each database in turn, as they are added to the dense profile when it is concatenated
+        order = []
+        seen = set()
+        for rows, cols in self.database_bins():
+            for col in cols.tolist():
+                if col not in seen:
+                    seen.add(col)
+                    order.append(col)
+        order = np.array([col for col in order if self.bins[col] != 'NoBin'], dtype=np.int64)
+
+        if database in self.databases:
+            rows = np.nonzero(self.row_databases == self.databases.index(database))[0]
+        else:
+            rows = np.empty(0, dtype=np.int64)
+
+        return [self.pathways[rows], self.bins[order].tolist(), self.counts[rows][:, order]]
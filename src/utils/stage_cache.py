@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     stage_cache.py
+# Purpose:  cache the output files of each MetaGaia step, keyed on a fingerprint
+#           of its inputs and parameters, so unchanged steps are skipped on rerun.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+
+DEFAULT_CACHE_DIR = os.path.dirname(os.path.abspath(__file__)) + "/../../output/.metagaia_cache"
+#Maximum size of the cache in GB
+DEFAULT_CACHE_SIZE = 20
+MANIFEST = "manifest.json"
+#Shared modules imported by every step, hashed into each key along with the step's own script
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def add_cache_arguments(parser):
+    """
+    Adds the cache command line arguments to a script's parser.
+    Input(s):
+    parser is an argparse.ArgumentParser.
+    Output(s):
+    None.
+    """
+
+    parser.add_argument('--no_cache', '--no-cache', dest='no_cache', required=False, action='store_true', help='Recompute every step instead of reusing the outputs cached by a previous run with the same inputs and parameters.')
+    parser.add_argument('--cache_dir', required=False, type=str, default=DEFAULT_CACHE_DIR, help='Directory where the outputs of each step are cached [output/.metagaia_cache].')
+    parser.add_argument('--cache_size', required=False, type=float, default=DEFAULT_CACHE_SIZE, help='Maximum size of the cache in GB. The least recently used outputs are evicted first [{}].'.format(DEFAULT_CACHE_SIZE))
+    parser.add_argument('--hash_inputs', required=False, action='store_true', help='Add a hash of the content of each input file to the cache key instead of only its path, size and modification time.')
+
+
+def fingerprint(path, hash_content=False):
+    """
+    Fingerprints an input file, or every file directly within an input directory.
+    Input(s):
+    path is a string containing the path to a file or directory.
+    hash_content is a boolean value that determines if a SHA-256 hash of each file is added.
+    Output(s):
+    A list of dictionaries containing the path, size, modification time and optional hash of each file.
+    """
+
+    if not path:
+        return []
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        files = sorted([os.path.join(path, f) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))])
+    else:
+        files = [path]
+
+    prints = []
+    for f in files:
+        if not os.path.exists(f):
+            prints.append({'path': f})
+            continue
+        stat = os.stat(f)
+        file_print = {'path': f, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if hash_content:
+            file_print['sha256'] = hash_file(f)
+        prints.append(file_print)
+
+    return prints
+
+
+def hash_file(path, block_size=1048576):
+    """
+    Hashes the content of a file.
+    Input(s):
+    path is a string containing the path to the file.
+    block_size is the number of bytes read at a time.
+    Output(s):
+    A string containing the SHA-256 hex digest of the file.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def utils_code():
+    """
+    Hashes the shared modules in src/utils, so upgrading them invalidates the cache of every step.
+    Input(s):
+    No other inputs needed.
+    Output(s):
+    A list of the file name and SHA-256 hex digest of each module, sorted by name.
+    """
+
+    modules = sorted([f for f in os.listdir(UTILS_DIR) if f.endswith('.py')])
+
+    return [[f, hash_file(os.path.join(UTILS_DIR, f))] for f in modules]
+
+
+class StageCache():
+    """
+    This class stores and restores the output files of a step under a key built from its inputs and parameters.
+    Input(s):
+    cache_dir is a string containing the path to the cache directory.
+    cache_size is the maximum size of the cache in GB.
+    enabled is a boolean value that determines if outputs are reused and stored.
+    hash_content is a boolean value that determines if the input files are hashed.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, cache_size=DEFAULT_CACHE_SIZE, enabled=True, hash_content=False):
+
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = int(cache_size * 1024**3)
+        self.enabled = enabled
+        self.hash_content = hash_content
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Creates the cache from the arguments added by add_cache_arguments.
+        Input(s):
+        args is the argparse.Namespace of the script.
+        Output(s):
+        A StageCache.
+        """
+
+        return cls(cache_dir=args.cache_dir, cache_size=args.cache_size, enabled=not args.no_cache, hash_content=args.hash_inputs)
+
+    def key(self, stage, inputs, params=None, code=None):
+        """
+        Builds the cache key of a step.
+        Input(s):
+        stage is a string naming the step.
+        inputs is a list of paths to the input files or directories of the step.
+        params is a dictionary of the parameters that change the outputs of the step.
+        code is a list of paths to the scripts implementing the step, so editing them invalidates the cache.
+        The shared modules in src/utils are always added to it.
+        Output(s):
+        A string containing the key.
+        """
+
+        description = {
+            'stage': stage,
+            'inputs': [fingerprint(i, self.hash_content) for i in inputs],
+            'params': params or {},
+            'code': [hash_file(c) for c in (code or [])],
+            'utils': utils_code(),
+        }
+        encoded = json.dumps(description, sort_keys=True, default=str).encode('utf-8')
+
+        return stage + '-' + hashlib.sha256(encoded).hexdigest()
+
+    def fetch(self, key, outputs):
+        """
+        Restores the cached outputs of a step.
+        Input(s):
+        key is a string returned by key().
+        outputs is a list of paths the outputs are copied to, in the order they were stored.
+        Output(s):
+        A boolean value that is True if the outputs were restored.
+        """
+
+        if not self.enabled:
+            return False
+        entry = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(entry, MANIFEST), 'r') as handle:
+                manifest = json.load(handle)
+        except (IOError, ValueError):
+            return False
+        if len(manifest['files']) != len(outputs):
+            return False
+
+        for cached, output in zip(manifest['files'], outputs):
+            out_dir = os.path.dirname(os.path.abspath(output))
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+            shutil.copyfile(os.path.join(entry, cached), output)
+        #Mark the entry as recently used for eviction
+        os.utime(os.path.join(entry, MANIFEST))
+        print("Inputs of " + manifest['stage'] + " are unchanged, reusing cached outputs: " + ", ".join([os.path.basename(o) for o in outputs]))
+
+        return True
+
+    def store(self, key, outputs):
+        """
+        Copies the outputs of a step into the cache and evicts old entries if the cache is too big.
+        Input(s):
+        key is a string returned by key().
+        outputs is a list of paths to the output files of the step.
+        Output(s):
+        None.
+        """
+
+        if not self.enabled or not all([os.path.isfile(o) for o in outputs]):
+            return
+        size = sum([os.path.getsize(o) for o in outputs])
+        if size > self.max_bytes:
+            print("WARNING: outputs of " + key.rsplit('-', 1)[0] + " are larger than the cache and were not cached.")
+            return
+
+        entry = os.path.join(self.cache_dir, key)
+        tmp_entry = entry + '.tmp' + str(os.getpid())
+        if os.path.exists(tmp_entry):
+            shutil.rmtree(tmp_entry)
+        os.makedirs(tmp_entry)
+        files = []
+        for i, output in enumerate(outputs):
+            cached = str(i) + '_' + os.path.basename(output)
+            shutil.copyfile(output, os.path.join(tmp_entry, cached))
+            files.append(cached)
+        with open(os.path.join(tmp_entry, MANIFEST), 'w') as handle:
+            json.dump({'stage': key.rsplit('-', 1)[0], 'files': files, 'size': size, 'created': time.time()}, handle)
+        #Replace the entry in one step so an interrupted run never leaves a partial entry
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.rename(tmp_entry, entry)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in its maximum size.
+        Input(s):
+        No other inputs needed.
+        Output(s):
+        None.
+        """
+
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            manifest = os.path.join(self.cache_dir, key, MANIFEST)
+            if os.path.isfile(manifest):
+                with open(manifest, 'r') as handle:
+                    size = json.load(handle)['size']
+                entries.append([os.path.getmtime(manifest), size, key])
+
+        total = sum([e[1] for e in entries])
+        for last_used, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.cache_dir, key))
+            total -= size
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     table_io.py
+# Purpose:  read and write the tables passed between MetaGaia scripts as tsv or as
+#           typed columnar files (parquet/feather), detecting the format from the extension.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import os
+import pandas as pd
+
+
+#Output formats that can be selected with --out_format
+OUTPUT_FORMATS = ['tsv', 'parquet', 'feather']
+COLUMNAR_FORMATS = ['parquet', 'feather']
+FORMAT_EXTENSIONS = {'tsv': '.tsv', 'csv': '.csv', 'txt': '.txt', 'parquet': '.parquet', 'feather': '.feather'}
+EXTENSION_FORMATS = {'.tsv': 'tsv', '.tab': 'tsv', '.csv': 'csv', '.txt': 'txt',
+                     '.parquet': 'parquet', '.pq': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+TEXT_SEPARATORS = {'tsv': '\t', 'csv': ',', 'txt': r'\s+'}
+COMPRESSION_EXTENSIONS = ['.gz', '.bz2', '.xz', '.zip']
+
+
+def add_format_argument(parser):
+    """
+    Adds the --out_format command line argument to a script's parser.
+    Input(s):
+    parser is an argparse.ArgumentParser.
+    Output(s):
+    None.
+    """
+
+    parser.add_argument('--out_format', required=False, type=str, choices=OUTPUT_FORMATS, default='tsv', help='Format of the output tables. parquet and feather are typed columnar formats that are much faster to read back than tsv and require pyarrow [tsv].')
+
+
+def table_format(path):
+    """
+    Detects the format of a table from its file extension.
+    Input(s):
+    path is a string containing the path to the table, optionally compressed (e.g. .tsv.gz).
+    Output(s):
+    A string containing tsv, csv, txt, parquet or feather, or None if the extension is not recognized.
+    """
+
+    root, extension = os.path.splitext(path.lower())
+    if extension in COMPRESSION_EXTENSIONS:
+        extension = os.path.splitext(root)[1]
+
+    return EXTENSION_FORMATS.get(extension)
+
+
+def output_name(name, out_format):
+    """
+    Gives an output file name the extension of the selected format.
+    Input(s):
+    name is a string containing a file name or path, with or without extension.
+    out_format is a string containing one of OUTPUT_FORMATS.
+    Output(s):
+    A string containing the file name with the new extension.
+    """
+
+    root, extension = os.path.splitext(name)
+    if extension.lower() not in EXTENSION_FORMATS:
+        root = name
+
+    return root + FORMAT_EXTENSIONS[out_format]
+
+
+def require_pyarrow():
+    """
+    Checks that pyarrow, which is needed for the columnar formats, is installed.
+    Input(s):
+    No other inputs needed.
+    Output(s):
+    None.
+    """
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('parquet and feather tables require pyarrow. To install it, run `pip install pyarrow`.')
+
+
+def encode_strings(df):
+    """
+    Converts the string columns of a dataframe to categoricals so they are dictionary encoded in columnar files.
+    Input(s):
+    df is a pandas dataframe.
+    Output(s):
+    A pandas dataframe with categorical string columns. Other object columns (e.g. lists) are stored as text, as in tsv files.
+    """
+
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) or not (df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype)):
+            continue
+        kind = pd.api.types.infer_dtype(df[col], skipna=True)
+        if kind in ['string', 'empty']:
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = df[col].astype(str)
+    #Columnar formats only store string column names
+    df.columns = [str(c) for c in df.columns]
+
+    return df
+
+
+def table_columns(path, fmt):
+    """
+    Reads the column names of a parquet or feather table from its schema, without reading the data.
+    Input(s):
+    path is a string containing the path to the table.
+    fmt is a string containing parquet or feather.
+    Output(s):
+    A list of the column names.
+    """
+
+    require_pyarrow()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+
+    import pyarrow.ipc as ipc
+    return ipc.open_file(path).schema.names
+
+
+def read_table(path, columns=None, categories=False, default_format=None, **kwargs):
+    """
+    Reads a tsv, csv, txt, parquet or feather table.
+    Input(s):
+    path is a string containing the path to the table. The format is detected from the extension.
+    columns is a list of the columns to read, or a function returning True for the names of the columns to read. All columns are read if None.
+    categories is a boolean value that determines if dictionary encoded columns are kept as categoricals.
+    default_format is a string containing the format used when the extension is not recognized.
+    kwargs are passed on to pandas.read_csv for text tables.
+    Output(s):
+    A pandas dataframe.
+    """
+
+    fmt = table_format(path) or default_format
+    if fmt is None:
+        raise ValueError('{} is not a tsv, csv, txt, parquet or feather file!'.format(path))
+
+    if fmt in COLUMNAR_FORMATS:
+        require_pyarrow()
+        if callable(columns):
+            columns = [c for c in table_columns(path, fmt) if columns(c)]
+        if fmt == 'parquet':
+            df = pd.read_parquet(path, columns=columns)
+        else:
+            df = pd.read_feather(path, columns=columns)
+        if not categories:
+            for col in df.columns[df.dtypes == 'category']:
+                df[col] = df[col].astype(object)
+    else:
+        df = pd.read_csv(path, sep=TEXT_SEPARATORS[fmt], usecols=columns, **kwargs)
+
+    return df
+
+
+def iter_table(path, chunksize, columns=None, default_format=None, **kwargs):
+    """
+    Reads a tsv, csv, txt, parquet or feather table in chunks, so tables larger than memory can be processed.
+    Input(s):
+    path is a string containing the path to the table. The format is detected from the extension.
+    chunksize is the maximum number of rows of each chunk.
+    columns is a list of the columns to read. All columns are read if None.
+    default_format is a string containing the format used when the extension is not recognized.
+    kwargs are passed on to pandas.read_csv for text tables.
+    Output(s):
+    A generator of pandas dataframes.
+    """
+
+    fmt = table_format(path) or default_format
+    if fmt is None:
+        raise ValueError('{} is not a tsv, csv, txt, parquet or feather file!'.format(path))
+
+    if fmt in COLUMNAR_FORMATS:
+        require_pyarrow()
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            batches = pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns)
+        else:
+            import pyarrow.ipc as ipc
+            reader = ipc.open_file(path)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        for batch in batches:
+            if columns is not None and fmt == 'feather':
+                batch = batch.select(columns)
+            #Feather batches keep the size they were written with
+            for start in range(0, batch.num_rows, chunksize):
+                df = batch.slice(start, chunksize).to_pandas()
+                for col in df.columns[df.dtypes == 'category']:
+                    df[col] = df[col].astype(object)
+                yield df
+    else:
+        for df in pd.read_csv(path, sep=TEXT_SEPARATORS[fmt], usecols=columns, chunksize=chunksize, **kwargs):
+            yield df
+
+
+def write_table(df, path, index=False, default_format=None, **kwargs):
+    """
+    Writes a table in the format given by the extension of its path.
+    Input(s):
+    df is a pandas dataframe.
+    path is a string containing the path to the output table.
+    index is a boolean value that determines if the index is written. Columnar files store it as regular columns.
+    default_format is a string containing the format used when the extension is not recognized.
+    kwargs are passed on to pandas.DataFrame.to_csv for text tables.
+    Output(s):
+    None.
+    """
+
+    fmt = table_format(path) or default_format
+    if fmt is None:
+        raise ValueError('{} is not a tsv, csv, txt, parquet or feather file!'.format(path))
+
+    if fmt in COLUMNAR_FORMATS:
+        require_pyarrow()
+        df = df.reset_index() if index else df.reset_index(drop=True)
+        df = encode_strings(df)
+        if fmt == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_feather(path)
+    else:
+        df.to_csv(path, sep=TEXT_SEPARATORS[fmt] if fmt != 'txt' else '\t', index=index, **kwargs)
+
+
+class TableWriter():
+    """
+    This class appends dataframes with the same columns to one table, so large tables can be written in chunks.
+    Input(s):
+    path is a string containing the path to the output table. The format is detected from the extension.
+    default_format is a string containing the format used when the extension is not recognized.
+    Output(s):
+    None.
+    """
+
+    def __init__(self, path, default_format=None):
+
+        self.path = path
+        self.fmt = table_format(path) or default_format
+        if self.fmt is None:
+            raise ValueError('{} is not a tsv, csv, txt, parquet or feather file!'.format(path))
+        self.writer = None
+        self.schema = None
+        self.handle = None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+    def write(self, df, index=False):
+        """
+        Appends a dataframe to the table.
+        Input(s):
+        df is a pandas dataframe with the same columns as the previous ones.
+        index is a boolean value that determines if the index is written. Columnar files store it as a regular column.
+        Output(s):
+        None.
+        """
+
+        if self.fmt in COLUMNAR_FORMATS:
+            require_pyarrow()
+            import pyarrow as pa
+            df = df.reset_index() if index else df
+            #Cast every chunk to the schema of the first one
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            if self.writer is None:
+                self.schema = table.schema
+                if self.fmt == 'parquet':
+                    import pyarrow.parquet as pq
+                    self.writer = pq.ParquetWriter(self.path, self.schema)
+                else:
+                    import pyarrow.ipc as ipc
+                    self.writer = ipc.new_file(self.path, self.schema)
+            self.writer.write_table(table)
+        else:
+            if self.handle is None:
+                self.handle = open(self.path, 'w')
+                header = True
+            else:
+                header = False
+            df.to_csv(self.handle, sep=TEXT_SEPARATORS[self.fmt] if self.fmt != 'txt' else '\t', index=index, header=header, chunksize=1000000)
+
+    def close(self):
+        """
+        Closes the table.
+        Input(s):
+        No other inputs needed.
+        Output(s):
+        None.
+        """
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
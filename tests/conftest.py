@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     conftest.py
+# Purpose:  make the MetaGaia scripts importable by name and generate small synthetic
+#           inputs, shared by the tests, with benchmarks/generate_data.py.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTS_DIR, '..', 'src')
+for directory in ['abundance', 'metabolism', 'host-virus', '', os.path.join('..', 'benchmarks')]:
+    sys.path.insert(0, os.path.join(SRC_DIR, directory))
+
+import generate_data
+from utils import table_io
+
+#Number of items generated, small enough for the suite to run in seconds, with three sites so there are three GFF3 and VIBRANT files
+SCALE = {'bins': 30, 'samples': 4, 'contigs': 1500, 'genes': 6000, 'crisprs': 300, 'amgs': 300}
+GFF_FIELDS = ['ID', 'ko', 'pfam', 'ec_number', 'cog', 'locus_tag']
+
+
+@pytest.fixture(scope='session')
+def data_dir(tmp_path_factory):
+    """
+    Directory of synthetic inputs, generated once per test session.
+    """
+
+    out_dir = str(tmp_path_factory.mktemp('data'))
+    generate_data.generate(out_dir, **SCALE)
+
+    return out_dir
+
+
+@pytest.fixture(scope='session')
+def img_map_df(data_dir):
+    """
+    IMG contig to bin map of the synthetic inputs.
+    """
+
+    return table_io.read_table(os.path.join(data_dir, 'img_bin_map.tsv'))
+
+
+@pytest.fixture(scope='session')
+def mapping_df(data_dir):
+    """
+    Contig to bin mapping of the synthetic inputs.
+    """
+
+    return table_io.read_table(os.path.join(data_dir, 'mapping_file.tsv'))
+
+
+@pytest.fixture(scope='session')
+def annotations_df(data_dir, img_map_df):
+    """
+    Annotations of the synthetic GFF3 files merged with the bin map, as written by gff3_img5.py.
+    """
+
+    import gff3_img5
+
+    img_df = gff3_img5.gff_pd_multiread(os.path.join(data_dir, 'gff_paths.txt'), GFF_FIELDS)
+
+    return gff3_img5.annotate_scaffolds(img_df, img_map_df)
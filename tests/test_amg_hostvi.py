@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_amg_hostvi.py
+# Purpose:  check that the phage and host comparison is the same for every layout of
+#           the metabolic profile and for an annotation store.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import os
+
+import pandas as pd
+import pytest
+
+import amg_hostvi
+import metabolic_profile
+from utils import annotation_store
+from utils import profile_io
+from utils import table_io
+
+PROFILE_FORMATS = ['dense', 'long', 'sparse']
+
+
+def write_profile(databases_df, out_dir, databases=('KEGG', 'COG', 'PFAM', 'EC_NUMBER')):
+    """
+    Writes the metabolic profile of the scaffolds in every layout, as metabolic_profile.py does, and returns the paths by layout.
+    """
+
+    profile = metabolic_profile.database_counts_matrix(list(databases), databases_df)
+    paths = dict([(f, os.path.join(out_dir, profile_io.profile_file_name(f))) for f in PROFILE_FORMATS])
+    table_io.write_table(profile.dense(), paths['dense'], index=True)
+    table_io.write_table(profile.long(), paths['long'], index=False)
+    profile.write(paths['sparse'])
+
+    return paths
+
+
+def host_pathways(path, database, chunksize=1000):
+    """
+    Pathways present in each bin, read from a metabolic profile.
+    """
+
+    return amg_hostvi.profile_pairs(*amg_hostvi.read_host_profile(path, database, chunksize), database)
+
+
+@pytest.fixture(scope='module')
+def phage_df(data_dir):
+    """
+    VIBRANT AMGs of the synthetic inputs.
+    """
+
+    return amg_hostvi.read_vibrant(vibrant_path=os.path.join(data_dir, 'vibrant'), threads=1)
+
+
+@pytest.fixture(scope='module')
+def profile_paths(tmp_path_factory, annotations_df, mapping_df):
+    """
+    Metabolic profile of the synthetic annotations in every layout.
+    """
+
+    databases_df = metabolic_profile.scaffold_databases(annotations_df, mapping_df)
+
+    return write_profile(databases_df, str(tmp_path_factory.mktemp('profile')))
+
+
+@pytest.mark.parametrize('database', ['KEGG', 'PFAM'])
+def test_layouts_match(profile_paths, phage_df, database):
+    dense_df = host_pathways(profile_paths['dense'], database)
+    assert len(dense_df) > 0
+    for profile_format in ['long', 'sparse']:
+        pd.testing.assert_frame_equal(host_pathways(profile_paths[profile_format], database), dense_df)
+
+    #The in-memory pipeline hands the dense table to compare_metabolism
+    expected = amg_hostvi.compare_metabolism(table_io.read_table(profile_paths['dense']), phage_df, database)
+    for profile_format in PROFILE_FORMATS:
+        for result_df, expected_df in zip(amg_hostvi.join_metabolism(host_pathways(profile_paths[profile_format], database), phage_df, database), expected):
+            pd.testing.assert_frame_equal(result_df, expected_df)
+
+
+def test_dense_chunks_match(profile_paths):
+    pd.testing.assert_frame_equal(host_pathways(profile_paths['dense'], 'KEGG', chunksize=7), host_pathways(profile_paths['dense'], 'KEGG'))
+
+
+@pytest.mark.parametrize('database', ['KEGG', 'PFAM'])
+def test_store_matches_long_profile(tmp_path, annotations_df, profile_paths, database):
+    store_path = str(tmp_path / 'annotations.sqlite')
+    with annotation_store.AnnotationStore(store_path, overwrite=True) as store:
+        store.add(annotations_df)
+        store.create_indexes()
+
+    store_df = amg_hostvi.profile_pairs(*amg_hostvi.read_store_profile(store_path, database), database)
+    pd.testing.assert_frame_equal(store_df, host_pathways(profile_paths['long'], database))
+
+
+@pytest.mark.parametrize('databases', [('KEGG', 'PFAM'), ('COG', 'EC_NUMBER')])
+def test_layouts_match_without_nobin(tmp_path, annotations_df, mapping_df, databases):
+    #Every scaffold has a bin, so the dense profile has no NoBin column, and the profile may not have the database
+    databases_df = metabolic_profile.scaffold_databases(annotations_df, mapping_df)
+    paths = write_profile(databases_df[databases_df['Bin'] != 'NoBin'], str(tmp_path), databases)
+    assert 'NoBin' not in table_io.read_table(paths['dense']).columns
+
+    dense_df = host_pathways(paths['dense'], 'KEGG')
+    assert (len(dense_df) > 0) == ('KEGG' in databases)
+    for profile_format in ['long', 'sparse']:
+        pd.testing.assert_frame_equal(host_pathways(paths[profile_format], 'KEGG'), dense_df)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_bin_abundance.py
+# Purpose:  check the abundance engine against the original merge and groupby
+#           computation, and the chunked mode against the in-memory one.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import os
+
+import pandas as pd
+import pytest
+
+import bin_abundance
+from utils import table_io
+
+READABLENUM = 100000000.0
+
+
+@pytest.fixture(scope='module')
+def abundance_inputs(data_dir):
+    """
+    Reads, mapping, depth and binsize tables of the synthetic inputs.
+    """
+
+    return [table_io.read_table(os.path.join(data_dir, f + '.tsv'), index_col=False) for f in ['reads_file', 'mapping_file', 'depth_file', 'binsize_file']]
+
+
+def merge_abundance(df_reads, df_mapping, df_depth, df_size, readablenum):
+    """
+    The abundance computed as bin_abundance.py originally did, with string merges and a groupby transform.
+    """
+
+    mapping_size = pd.merge(df_mapping, df_size[['Bin', 'Size']], on='Bin')
+    merged_df = pd.merge(mapping_size, df_depth[['Original_Contig_Name', 'contigLen', 'Sample', 'Depth']], on='Original_Contig_Name')
+    merged_df = pd.merge(merged_df, df_reads[['Sample', 'Reads']], on='Sample')
+    merged_df['Coverage'] = merged_df['contigLen'].astype(float) * merged_df['Depth'].astype(float)
+    merged_df['Sum_cov'] = merged_df.groupby(by=['Bin', 'Sample'])['Coverage'].transform('sum')
+    merged_df['NormalizedCoverage'] = merged_df['Sum_cov'].astype(float) / merged_df['Size'].astype(float)
+    merged_df['RelativeAbundance'] = merged_df['NormalizedCoverage'].astype(float) / merged_df['Reads'].astype(float)
+    merged_df['RelativeAbundanceReadable'] = merged_df['RelativeAbundance'].astype(float) * readablenum
+
+    return merged_df[['Bin', 'Sample', 'Sampling_Site', 'NormalizedCoverage', 'RelativeAbundance', 'RelativeAbundanceReadable']].drop_duplicates()
+
+
+def test_abundance_matches_merge(abundance_inputs):
+    expected_df = merge_abundance(*abundance_inputs, READABLENUM).reset_index(drop=True)
+    abundance_df = bin_abundance.calculate_abundance(*abundance_inputs, READABLENUM).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(abundance_df, expected_df, check_exact=True)
+
+
+@pytest.mark.parametrize('chunksize', [10000000, 997])
+def test_chunked_matches_in_memory(data_dir, abundance_inputs, chunksize):
+    df_reads, df_mapping, df_depth, df_size = abundance_inputs
+    abundance_df = bin_abundance.calculate_abundance(df_reads, df_mapping, df_depth, df_size, READABLENUM)
+    chunked_df = bin_abundance.calculate_abundance_chunked(df_reads, df_mapping, os.path.join(data_dir, 'depth_file.tsv'), df_size, READABLENUM, chunksize)
+
+    #A single chunk gives the same sums, more chunks may differ in the last digits
+    if chunksize >= len(df_depth):
+        pd.testing.assert_frame_equal(chunked_df, abundance_df, check_exact=True)
+    else:
+        pd.testing.assert_frame_equal(chunked_df, abundance_df, check_exact=False, rtol=1e-12)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_bin_abundance_viz.py
+# Purpose:  check that the cached clustermap linkages are the ward linkages seaborn computes.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.cluster import hierarchy
+
+import bin_abundance_viz
+
+
+def test_linkages_match_seaborn(tmp_path):
+    abundance_df = pd.DataFrame(np.random.default_rng(0).lognormal(0, 1.5, (200, 12)))
+    row_linkage, col_linkage = bin_abundance_viz.cached_linkages(abundance_df, str(tmp_path))
+
+    #seaborn clusters the float64 values with scipy
+    np.testing.assert_allclose(row_linkage, hierarchy.linkage(abundance_df.to_numpy(), method='ward', metric='euclidean'))
+    np.testing.assert_allclose(col_linkage, hierarchy.linkage(abundance_df.to_numpy().T, method='ward', metric='euclidean'))
+    assert len(os.listdir(str(tmp_path))) == 1
+
+    cached = bin_abundance_viz.cached_linkages(abundance_df, str(tmp_path))
+    np.testing.assert_array_equal(cached[0], row_linkage)
+    np.testing.assert_array_equal(cached[1], col_linkage)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_files_prep.py
+# Purpose:  check that combining per-sample depth files one at a time gives the
+#           rows of the original outer join of all the files.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import functools
+import os
+
+import pandas as pd
+
+import files_prep
+from utils import table_io
+
+
+def write_sample_depths(depth_df, depth_dir):
+    """
+    Writes one jgi_summarize_bam_contig_depths file per sample, each with a different subset of the contigs.
+    """
+
+    depth_files = []
+    for i, (sample, sample_df) in enumerate(depth_df.groupby('Sample', sort=True)):
+        #Leave out some contigs of each sample so the outer join has missing depths
+        sample_df = sample_df[(sample_df.reset_index().index + i) % 5 != 0]
+        sample_df = pd.DataFrame({'contigName': sample_df['Original_Contig_Name'].to_numpy(),
+                                  'contigLen': sample_df['contigLen'].to_numpy(),
+                                  'totalAvgDepth': sample_df['Depth'].to_numpy(),
+                                  sample + '_S{}.bam'.format(i + 1): sample_df['Depth'].to_numpy(),
+                                  sample + '_S{}.bam-var'.format(i + 1): 0.0})
+        depth_files.append(os.path.join(depth_dir, sample + '_depth.txt'))
+        sample_df.to_csv(depth_files[-1], sep='\t', index=False)
+
+    return depth_files
+
+
+def test_combined_depth_matches_outer_join(tmp_path, data_dir):
+    depth_files = write_sample_depths(table_io.read_table(os.path.join(data_dir, 'depth_file.tsv')), str(tmp_path))
+    combined_path = str(tmp_path / 'depth_file.tsv')
+    files_prep.combine_depth_files(files_prep.list_depth_files(str(tmp_path)), combined_path)
+
+    #The single sample files merged one after another, as create_depth_file originally did
+    sample_dfs = [files_prep.read_depth_table(f) for f in sorted(depth_files)]
+    merged_df = functools.reduce(lambda left, right: left.merge(right, on=['contigName', 'contigLen'], how='outer'), sample_dfs)
+    expected_path = str(tmp_path / 'expected_depth_file.tsv')
+    files_prep.format_depth_df(merged_df).to_csv(expected_path, sep='\t', index=False)
+
+    with open(combined_path, 'r') as combined, open(expected_path, 'r') as expected:
+        assert combined.read() == expected.read()
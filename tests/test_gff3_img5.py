@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_gff3_img5.py
+# Purpose:  check that parsing GFF3 files in worker processes and streaming them to
+#           the output gives the same table as parsing them one by one.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import os
+
+import pandas as pd
+import pytest
+
+import gff3_img5
+from conftest import GFF_FIELDS
+from utils import table_io
+
+
+def write_tsv(df, path):
+    """
+    Writes a table with its index and returns its path.
+    """
+
+    table_io.write_table(df, str(path), index=True, encoding='utf-8')
+
+    return str(path)
+
+
+def test_parallel_matches_serial(monkeypatch, data_dir):
+    #The worker processes are capped at the number of cores
+    monkeypatch.setattr(gff3_img5.os, 'cpu_count', lambda: 2)
+    path_file = os.path.join(data_dir, 'gff_paths.txt')
+    assert len(gff3_img5.gff_paths(path_file)) > 1
+    serial_df = gff3_img5.gff_pd_multiread(path_file, GFF_FIELDS, threads=1)
+    parallel_df = gff3_img5.gff_pd_multiread(path_file, GFF_FIELDS, threads=2)
+
+    pd.testing.assert_frame_equal(parallel_df, serial_df)
+
+
+def test_stream_matches_concat(tmp_path, data_dir, img_map_df, annotations_df):
+    paths = gff3_img5.gff_paths(os.path.join(data_dir, 'gff_paths.txt'))
+    output = str(tmp_path / 'img_annotations.tsv')
+    written, rows = gff3_img5.stream_gff_parts(paths, GFF_FIELDS, output, img_map=img_map_df, threads=2)
+
+    #The files concatenated, merged with the map and written at once, as gff3_img5.py originally did
+    expected = write_tsv(annotations_df, tmp_path / 'expected.tsv')
+    assert written == [output]
+    assert rows == len(annotations_df)
+    with open(output, 'r') as streamed, open(expected, 'r') as concatenated:
+        assert streamed.read() == concatenated.read()
+
+
+def test_parts_match_files(tmp_path, data_dir, img_map_df):
+    paths = gff3_img5.gff_paths(os.path.join(data_dir, 'gff_paths.txt'))
+    written, rows = gff3_img5.stream_gff_parts(paths, GFF_FIELDS, str(tmp_path / 'img_annotations.tsv'), img_map=img_map_df, parts=True, threads=2)
+
+    assert written == [gff3_img5.part_name(str(tmp_path / 'img_annotations.tsv'), path) for path in paths]
+    for path, part in zip(paths, written):
+        expected = write_tsv(gff3_img5.annotate_scaffolds(gff3_img5.gff3_to_df(path, GFF_FIELDS), img_map_df), tmp_path / 'expected.tsv')
+        with open(part, 'r') as streamed, open(expected, 'r') as parsed:
+            assert streamed.read() == parsed.read()
+
+
+def test_attributes(tmp_path):
+    path = str(tmp_path / 'genes.gff')
+    with open(path, 'w') as handle:
+        handle.write('##gff-version 3\n')
+        handle.write('Ga0_1\tIMG\tCDS\t1\t90\t.\t+\t0\tID=g1;ko=KO:K00001;ko=KO:K00002;locus_tag=Ga0_1_1\n')
+        handle.write('Ga0_1\tIMG\tCDS\t100\t300\t.\t-\t0\tID=g2;partial;cog=COG0001;pfam=\n')
+    img_df = gff3_img5.gff3_to_df(path, ['ID', 'ko', 'cog', 'pfam'])
+
+    #The last value of a repeated attribute is kept, and pairs without a value are skipped
+    assert img_df.columns.tolist() == ['IMG_Contig_Name', 'Gene_Type', 'ID', 'ko', 'cog', 'pfam']
+    assert img_df['ko'].tolist()[0] == 'KO:K00002'
+    assert pd.isna(img_df['ko'].tolist()[1])
+    assert img_df['cog'].tolist()[1] == 'COG0001'
+    assert img_df['pfam'].tolist()[1] == ''
+
+    coordinates_df = gff3_img5.gff3_to_df(path, ['ID'], coordinates=True)
+    assert coordinates_df.columns.tolist() == ['IMG_Contig_Name', 'Gene_Type', 'Gene_Start', 'Gene_Stop', 'Strand', 'ID']
+    assert coordinates_df['Gene_Stop'].tolist() == [90, 300]
+
+
+def test_threads_capped_at_cores(monkeypatch, data_dir):
+    def no_pool(*args, **kwargs):
+        raise AssertionError('a single core should not start worker processes')
+
+    monkeypatch.setattr(gff3_img5.os, 'cpu_count', lambda: 1)
+    monkeypatch.setattr(gff3_img5.multiprocessing, 'Pool', no_pool)
+    paths = gff3_img5.gff_paths(os.path.join(data_dir, 'gff_paths.txt'))
+    assert [path for path, df in gff3_img5.iter_gff_parts(paths, GFF_FIELDS, threads=8)] == paths
+
+
+def test_merge_error_raised(data_dir, img_map_df):
+    path = gff3_img5.gff_paths(os.path.join(data_dir, 'gff_paths.txt'))[0]
+    with pytest.raises(KeyError):
+        gff3_img5.annotate_scaffolds(gff3_img5.gff3_to_df(path, GFF_FIELDS), img_map_df.drop(columns=['IMG_Contig_Name']))
+
+
+def test_pandas_matches_pyarrow(monkeypatch, data_dir):
+    pytest.importorskip('pyarrow')
+    path = gff3_img5.gff_paths(os.path.join(data_dir, 'gff_paths.txt'))[0]
+    arrow_df = gff3_img5.gff3_to_df(path, GFF_FIELDS, coordinates=True)
+
+    #Without pyarrow, the file is read by pandas and the attributes split by a regular expression
+    monkeypatch.setattr(gff3_img5, 'pa', None)
+    pandas_df = gff3_img5.gff3_to_df(path, GFF_FIELDS, coordinates=True)
+    for column in arrow_df.columns:
+        assert arrow_df[column].astype(object).where(arrow_df[column].notna(), None).tolist() == pandas_df[column].astype(object).where(pandas_df[column].notna(), None).tolist()
+
+
+def test_malformed_records(tmp_path):
+    path = str(tmp_path / 'genes.gff')
+    with open(path, 'w') as handle:
+        handle.write('##gff-version 3\n')
+        handle.write('Ga0_1\tIMG\tCDS\t1\t90\t.\t+\t0\tID=g1\n')
+        handle.write('Ga0_1\tIMG\tCDS\t100\t300\n')
+
+    assert gff3_img5.gff3_to_df(path, ['ID']) is None
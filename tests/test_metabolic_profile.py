@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_metabolic_profile.py
+# Purpose:  check that the metabolic profile is the same whether the annotations are
+#           read from a table or an annotation store, and in every layout it is saved in.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import pandas as pd
+import pytest
+
+import metabolic_profile
+from utils import annotation_store
+from utils import profile_io
+from utils import table_io
+
+DATABASES = ['KEGG', 'COG', 'PFAM', 'EC_NUMBER']
+
+
+@pytest.fixture(scope='module')
+def store_path(tmp_path_factory, annotations_df):
+    """
+    Annotation store filled with the synthetic GFF3 annotations.
+    """
+
+    path = str(tmp_path_factory.mktemp('store') / 'annotations.sqlite')
+    with annotation_store.AnnotationStore(path, overwrite=True) as store:
+        store.add(annotations_df)
+        store.create_indexes()
+
+    return path
+
+
+@pytest.fixture(scope='module')
+def databases_df(annotations_df, mapping_df):
+    """
+    Database values of each scaffold of the synthetic annotations.
+    """
+
+    return metabolic_profile.scaffold_databases(annotations_df, mapping_df)
+
+
+def test_store_matches_table(store_path, annotations_df, mapping_df, databases_df):
+    store_df = metabolic_profile.scaffold_databases(metabolic_profile.read_img_store(store_path, mapping_df), mapping_df)
+
+    pd.testing.assert_frame_equal(store_df, databases_df)
+    pd.testing.assert_frame_equal(metabolic_profile.count_databases(DATABASES, store_df), metabolic_profile.count_databases(DATABASES, databases_df))
+
+
+def test_store_bins_match_table_bins(store_path, mapping_df, databases_df):
+    bins = sorted(mapping_df['Bin'].unique())[:3]
+    store_df = metabolic_profile.scaffold_databases(metabolic_profile.read_img_store(store_path, mapping_df, bins), mapping_df)
+
+    expected_df = databases_df[databases_df['Bin'].isin(bins)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(store_df, expected_df)
+
+
+def test_store_bin_counts_match_long_profile(store_path, databases_df):
+    profile = metabolic_profile.database_counts_matrix(DATABASES, databases_df)
+    long_df = profile.long()
+    with annotation_store.AnnotationStore(store_path) as store:
+        for database in DATABASES:
+            counts_df = store.bin_counts(database)
+            #The store leaves out the scaffolds without a bin
+            expected_df = long_df[(long_df['Database'] == database) & (long_df['Bin'] != 'NoBin')].reset_index(drop=True)
+            pd.testing.assert_frame_equal(counts_df, expected_df, check_dtype=False)
+
+
+@pytest.mark.parametrize('profile_format', ['long', 'sparse'])
+def test_layouts_match_dense(tmp_path, databases_df, profile_format):
+    profile = metabolic_profile.database_counts_matrix(DATABASES, databases_df)
+    path = str(tmp_path / profile_io.profile_file_name(profile_format))
+    if profile_format == 'sparse':
+        profile.write(path)
+    else:
+        table_io.write_table(profile.long(), path, index=False)
+
+    assert profile_io.profile_layout(path) == profile_format
+    pd.testing.assert_frame_equal(profile_io.read_profile(path).dense(), metabolic_profile.count_databases(DATABASES, databases_df))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_metrics.py
+# Purpose:  check the status saved in the metrics of a script that exits early or crashes.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SRC_DIR
+
+SCRIPT = '''
+import argparse, sys
+sys.path.insert(0, {src!r})
+from utils import metrics
+args = argparse.Namespace(metrics_json={metrics_json!r}, profile='')
+stage_metrics = metrics.StageMetrics.from_args('test', args)
+{end}
+'''
+
+
+@pytest.mark.parametrize('end, status', [('quit()', 'exited'), ('raise ValueError("no bins")', 'error'), ('stage_metrics.finish()', 'ok')])
+def test_exit_status(tmp_path, end, status):
+    metrics_json = str(tmp_path / 'metrics.json')
+    subprocess.run([sys.executable, '-c', SCRIPT.format(src=SRC_DIR, metrics_json=metrics_json, end=end)], capture_output=True)
+
+    with open(metrics_json, 'r') as handle:
+        summary = json.load(handle)
+    assert summary['status'] == status
+    if status == 'error':
+        assert summary['error'] == 'ValueError: no bins'
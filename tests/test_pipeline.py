@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_pipeline.py
+# Purpose:  run the metagaia.py pipeline end to end on synthetic inputs.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import json
+import os
+
+import pytest
+
+import metagaia
+from utils import table_io
+
+
+def run_config(tmp_path, config):
+    """
+    Runs the pipeline from a config written to tmp_path and returns the saved tables by file name.
+    """
+
+    config = dict({'write': 'all'}, **config)
+    config.update(output_dir=str(tmp_path / 'output'), threads=1)
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps(config))
+    saved = metagaia.run_pipeline(str(config_file))
+
+    return dict([(os.path.basename(path), path) for path in saved])
+
+
+def test_gff_profile_amg_chain_without_nobin(tmp_path, data_dir):
+    #With the GFF table merged with the bin map every annotated scaffold has a bin, so the profile has no NoBin column
+    saved = run_config(tmp_path, {
+        'tables': {'img_map': os.path.join(data_dir, 'img_bin_map.tsv'), 'mapping': os.path.join(data_dir, 'mapping_file.tsv')},
+        'gff3_img5': {'path_file': os.path.join(data_dir, 'gff_paths.txt')},
+        'metabolic_profile': {'database': 'KEGG,PFAM'},
+        'amg_hostvi': {'vibrant_path': os.path.join(data_dir, 'vibrant'), 'database': 'KEGG'}})
+
+    profile_df = table_io.read_table(saved['complete_metabolic_profile.tsv'])
+    assert 'NoBin' not in profile_df.columns
+    phage_host_df = table_io.read_table(saved['phage_host_metabolism.tsv'])
+    assert set(phage_host_df['Presence']) <= {'host', 'phage', 'both'}
+    assert len(phage_host_df) > 0
+
+
+def test_write_single_table(tmp_path, data_dir):
+    config = {'tables': {'img_map': os.path.join(data_dir, 'img_bin_map.tsv')},
+        'gff3_img5': {'path_file': os.path.join(data_dir, 'gff_paths.txt')}}
+
+    saved = run_config(tmp_path, dict(config, write='img_annotations'))
+    assert list(saved) == ['img_annotations.tsv']
+    with pytest.raises(ValueError, match='write must be'):
+        run_config(tmp_path, dict(config, write=3))
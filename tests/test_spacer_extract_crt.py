@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# ------------------------------
+# Name:     test_spacer_extract_crt.py
+# Purpose:  check that streaming the CRT file writes the same spacers as reading it whole.
+# Created:     2026
+# Licence:     GNU GENERAL PUBLIC LICENSE, Version 3, 29 June 2007
+# ------------------------------
+
+import os
+
+import pytest
+
+import spacer_extract_crt
+
+
+def extract(data_dir, output_fasta, **kwargs):
+    """
+    Extracts the spacers of the synthetic CRT file and returns the FASTA text.
+    """
+
+    assert spacer_extract_crt.extract_spacers(os.path.join(data_dir, 'crt.txt'), str(output_fasta), **kwargs)
+    with open(str(output_fasta), 'r') as handle:
+        return handle.read()
+
+
+@pytest.mark.parametrize('quality_off', [False, True])
+@pytest.mark.parametrize('use_img_map', [False, True])
+@pytest.mark.parametrize('chunksize', [7, 1000, 1000000])
+def test_stream_matches_in_memory(tmp_path, data_dir, quality_off, use_img_map, chunksize):
+    img_map = os.path.join(data_dir, 'img_bin_map.tsv') if use_img_map else None
+    expected = extract(data_dir, tmp_path / 'spacers.fasta', quality_off=quality_off, img_map=img_map)
+    streamed = extract(data_dir, tmp_path / 'streamed.fasta', quality_off=quality_off, img_map=img_map, stream=True, chunksize=chunksize)
+
+    assert len(expected) > 0
+    assert streamed == expected
+
+
+def test_quality_filter_keeps_fewer_spacers(tmp_path, data_dir):
+    filtered = extract(data_dir, tmp_path / 'filtered.fasta')
+    unfiltered = extract(data_dir, tmp_path / 'unfiltered.fasta', quality_off=True)
+
+    assert filtered.count('>') < unfiltered.count('>')
+
+
+def test_renamed_with_bin_map(tmp_path, data_dir):
+    renamed = extract(data_dir, tmp_path / 'renamed.fasta', img_map=os.path.join(data_dir, 'img_bin_map.tsv'))
+
+    #Spacers of binned contigs are prefixed with their bin and original contig name
+    assert '_Bin' in renamed